@@ -1,3 +1,4 @@
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
@@ -41,6 +42,8 @@ def create_app(config_class=Config):
     csrf.init_app(app)
     
     from app.models import User, InvitationCode, Category, Website, SiteSettings, DeadlinkCheck
+    # 注册数据变更后自动失效缓存的会话事件
+    from app.utils import cache
     
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -62,8 +65,9 @@ def create_app(config_class=Config):
     @app.context_processor
     def inject_site_settings():
         try:
-            settings = SiteSettings.get_settings()
-            return {'settings': settings}
+            # 使用进程内缓存的设置快照，设置未修改时不查询数据库
+            from app.utils.site_settings import site_settings_cache
+            return {'settings': site_settings_cache.get()}
         except Exception as e:
             # 记录错误，但返回一个空的设置对象，避免模板渲染失败
             print(f"无法获取站点设置: {str(e)}")
@@ -109,6 +113,21 @@ def create_app(config_class=Config):
             admin.is_superadmin = True
             db.session.commit()
             print("已将现有管理员升级为超级管理员")
+        # 将旧版 visible_to 字符串中的授权同步到 website_visibility 关系表
+        try:
+            from app.models import backfill_website_visibility
+            migrated = backfill_website_visibility()
+            if migrated:
+                print(f"已迁移 {migrated} 条私有链接授权记录")
+        except Exception as e:
+            db.session.rollback()
+            print(f"迁移私有链接授权记录失败: {str(e)}")
+        # 创建全文搜索索引（已存在时跳过）
+        try:
+            from app.utils.search import ensure_search_index
+            ensure_search_index()
+        except Exception as e:
+            print(f"创建全文搜索索引失败: {str(e)}")
         # 你原本 before_first_request 里的其他初始化逻辑可以放在这里
     
     # 注册模板过滤器
@@ -123,6 +142,90 @@ def create_app(config_class=Config):
     def boolstr(value):
         return '是' if value else '否'
     
+    @app.template_filter('icon_src')
+    def icon_src(icon, website_id):
+        """尚未下载到本地的第三方图标改为通过本站地址请求，由后台任务下载到本地后跳转到本地文件"""
+        from flask import url_for
+        from app.utils.icon_store import is_remote_icon
+        if app.config.get('ICON_LOCALIZE', True) and is_remote_icon(icon):
+            return url_for('main.website_icon', website_id=website_id)
+        return icon
+    
+    # 注册命令行工具
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """从 website 表重建全文搜索索引"""
+        from app.utils.search import rebuild_search_index
+        count = rebuild_search_index()
+        print(f"全文搜索索引已重建，共 {count} 条链接")
+    
+    @app.cli.command('rollup-visit-stats')
+    def rollup_visit_stats_command():
+        """按访问统计表校正今日访问量（由定时任务每小时调用）"""
+        from app.utils.visits import rollup_visit_stats
+        count = rollup_visit_stats()
+        print(f"访问统计汇总完成，校正了 {count} 条链接的今日访问量")
+    
+    @app.cli.command('check-deadlinks')
+    @click.option('--full', is_flag=True, help='检测全部链接，而不只是到期的链接')
+    def check_deadlinks_command(full):
+        """立即执行一次死链检测（默认只检测到期的链接；定时检测由任务进程提交）"""
+        from app.utils.jobs import JOB_STATE_LABELS, JobWorker, enqueue_job, wait_for_job
+        job = enqueue_job('deadlink', {'incremental': not full}, start_worker=False)
+        if job is None:
+            print("已有死链检测任务正在排队或运行")
+            return
+        job_id = job.id
+        # 在当前进程中执行；被任务进程抢先领取时等待其执行完
+        JobWorker(app).execute(job_id)
+        job = wait_for_job(job_id)
+        print(f"死链检测{JOB_STATE_LABELS[job.state]}，"
+              f"共检测 {job.processed} 个链接，无效 {job.failed} 个")
+    
+    @app.cli.command('localize-icons')
+    def localize_icons_command():
+        """立即把第三方图标下载到本地（定时执行由任务进程提交）"""
+        from app.utils.jobs import JOB_STATE_LABELS, JobWorker, enqueue_job, wait_for_job
+        job = enqueue_job('icon_localize', start_worker=False)
+        if job is None:
+            print("已有图标本地化任务正在排队或运行")
+            return
+        job_id = job.id
+        JobWorker(app).execute(job_id)
+        job = wait_for_job(job_id)
+        print(f"图标本地化{JOB_STATE_LABELS[job.state]}，"
+              f"共处理 {job.processed} 个网站，下载成功 {job.success} 个，失败 {job.failed} 个")
+    
+    @app.cli.command('backup-db')
+    @click.option('--prefix', default='booknav', help='备份文件名前缀')
+    def backup_db_command(prefix):
+        """用SQLite备份接口生成数据库的一致快照并保存到备份存储（由定时任务每天调用）"""
+        from datetime import datetime
+        from app.utils.backup_store import create_backup
+        filename = f"{prefix}_{datetime.now().strftime('%Y%m%d%H%M%S')}.db3"
+        info = create_backup(filename)
+        print(f"数据库备份完成: {filename}，大小 {info['size']} 字节，新增存储 {info['stored']} 字节")
+    
+    @app.cli.command('prune-backups')
+    @click.option('--keep', type=int, default=None, help='保留的备份数，默认为 BACKUP_KEEP')
+    def prune_backups_command(keep):
+        """只保留最新的若干个备份，并删除不再被引用的数据块"""
+        from app.utils.backup_store import prune_backups
+        keep = keep if keep is not None else app.config.get('BACKUP_KEEP', 30)
+        removed = prune_backups(keep)
+        print(f"备份清理完成，保留最新的 {keep} 个，删除 {removed} 个")
+    
+    @app.cli.command('run-jobs')
+    def run_jobs_command():
+        """后台任务进程（由supervisord常驻运行），执行排队的任务并定时提交增量死链检测"""
+        import signal
+        from app.utils.jobs import JobWorker
+        worker = JobWorker(app)
+        # supervisord停止进程时让运行中的任务保存进度后重新排队
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+        worker.run()
+    
     return app
 
 from app import models 
\ No newline at end of file
@@ -1,31 +1,34 @@
 from datetime import datetime, timezone, timedelta
 from functools import wraps
 import os
-from flask import render_template, redirect, url_for, flash, request, abort, jsonify, session, current_app, send_file, send_from_directory, Response
+from flask import render_template, redirect, url_for, flash, request, abort, jsonify, session, current_app, send_file, send_from_directory, Response, stream_with_context
 from flask_login import current_user, login_required, login_user, logout_user
 from werkzeug.utils import secure_filename
 from app import db, csrf
 from app.admin import bp
 from app.admin.forms import CategoryForm, WebsiteForm, InvitationForm, UserEditForm, SiteSettingsForm, DataImportForm, BackgroundForm
-from app.models import Category, Website, InvitationCode, User, SiteSettings, OperationLog, Background, DeadlinkCheck
-from app.main.routes import get_website_icon
-from app.utils.webdav_backup import backup_to_webdav, create_webdav_client
+from app.models import Category, Website, InvitationCode, User, SiteSettings, OperationLog, Background, DeadlinkCheck, Job, backfill_website_visibility
+from app.utils.webdav_backup import backup_to_webdav, create_webdav_client, sync_backups
+from app.utils.db_backup import backup_database, database_path, restore_database
+from app.utils.backup_store import backup_exists, backup_file, backup_info, collect_garbage, create_backup, create_temp_file, is_valid_name, iter_backup, list_backups, remove_backup
+from app.utils.cache import link_data_generation, site_settings_generation
+from app.utils.deadlink import check_links, due_links, prune_check_history, save_check_results
+from app.utils.jobs import JOB_DONE, JOB_FAILED, JOB_STATE_LABELS, active_job, enqueue_job, job_handler, job_labels, job_progress, latest_job, request_cancel, wait_for_job
+from app.utils.search import ensure_search_index
+from app.utils.visits import top_websites, trending_websites
 import time
 import json
 import threading
 from queue import Queue
 from urllib.parse import urlparse
 import requests
-import shutil
 import sqlite3
-import tempfile
 import random
 import uuid
 import secrets
 from werkzeug.security import generate_password_hash
 from sqlalchemy import or_, func, desc, extract, case
 from sqlalchemy.exc import SQLAlchemyError
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import csv
 import io
 import queue
@@ -57,7 +60,35 @@ def index():
         'websites': Website.query.count(),
         'invitation_codes': InvitationCode.query.filter_by(is_active=True, used_by_id=None).count()
     }
-    return render_template('admin/index.html', title='管理面板', stats=stats)
+    # 最近7天的热门链接（来自按天统计表）
+    trending = trending_websites(days=7, limit=10)
+    return render_template('admin/index.html', title='管理面板', stats=stats, trending=trending)
+
+@bp.route('/api/visit-stats/top')
+@login_required
+@admin_required
+def visit_stats_top():
+    """查询任意时间窗口内访问量最高的链接，日期格式为YYYY-MM-DD，默认最近7天"""
+    today = datetime.utcnow().date()
+    try:
+        end_day = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else today
+        start_day = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') \
+            else end_day - timedelta(days=6)
+    except ValueError:
+        return jsonify({'success': False, 'message': '日期格式应为YYYY-MM-DD'}), 400
+    if start_day > end_day:
+        return jsonify({'success': False, 'message': '开始日期不能晚于结束日期'}), 400
+    limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+    
+    return jsonify({
+        'success': True,
+        'start': start_day.isoformat(),
+        'end': end_day.isoformat(),
+        'websites': [
+            {'id': website.id, 'title': website.title, 'url': website.url, 'visits': int(total)}
+            for website, total in top_websites(start_day, end_day, limit)
+        ]
+    })
 
 # 分类管理
 @bp.route('/categories')
@@ -845,10 +876,7 @@ def clear_all_operation_logs(user_id):
         return jsonify({'success': False, 'message': f'操作失败: {str(e)}'}), 500
 
 # 数据库导入导出
-import io
-import shutil
 import sqlite3
-import tempfile
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from app.admin.forms import DataImportForm
@@ -859,13 +887,15 @@ from app.admin.forms import DataImportForm
 def data_management():
     """数据管理页面"""
     import_form = DataImportForm()
-    return render_template('admin/data_management.html', title='数据管理', import_form=import_form)
+    recent_jobs = Job.query.order_by(Job.id.desc()).limit(10).all()
+    return render_template('admin/data_management.html', title='数据管理', import_form=import_form,
+                           recent_jobs=recent_jobs, job_kind_labels=job_labels(), job_state_labels=JOB_STATE_LABELS)
 
 @bp.route('/export-data')
 @login_required
 @superadmin_required
 def export_data():
-    """导出数据库"""
+    """导出数据库：快照写入临时文件后直接发送该文件，不读入内存，内存占用与数据库大小无关"""
     # 获取导出格式，默认为本项目格式
     export_format = request.args.get('format', 'native')
     
@@ -876,28 +906,14 @@ def export_data():
     else:
         filename = f"booknav_export_{timestamp}.db3"
     
-    # 创建临时文件
-    temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db3')
-    temp_db_path = temp_db.name
-    temp_db.close()
+    # 创建临时文件（放在备份目录所在的磁盘上，/tmp 可能是内存文件系统）
+    temp_db_path = create_temp_file()
     
     try:
-        # 复制当前数据库
-        db_path = current_app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-        current_app.logger.info(f"准备从 {db_path} 导出数据到 {temp_db_path}")
-        
-        # 数据库路径可能是相对路径，需要转换为绝对路径
-        if not os.path.isabs(db_path):
-            db_path = os.path.join(current_app.root_path, db_path)
-            current_app.logger.info(f"转换为绝对路径: {db_path}")
-        
-        # 检查源文件是否存在
-        if not os.path.exists(db_path):
-            raise FileNotFoundError(f"找不到数据库文件: {db_path}")
-        
-        # 复制数据库文件
-        shutil.copy2(db_path, temp_db_path)
-        current_app.logger.info(f"数据库文件已复制")
+        # 备份当前数据库的一致快照
+        current_app.logger.info(f"准备导出数据到 {temp_db_path}")
+        backup_database(temp_db_path)
+        current_app.logger.info(f"数据库快照已生成")
         
         # 如果选择OneNav格式，则进行格式转换
         if export_format == 'onenav':
@@ -905,21 +921,25 @@ def export_data():
             if not convert_to_onenav_format(temp_db_path):
                 raise Exception("转换为OneNav格式失败")
         
-        # 读取临时文件的内容
-        with open(temp_db_path, 'rb') as f:
-            db_data = f.read()
-            
-        # 删除临时文件
-        os.unlink(temp_db_path)
-        
-        # 将数据返回为可下载的文件
-        current_app.logger.info(f"数据导出成功，大小：{len(db_data)}字节")
-        return send_file(
-            io.BytesIO(db_data),
+        # 按路径发送文件，由服务器分块读取（gunicorn 通过 wsgi.file_wrapper 使用 sendfile）
+        current_app.logger.info(f"数据导出成功，大小：{os.path.getsize(temp_db_path)}字节")
+        response = send_file(
+            temp_db_path,
             as_attachment=True,
             download_name=filename,
-            mimetype='application/octet-stream'
+            mimetype='application/octet-stream',
+            conditional=False,
+            etag=False,
+            max_age=0
         )
+        # send_file 已经打开了文件，删除路径后数据在响应关闭文件时才释放；
+        # 启用 X-Sendfile 时由前端服务器读取文件，留给 prune_backups 清理
+        if 'X-Sendfile' not in response.headers:
+            try:
+                os.unlink(temp_db_path)
+            except OSError:
+                pass
+        return response
     except Exception as e:
         current_app.logger.error(f"导出数据失败: {str(e)}")
         # 确保临时文件被删除
@@ -935,7 +955,7 @@ def export_data():
 @login_required
 @superadmin_required
 def import_data():
-    """导入数据库"""
+    """导入数据库：保存上传的文件后提交后台导入任务"""
     form = DataImportForm()
     if form.validate_on_submit():
         db_file = form.db_file.data
@@ -946,67 +966,32 @@ def import_data():
             flash('请选择要导入的数据库文件', 'danger')
             return redirect(url_for('admin.data_management'))
         
-        # 创建临时文件保存上传内容
-        temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db3')
-        temp_db_path = temp_db.name
-        temp_db.close()
+        if active_job('import'):
+            flash('已有数据导入任务正在执行，请等待其完成', 'warning')
+            return redirect(url_for('admin.data_management'))
+        
+        # 上传的文件保存到备份目录下，任务进程导入完成后删除
+        import_dir = os.path.join(current_app.root_path, 'backups', 'imports')
+        os.makedirs(import_dir, exist_ok=True)
+        import_path = os.path.join(import_dir, f"{uuid.uuid4().hex}.db3")
         
         try:
-            # 保存上传的文件
-            db_file.save(temp_db_path)
-            
-            # 在导入前先创建一个备份（安全措施）
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            backup_filename = f"pre_import_backup_{timestamp}.db3"
-            backup_dir = os.path.join(current_app.root_path, 'backups')
-            os.makedirs(backup_dir, exist_ok=True)
-            backup_path = os.path.join(backup_dir, backup_filename)
-            
-            # 复制当前数据库作为备份
-            db_path = current_app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-            if not os.path.isabs(db_path):
-                db_path = os.path.join(current_app.root_path, db_path)
-            shutil.copy2(db_path, backup_path)
-            current_app.logger.info(f"已创建数据库备份: {backup_path}")
-            
-            # 自动检测数据库格式
-            if is_project_db(temp_db_path):
-                # 如果是本项目数据库格式
-                current_app.logger.info("检测到本项目数据库格式")
-                success, cat_count, link_count = import_project_db(temp_db_path, import_type, current_user.id)
-                if success:
-                    flash(f'数据导入成功! 导入了{cat_count}个分类和{link_count}个链接', 'success')
-                else:
-                    flash('数据导入失败', 'danger')
-            elif is_onenav_db(temp_db_path):
-                # 如果是OneNav格式
-                current_app.logger.info("检测到OneNav数据库格式")
-                
-                # 如果是替换模式，清空现有数据
-                if import_type == "replace":
-                    current_app.logger.info("执行替换模式，清空现有数据...")
-                    Website.query.delete()
-                    Category.query.delete()
-                    db.session.commit()
-                
-                try:
-                    results = import_onenav_direct(temp_db_path, import_type, current_user.id)
-                    flash(f'导入成功! {results["cats_count"]}个分类, {results["links_count"]}个链接', 'success')
-                except Exception as e:
-                    flash(f'导入过程中发生错误: {str(e)}', 'danger')
-                    current_app.logger.error(f"导入错误: {str(e)}")
+            db_file.save(import_path)
+            job = enqueue_job('import', {
+                'path': import_path,
+                'import_type': import_type,
+                'admin_id': current_user.id
+            }, created_by_id=current_user.id)
+            if job is None:
+                os.unlink(import_path)
+                flash('已有数据导入任务正在执行，请等待其完成', 'warning')
             else:
-                # 如果格式无法识别
-                flash('无法识别的数据库格式', 'danger')
-                
-            # 删除临时文件
-            os.unlink(temp_db_path)
-                
+                flash_job_result(job.id, '数据导入失败', '数据导入任务已提交，正在后台执行，可在下方任务列表中查看结果')
         except Exception as e:
             flash(f'数据导入失败: {str(e)}', 'danger')
             current_app.logger.error(f"数据导入失败: {str(e)}")
-            if os.path.exists(temp_db_path):
-                os.unlink(temp_db_path)
+            if os.path.exists(import_path):
+                os.unlink(import_path)
                 
         return redirect(url_for('admin.data_management'))
         
@@ -1017,6 +1002,54 @@ def import_data():
             
     return redirect(url_for('admin.data_management'))
 
+@job_handler('import', '数据导入', resumable=False)
+def process_import(job):
+    """
+    执行数据导入任务
+
+    导入中途任务进程退出时数据可能只导入了一部分，不自动重新执行，
+    可以用导入前自动创建的备份恢复
+    """
+    temp_db_path = job.params['path']
+    import_type = job.params['import_type']
+    admin_id = job.params.get('admin_id')
+    
+    try:
+        # 在导入前先创建一个备份（安全措施）
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        backup_filename = f"pre_import_backup_{timestamp}.db3"
+        create_backup(backup_filename)
+        current_app.logger.info(f"已创建数据库备份: {backup_filename}")
+        
+        # 自动检测数据库格式
+        if is_project_db(temp_db_path):
+            # 如果是本项目数据库格式
+            current_app.logger.info("检测到本项目数据库格式")
+            success, cat_count, link_count = import_project_db(temp_db_path, import_type, admin_id)
+            if not success:
+                raise Exception('导入本项目数据库失败')
+            return f'数据导入成功! 导入了{cat_count}个分类和{link_count}个链接'
+        elif is_onenav_db(temp_db_path):
+            # 如果是OneNav格式
+            current_app.logger.info("检测到OneNav数据库格式")
+            
+            # 如果是替换模式，清空现有数据
+            if import_type == "replace":
+                current_app.logger.info("执行替换模式，清空现有数据...")
+                Website.query.delete()
+                Category.query.delete()
+                db.session.commit()
+            
+            results = import_onenav_direct(temp_db_path, import_type, admin_id)
+            return f'导入成功! {results["cats_count"]}个分类, {results["links_count"]}个链接'
+        else:
+            # 如果格式无法识别
+            raise ValueError('无法识别的数据库格式')
+    finally:
+        # 删除上传的文件
+        if os.path.exists(temp_db_path):
+            os.unlink(temp_db_path)
+
 def import_onenav_direct(db_path, import_type, admin_id):
     """直接导入OneNav数据库，集成自migrate_onenav.py"""
     results = {"cats_count": 0, "links_count": 0}
@@ -1405,91 +1438,66 @@ def clear_all_data():
 @login_required
 @superadmin_required
 def backup_data():
-    """创建数据库备份"""
+    """创建数据库备份：提交后台备份任务"""
+    job = enqueue_job('backup', created_by_id=current_user.id)
+    if job is None:
+        flash('已有备份任务正在执行，请稍后刷新页面查看', 'warning')
+    else:
+        flash_job_result(job.id, '数据库备份失败', '备份任务已提交，正在后台执行，请稍后刷新页面查看')
+    return redirect(url_for('admin.backup_list'))
+
+@job_handler('backup', '数据库备份')
+def process_backup(job):
+    """备份数据库并按设置自动上传到WebDAV；任务中断后重新执行会生成新的备份文件"""
     # 确定时间戳和文件名
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
     filename = f"booknav_{timestamp}.db3"
     
-    # 确保备份目录存在
-    backup_dir = os.path.join(current_app.root_path, 'backups')
-    os.makedirs(backup_dir, exist_ok=True)
-    
-    # 备份文件路径
-    backup_path = os.path.join(backup_dir, filename)
-    
     try:
-        # 复制当前数据库
-        db_path = current_app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-        current_app.logger.info(f"准备备份数据库到 {backup_path}")
-        
-        # 数据库路径可能是相对路径，需要转换为绝对路径
-        if not os.path.isabs(db_path):
-            db_path = os.path.join(current_app.root_path, db_path)
-            current_app.logger.info(f"转换为绝对路径: {db_path}")
-        
-        # 检查源文件是否存在
-        if not os.path.exists(db_path):
-            raise FileNotFoundError(f"找不到数据库文件: {db_path}")
-        
-        # 复制数据库文件
-        shutil.copy2(db_path, backup_path)
-        current_app.logger.info(f"数据库备份成功: {backup_path}")
+        current_app.logger.info(f"准备备份数据库: {filename}")
+        info = create_backup(filename)
+        current_app.logger.info(f"数据库备份成功: {filename}，新增 {format_file_size(info['stored'])}")
 
         # 检查是否需要WebDAV备份
         settings = SiteSettings.get_settings()
         webdav_message = ""
 
         if settings.webdav_enabled and settings.webdav_auto_backup:
-            webdav_success, webdav_msg = backup_to_webdav(backup_path, settings)
-            if webdav_success:
-                webdav_message = f" (WebDAV备份成功: {webdav_msg})"
-                current_app.logger.info(f"WebDAV自动备份成功: {filename}")
-            else:
-                webdav_message = f" (WebDAV备份失败: {webdav_msg})"
-                current_app.logger.warning(f"WebDAV自动备份失败: {webdav_msg}")
+            # 同步全部备份：通常只上传这次的新备份，同时补传之前失败的
+            try:
+                webdav_message = f" (WebDAV{format_sync_summary(run_webdav_sync(settings))})"
+                current_app.logger.info(f"WebDAV自动备份完成: {filename}{webdav_message}")
+            except Exception as e:
+                webdav_message = f" (WebDAV备份失败: {str(e)})"
+                current_app.logger.warning(f"WebDAV自动备份失败: {str(e)}")
 
-        flash(f'数据库备份成功{webdav_message}', 'success')
-        return redirect(url_for('admin.backup_list'))
+        return f'数据库备份成功{webdav_message}'
     except Exception as e:
         current_app.logger.error(f"数据库备份失败: {str(e)}")
-        flash(f'数据库备份失败: {str(e)}', 'danger')
-        return redirect(url_for('admin.backup_list'))
+        raise
+
+def flash_job_result(job_id, failure_prefix, pending_message):
+    """等待任务最多 JOB_WAIT_SECONDS 秒，按结果显示提示消息；任务仍未结束时提示在后台执行"""
+    job = wait_for_job(job_id, timeout=current_app.config.get('JOB_WAIT_SECONDS', 10))
+    if job is None or job.is_active:
+        flash(pending_message, 'info')
+    elif job.state == JOB_DONE:
+        flash(job.message, 'success')
+    elif job.state == JOB_FAILED:
+        flash(f'{failure_prefix}: {job.message}', 'danger')
+    else:
+        flash('任务已停止', 'warning')
 
 @bp.route('/backup-list')
 @login_required
 @superadmin_required
 def backup_list():
     """备份列表管理页面"""
-    # 确保备份目录存在
-    backup_dir = os.path.join(current_app.root_path, 'backups')
-    os.makedirs(backup_dir, exist_ok=True)
-    
-    # 获取所有备份文件
-    backups = []
-    for filename in os.listdir(backup_dir):
-        if filename.endswith('.db3'):
-            file_path = os.path.join(backup_dir, filename)
-            file_stats = os.stat(file_path)
-            
-            # 提取备份时间
-            try:
-                # 从文件名中提取时间，格式如 booknav_20250414193523.db3
-                time_str = filename.split('_')[1].split('.')[0]
-                backup_time = datetime.strptime(time_str, '%Y%m%d%H%M%S')
-                time_display = backup_time.strftime('%Y-%m-%d %H:%M:%S')
-            except:
-                time_display = datetime.fromtimestamp(file_stats.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-            
-            backups.append({
-                'filename': filename,
-                'size': file_stats.st_size,
-                'size_display': format_file_size(file_stats.st_size),
-                'time': file_stats.st_mtime,
-                'time_display': time_display
-            })
-    
-    # 按时间降序排序
-    backups.sort(key=lambda x: x['time'], reverse=True)
+    # 备份信息来自备份存储的清单（已按时间降序排序）
+    backups = list_backups()
+    for backup in backups:
+        backup['size_display'] = format_file_size(backup['size'])
+        backup['time_display'] = datetime.fromtimestamp(backup['time']).strftime('%Y-%m-%d %H:%M:%S')
     
     return render_template('admin/backup_list.html', title='备份管理', backups=backups)
 
@@ -1497,25 +1505,21 @@ def backup_list():
 @login_required
 @superadmin_required
 def download_backup(filename):
-    """下载备份文件"""
+    """下载备份文件：从备份存储边解压边发送"""
     # 安全检查，确保文件名不包含路径分隔符
-    if os.path.sep in filename or '..' in filename:
+    if not is_valid_name(filename):
         abort(404)
     
-    backup_dir = os.path.join(current_app.root_path, 'backups')
-    backup_path = os.path.join(backup_dir, filename)
-    
     # 检查文件是否存在
-    if not os.path.exists(backup_path):
+    if not backup_exists(filename):
         flash('备份文件不存在', 'danger')
         return redirect(url_for('admin.backup_list'))
     
     try:
-        return send_file(
-            backup_path,
-            as_attachment=True,
-            download_name=filename
-        )
+        response = Response(stream_with_context(iter_backup(filename)), mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response.headers['Content-Length'] = str(backup_info(filename)['size'])
+        return response
     except Exception as e:
         current_app.logger.error(f"下载备份文件失败: {str(e)}")
         flash(f'下载失败: {str(e)}', 'danger')
@@ -1527,19 +1531,18 @@ def download_backup(filename):
 def delete_backup(filename):
     """删除备份文件"""
     # 安全检查，确保文件名不包含路径分隔符
-    if os.path.sep in filename or '..' in filename:
+    if not is_valid_name(filename):
         abort(404)
     
-    backup_dir = os.path.join(current_app.root_path, 'backups')
-    backup_path = os.path.join(backup_dir, filename)
-    
     # 检查文件是否存在
-    if not os.path.exists(backup_path):
+    if not backup_exists(filename):
         flash('备份文件不存在', 'danger')
         return redirect(url_for('admin.backup_list'))
     
     try:
-        os.remove(backup_path)
+        remove_backup(filename)
+        # 删除不再被其他备份引用的数据块
+        collect_garbage()
         flash('备份文件已删除', 'success')
     except Exception as e:
         current_app.logger.error(f"删除备份文件失败: {str(e)}")
@@ -1553,45 +1556,62 @@ def delete_backup(filename):
 def restore_backup(filename):
     """恢复备份"""
     # 安全检查，确保文件名不包含路径分隔符
-    if os.path.sep in filename or '..' in filename:
+    if not is_valid_name(filename):
         abort(404)
     
-    backup_dir = os.path.join(current_app.root_path, 'backups')
-    backup_path = os.path.join(backup_dir, filename)
-    
     # 检查文件是否存在
-    if not os.path.exists(backup_path):
+    if not backup_exists(filename):
         flash('备份文件不存在', 'danger')
         return redirect(url_for('admin.backup_list'))
     
     try:
-        # 目标数据库路径
-        db_path = current_app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-        
-        # 数据库路径可能是相对路径，需要转换为绝对路径
-        if not os.path.isabs(db_path):
-            db_path = os.path.join(current_app.root_path, db_path)
-        
         # 关闭数据库连接
         db.session.close()
         db.engine.dispose()
         
         # 先创建当前数据库的临时备份
+        db_path = database_path()
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         temp_backup = f"{db_path}.restore_bak.{timestamp}"
-        shutil.copy2(db_path, temp_backup)
+        backup_database(temp_backup)
         
         # 恢复备份
-        shutil.copy2(backup_path, db_path)
-        
-        flash('数据库恢复成功，请重新登录', 'success')
-        # 恢复后需要重新登录
-        return redirect(url_for('auth.logout'))
+        with backup_file(filename) as backup_path:
+            restore_database(backup_path)
     except Exception as e:
         current_app.logger.error(f"恢复备份失败: {str(e)}")
         flash(f'恢复失败: {str(e)}', 'danger')
         return redirect(url_for('admin.backup_list'))
 
+    # 数据已经替换，之后的步骤出错不能再提示恢复失败
+    try:
+        # 旧备份中可能缺少后来增加的表和全文索引
+        prepare_swapped_database()
+        flash('数据库恢复成功，请重新登录', 'success')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"恢复备份后升级数据库失败: {str(e)}")
+        flash(f'数据库已恢复，但升级数据库结构失败，请重启应用: {str(e)}', 'warning')
+    # 恢复后需要重新登录
+    return redirect(url_for('auth.logout'))
+
+def prepare_swapped_database():
+    """
+    整个替换数据库（恢复备份、替换导入）之后调用
+
+    旧数据库中可能没有后来增加的表、只有 visible_to 字符串而没有 website_visibility 授权记录、
+    也没有全文索引，在这里补齐，不需要重启即可正常使用；并通知各进程刷新缓存。
+    """
+    # 重新连接数据库（强制SQLAlchemy重新加载数据）
+    db.session.remove()
+    db.engine.dispose()
+    link_data_generation.bump()
+    site_settings_generation.bump()
+
+    db.create_all()
+    backfill_website_visibility()
+    ensure_search_index()
+
 def format_file_size(size_bytes):
     """格式化文件大小显示"""
     if size_bytes < 1024:
@@ -1604,59 +1624,24 @@ def format_file_size(size_bytes):
         return f"{size_bytes / (1024 * 1024 * 1024):.1f}GB"
 
 # 批量抓取缺失图标相关功能
-from app.main.routes import get_website_icon
+from app.utils.icon_fetch import fetch_icons, localize_icons, save_icon_results
+from app.utils.icon_store import prune_icon_files
 import time
 import json
 import threading
-from queue import Queue
-
-# 用于存储批量处理的状态
-icon_fetch_status = {
-    'is_running': False,
-    'total': 0,
-    'processed': 0,
-    'success': 0,
-    'failed': 0,
-    'start_time': None
-}
-
-# 创建队列和线程事件，用于控制抓取过程
-icon_fetch_queue = Queue()
-icon_fetch_stop_event = threading.Event()
 
 @bp.route('/api/batch-fetch-icons', methods=['POST'])
 @login_required
 @superadmin_required
 def batch_fetch_icons():
     """开始批量抓取缺失的图标"""
-    global icon_fetch_status
-    
-    # 检查是否已有正在进行的批量处理
-    if icon_fetch_status['is_running']:
+    # 同一时间只允许一个批量抓取任务
+    if enqueue_job('icon_fetch', created_by_id=current_user.id) is None:
         return jsonify({
             'success': False,
             'message': '已有批量抓取任务正在运行，请等待其完成'
         })
     
-    # 重置状态
-    icon_fetch_status = {
-        'is_running': True,
-        'total': 0,
-        'processed': 0,
-        'success': 0,
-        'failed': 0,
-        'start_time': time.time()
-    }
-    
-    # 清除可能的停止标志
-    icon_fetch_stop_event.clear()
-    
-    # 获取当前应用实例传递给线程
-    app = current_app._get_current_object()  # 获取真实的应用对象
-    
-    # 启动后台线程处理
-    threading.Thread(target=process_missing_icons, args=(app,)).start()
-    
     return jsonify({
         'success': True,
         'message': '批量抓取图标任务已启动'
@@ -1667,23 +1652,22 @@ def batch_fetch_icons():
 @superadmin_required
 def batch_fetch_icons_status():
     """获取批量抓取过程的状态"""
-    global icon_fetch_status
+    progress = job_progress(latest_job('icon_fetch'))
     
     # 计算执行时间
     elapsed_time = ""
-    if icon_fetch_status['start_time']:
-        elapsed_seconds = int(time.time() - icon_fetch_status['start_time'])
-        minutes, seconds = divmod(elapsed_seconds, 60)
+    if progress['elapsed_seconds']:
+        minutes, seconds = divmod(progress['elapsed_seconds'], 60)
         elapsed_time = f"{minutes}分{seconds}秒"
     
     response = jsonify({
-        'is_running': icon_fetch_status['is_running'],
-        'total': icon_fetch_status['total'],
-        'processed': icon_fetch_status['processed'],
-        'success': icon_fetch_status['success'],
-        'failed': icon_fetch_status['failed'],
+        'is_running': progress['is_running'],
+        'total': progress['total'],
+        'processed': progress['processed'],
+        'success': progress['success'],
+        'failed': progress['failed'],
         'elapsed_time': elapsed_time,
-        'percent': 0 if icon_fetch_status['total'] == 0 else int((icon_fetch_status['processed'] / icon_fetch_status['total']) * 100)
+        'percent': 0 if progress['total'] == 0 else min(int((progress['processed'] / progress['total']) * 100), 100)
     })
     
     # 添加禁用缓冲的头部，解决Docker环境中显示问题
@@ -1697,136 +1681,150 @@ def batch_fetch_icons_status():
 @superadmin_required
 def batch_fetch_icons_stop():
     """停止批量抓取图标任务"""
-    global icon_fetch_status
-    
-    if not icon_fetch_status['is_running']:
+    # 设置停止标志，由执行任务的进程读取
+    if not request_cancel('icon_fetch'):
         return jsonify({
             'success': False,
             'message': '没有正在运行的抓取任务'
         })
     
-    # 设置停止标志
-    icon_fetch_stop_event.set()
-    
     return jsonify({
         'success': True,
         'message': '已发送停止信号，任务将在当前图标处理完成后停止'
     })
 
-def process_missing_icons(app):
-    """后台处理所有缺失图标的网站"""
-    global icon_fetch_status
-    
-    # 在线程中使用应用上下文
-    with app.app_context():
+@bp.route('/api/localize-icons', methods=['POST'])
+@login_required
+@superadmin_required
+def localize_icons_start():
+    """提交把第三方图标下载到本地的任务"""
+    if enqueue_job('icon_localize', created_by_id=current_user.id) is None:
+        flash('已有图标本地化任务正在运行，请等待其完成', 'warning')
+    else:
+        flash('图标本地化任务已提交，正在后台执行，可在下方的后台任务列表中查看进度', 'success')
+    return redirect(url_for('admin.data_management'))
+
+def run_icon_batches(job, links, run):
+    """
+    执行批量图标任务并按批次保存结果
+
+    结果每 ICON_FETCH_BATCH_SIZE 个或每 ICON_FETCH_BATCH_INTERVAL 秒写入一次数据库，
+    同时把之前的网站都已处理完的最大网站ID保存为检查点，任务中断后从检查点之后继续
+
+    Args:
+        links: 按网站ID排序的 [(website_id, ...)]
+        run: run(links, on_result) 执行任务，结果为 (website_id, 图标地址或None)
+    """
+    app = current_app._get_current_object()
+    batch_size = app.config.get('ICON_FETCH_BATCH_SIZE', 50)
+    batch_interval = app.config.get('ICON_FETCH_BATCH_INTERVAL', 2)
+    last_id = (job.checkpoint or {}).get('last_id', 0)
+    
+    # 更新总数（继续执行时加上之前已处理的数量）
+    job.update(total=Job.processed + len(links))
+    
+    # 结果按完成顺序返回，检查点只能推进到连续处理完的位置
+    order = [website_id for website_id, _ in links]
+    position = 0
+    finished_ids = set()
+    batch = []
+    last_flush = time.time()
+    
+    def flush():
+        nonlocal position, last_id, last_flush, batch
+        while position < len(order) and order[position] in finished_ids:
+            finished_ids.discard(order[position])
+            last_id = order[position]
+            position += 1
+        success = sum(1 for _, icon in batch if icon)
         try:
-            # 查询所有缺失图标的网站
-            missing_icon_websites = Website.query.filter(
-                (Website.icon.is_(None)) | 
-                (Website.icon == '') | 
-                (Website.icon.like('%cccyun.cc%'))  # 包含备用图标的网站
-            ).all()
-            
-            # 更新总数
-            icon_fetch_status['total'] = len(missing_icon_websites)
-            
-            # 记录日志
-            current_app.logger.info(f"开始批量抓取图标，共{len(missing_icon_websites)}个网站")
-            
-            # 处理每个网站
-            for website in missing_icon_websites:
-                # 检查是否收到了停止信号
-                if icon_fetch_stop_event.is_set():
-                    current_app.logger.info("收到停止信号，中断批量抓取")
-                    break
-                    
-                try:
-                    # 抓取图标
-                    result = get_website_icon(website.url)
-                    
-                    # 根据结果更新网站图标
-                    if result["success"] and result.get("icon_url"):
-                        # 使用API返回的图标URL
-                        website.icon = result["icon_url"]
-                        icon_fetch_status['success'] += 1
-                    elif "fallback_url" in result and result["fallback_url"]:
-                        # 验证备用图标URL是否可访问
-                        fallback_url = result["fallback_url"]
-                        try:
-                            # 使用HEAD请求快速验证URL可访问性
-                            head_response = requests.head(
-                                fallback_url, 
-                                timeout=5, 
-                                headers={'User-Agent': 'Mozilla/5.0'}
-                            )
-                            if head_response.status_code < 400:  # 2xx或3xx状态码表示可访问
-                                # 备用URL可访问，设置图标并算作成功
-                                website.icon = fallback_url
-                                icon_fetch_status['success'] += 1
-                            else:
-                                # 备用URL返回错误状态码，算作失败
-                                icon_fetch_status['failed'] += 1
-                        except Exception as url_err:
-                            # 请求过程中出错，算作失败
-                            current_app.logger.warning(f"验证备用图标URL失败: {fallback_url} - {str(url_err)}")
-                            icon_fetch_status['failed'] += 1
-                    else:
-                        # 完全无法获取图标才算失败
-                        icon_fetch_status['failed'] += 1
-                    
-                    # 更新处理数量
-                    icon_fetch_status['processed'] += 1
-                    
-                    # 每10个网站提交一次，避免长事务
-                    if icon_fetch_status['processed'] % 10 == 0:
-                        db.session.commit()
-                        
-                    # 适当休眠，避免API限制
-                    time.sleep(1)
-                    
-                except Exception as e:
-                    # 处理异常，尝试使用备用图标
-                    try:
-                        from urllib.parse import urlparse
-                        parsed_url = urlparse(website.url)
-                        domain = parsed_url.netloc
-                        fallback_url = f"https://favicon.cccyun.cc/{domain}"
-                        
-                        # 验证备用图标URL是否可访问
-                        try:
-                            # 使用HEAD请求快速验证URL可访问性
-                            head_response = requests.head(
-                                fallback_url, 
-                                timeout=5, 
-                                headers={'User-Agent': 'Mozilla/5.0'}
-                            )
-                            if head_response.status_code < 400:  # 2xx或3xx状态码表示可访问
-                                # 备用URL可访问，设置图标并算作成功
-                                website.icon = fallback_url
-                                icon_fetch_status['success'] += 1
-                            else:
-                                # 备用URL返回错误状态码，算作失败
-                                icon_fetch_status['failed'] += 1
-                        except Exception as url_err:
-                            # 请求过程中出错，算作失败
-                            current_app.logger.warning(f"验证备用图标URL失败: {fallback_url} - {str(url_err)}")
-                            icon_fetch_status['failed'] += 1
-                    except:
-                        # 完全无法设置图标才算失败
-                        icon_fetch_status['failed'] += 1
-                    
-                    icon_fetch_status['processed'] += 1
-                    current_app.logger.error(f"抓取图标出错 ({website.url}): {str(e)}")
-            
-            # 提交所有更改
-            db.session.commit()
-            current_app.logger.info(f"批量抓取图标完成，成功: {icon_fetch_status['success']}，失败: {icon_fetch_status['failed']}")
-            
+            save_icon_results(batch)
         except Exception as e:
-            current_app.logger.error(f"批量抓取图标任务出错: {str(e)}")
-        finally:
-            # 更新状态为已完成
-            icon_fetch_status['is_running'] = False
+            app.logger.error(f"保存图标时出错: {str(e)}")
+        job.advance(processed=len(batch), success=success, failed=len(batch) - success,
+                    checkpoint={'last_id': last_id})
+        batch = []
+        last_flush = time.time()
+    
+    def on_result(result):
+        batch.append(result)
+        finished_ids.add(result[0])
+        if len(batch) >= batch_size or time.time() - last_flush >= batch_interval:
+            flush()
+    
+    run(links, on_result)
+    flush()
+
+@job_handler('icon_fetch', '批量抓取图标')
+def process_missing_icons(job):
+    """
+    后台处理所有缺失图标的网站
+
+    多个线程并发解析，按 ICON_FETCH_RATES 限制每个上游服务的请求速率；
+    开启 ICON_LOCALIZE 时解析到的图标直接下载到本地
+    """
+    app = current_app._get_current_object()
+    last_id = (job.checkpoint or {}).get('last_id', 0)
+    
+    # 查询检查点之后所有缺失图标的网站
+    links = db.session.query(Website.id, Website.url).filter(
+        (Website.icon.is_(None)) | 
+        (Website.icon == '') | 
+        (Website.icon.like('%cccyun.cc%')),  # 包含备用图标的网站
+        Website.id > last_id
+    ).order_by(Website.id).all()
+    db.session.remove()
+    app.logger.info(f"开始批量抓取图标，共{len(links)}个网站")
+    
+    run_icon_batches(job, links, lambda links, on_result: fetch_icons(
+        links,
+        on_result=on_result,
+        should_stop=job.should_stop,
+        workers=app.config.get('ICON_FETCH_WORKERS', 8),
+        rates=app.config.get('ICON_FETCH_RATES'),
+        timeout=app.config.get('ICON_FETCH_TIMEOUT', 5),
+        localize=app.config.get('ICON_LOCALIZE', True)
+    ))
+    
+    if job.should_stop():
+        app.logger.info("收到停止信号，中断批量抓取")
+    app.logger.info("批量抓取图标完成")
+
+@job_handler('icon_localize', '图标本地化')
+def process_localize_icons(job):
+    """
+    把网站的第三方图标地址下载为本地文件
+
+    内容相同的图标只保存一份；下载失败的网站保留原地址，下次执行时重试。
+    全部处理完后删除已经没有网站引用的本地图标文件
+    """
+    app = current_app._get_current_object()
+    last_id = (job.checkpoint or {}).get('last_id', 0)
+    
+    icons = db.session.query(Website.id, Website.icon).filter(
+        Website.icon.like('http%'),
+        Website.id > last_id
+    ).order_by(Website.id).all()
+    db.session.remove()
+    app.logger.info(f"开始下载图标到本地，共{len(icons)}个网站")
+    
+    run_icon_batches(job, icons, lambda icons, on_result: localize_icons(
+        icons,
+        on_result=on_result,
+        should_stop=job.should_stop,
+        workers=app.config.get('ICON_FETCH_WORKERS', 8),
+        timeout=app.config.get('ICON_FETCH_TIMEOUT', 5)
+    ))
+    if job.should_stop():
+        app.logger.info("收到停止信号，中断图标本地化")
+        return
+    
+    referenced = {icon for icon, in db.session.query(Website.icon).filter(Website.icon.isnot(None))}
+    db.session.remove()
+    removed = prune_icon_files(referenced)
+    app.logger.info(f"图标本地化完成，删除了 {removed} 个不再使用的图标文件")
+    if removed:
+        return f"删除了 {removed} 个不再使用的图标文件"
 
 def is_project_db(db_path):
     """检查是否为本项目数据库格式"""
@@ -1863,24 +1861,16 @@ def import_project_db(db_path, import_type, admin_id):
         # 备份现有数据库
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         backup_filename = f"pre_import_backup_{timestamp}.db3"
-        backup_dir = os.path.join(current_app.root_path, 'backups')
-        os.makedirs(backup_dir, exist_ok=True)
-        backup_path = os.path.join(backup_dir, backup_filename)
-        
-        # 复制当前数据库作为备份
-        db_path_current = current_app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-        if not os.path.isabs(db_path_current):
-            db_path_current = os.path.join(current_app.root_path, db_path_current)
-        shutil.copy2(db_path_current, backup_path)
+        create_backup(backup_filename)
+        db_path_current = database_path()
         
         # 如果是替换模式，直接使用导入的数据库替换现有数据库
         if import_type == "replace":
-            current_app.logger.info("执行替换模式，直接替换数据库文件")
-            shutil.copy2(db_path, db_path_current)
-            
-            # 重新连接数据库（强制SQLAlchemy重新加载数据）
+            current_app.logger.info("执行替换模式，直接替换数据库内容")
+            # 先关闭会话中的连接，避免替换时等待其持有的锁
             db.session.remove()
-            db.engine.dispose()
+            restore_database(db_path, db_path_current)
+            prepare_swapped_database()
             
             # 获取数据库统计信息
             conn = sqlite3.connect(db_path_current)
@@ -2138,74 +2128,29 @@ def clear_background():
 # ---------------- 死链检测相关功能 ----------------
 
 import uuid
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 import csv
 import io
 
-# 全局变量，用于跟踪死链检测任务状态
-deadlink_check_task = {
-    'is_running': False,
-    'should_stop': False,
-    'processed': 0,
-    'valid': 0,
-    'invalid': 0,
-    'total': 0,
-    'start_time': None,
-    'end_time': None,
-    'check_id': None,  # 添加check_id字段
-    'result_queue': queue.Queue()
-}
-
 @bp.route('/batch-check-deadlinks', methods=['POST'])
 @login_required
 @superadmin_required
 def batch_check_deadlinks():
     """启动批量死链检测任务"""
-    global deadlink_check_task
+    # 增量检测只检测到期的链接；历史检测记录保留，由检测任务按保留天数清理
+    data = request.get_json(silent=True) or {}
+    incremental = bool(data.get('incremental'))
     
-    # 检查是否有任务正在运行
-    if deadlink_check_task['is_running']:
+    # 检查是否有任务正在运行，并提交后台任务
+    if enqueue_job('deadlink', {'incremental': incremental}, created_by_id=current_user.id) is None:
         return jsonify({
             'success': False,
             'message': '已有死链检测任务正在运行'
         })
     
-    # 清空历史检测记录
-    try:
-        # 删除所有历史死链检测记录
-        DeadlinkCheck.query.delete()
-        db.session.commit()
-        current_app.logger.info('已清空所有历史死链检测记录')
-    except Exception as e:
-        db.session.rollback()
-        current_app.logger.error(f'清空历史检测记录失败: {str(e)}')
-        return jsonify({
-            'success': False,
-            'message': f'清空历史检测记录失败: {str(e)}'
-        })
-    
-    # 重置任务状态
-    deadlink_check_task.update({
-        'is_running': True,
-        'should_stop': False,
-        'processed': 0,
-        'valid': 0,
-        'invalid': 0,
-        'total': 0,
-        'start_time': time.time(),
-        'end_time': None,
-        'check_id': str(uuid.uuid4()),  # 确保生成一个新的check_id
-        'result_queue': queue.Queue()
-    })
-    
-    # 启动后台任务
-    threading.Thread(target=process_deadlink_check, args=(current_app._get_current_object(),), daemon=True).start()
-    
     return jsonify({
         'success': True,
-        'message': '死链检测任务已启动'
+        'message': '增量死链检测任务已启动' if incremental else '死链检测任务已启动'
     })
 
 @bp.route('/batch-check-deadlinks/status')
@@ -2213,32 +2158,25 @@ def batch_check_deadlinks():
 @superadmin_required
 def batch_check_deadlinks_status():
     """获取死链检测任务状态"""
-    global deadlink_check_task
+    job = latest_job('deadlink')
+    progress = job_progress(job)
     
     # 计算进度百分比
     percent = 0
-    if deadlink_check_task['total'] > 0:
-        percent = round((deadlink_check_task['processed'] / deadlink_check_task['total']) * 100)
-    
-    # 计算已用时间
-    elapsed_time = 0
-    if deadlink_check_task['start_time']:
-        if deadlink_check_task['end_time']:
-            elapsed_time = round(deadlink_check_task['end_time'] - deadlink_check_task['start_time'])
-        else:
-            elapsed_time = round(time.time() - deadlink_check_task['start_time'])
+    if progress['total'] > 0:
+        percent = min(round((progress['processed'] / progress['total']) * 100), 100)
     
     # 格式化时间
-    elapsed_time_str = format_elapsed_time(elapsed_time)
+    elapsed_time_str = format_elapsed_time(progress['elapsed_seconds'])
     
     response = jsonify({
-        'is_running': deadlink_check_task['is_running'],
-        'processed': deadlink_check_task['processed'],
-        'valid': deadlink_check_task['valid'],
-        'invalid': deadlink_check_task['invalid'],
-        'total': deadlink_check_task['total'],
+        'is_running': progress['is_running'],
+        'processed': progress['processed'],
+        'valid': progress['success'],
+        'invalid': progress['failed'],
+        'total': progress['total'],
         'elapsed_time': elapsed_time_str,
-        'check_id': deadlink_check_task.get('check_id', ''),  # 添加check_id
+        'check_id': job.checkpoint_data.get('check_id', '') if job else '',
         'percent': percent  # 确保百分比存在
     })
     
@@ -2253,290 +2191,152 @@ def batch_check_deadlinks_status():
 @superadmin_required
 def batch_check_deadlinks_stop():
     """停止死链检测任务"""
-    global deadlink_check_task
-    
-    if not deadlink_check_task['is_running']:
+    # 设置停止标志，由执行任务的进程读取
+    if not request_cancel('deadlink'):
         return jsonify({
             'success': False,
             'message': '没有正在运行的死链检测任务'
         })
     
-    # 设置停止标志
-    deadlink_check_task['should_stop'] = True
-    
     return jsonify({
         'success': True,
         'message': '已发送停止信号，任务将在当前链接检查完成后停止'
     })
 
-def process_check_results(app):
-    """处理链接检测结果的函数"""
-    global deadlink_check_task
+def process_check_results(app, job, check_id, total, result_queue):
+    """处理链接检测结果的函数：凑满一批或等待超时后一次性写入数据库，收到None时结束"""
+    batch_size = app.config.get('DEADLINK_RESULT_BATCH_SIZE', 200)
+    batch_interval = app.config.get('DEADLINK_RESULT_BATCH_INTERVAL', 0.5)
+    processed = 0
     
     with app.app_context():
-        while True:
+        finished = False
+        while not finished:
+            batch = []
             try:
-                # 从队列中获取一个结果，最多等待1秒
-                result = deadlink_check_task['result_queue'].get(timeout=1)
-                
-                # 检查是否为结束信号
-                if result is None:
-                    app.logger.info("结果处理完成！")
-                    break
-                
-                # 解析结果
-                website_id, url, is_valid, status_code, error_type, error_message, response_time = result
-                
-                # 更新统计信息
-                deadlink_check_task['processed'] += 1
-                if is_valid:
-                    deadlink_check_task['valid'] += 1
-                else:
-                    deadlink_check_task['invalid'] += 1
-                
-                # 更新数据库
-                try:
-                    # 确保check_id存在
-                    if not deadlink_check_task.get('check_id'):
-                        app.logger.error("缺少check_id，无法保存结果")
-                        continue
-                        
-                    # 查找对应的Website记录
-                    website = Website.query.get(website_id)
-                    if website:
-                        # 创建新的检测结果记录
-                        check_result = DeadlinkCheck(
-                            check_id=deadlink_check_task['check_id'],
-                            website_id=website_id,
-                            url=url,
-                            is_valid=is_valid,
-                            status_code=status_code,
-                            error_type=error_type,
-                            error_message=error_message,
-                            response_time=response_time,
-                            checked_at=datetime.utcnow()
-                        )
-                        
-                        # 更新Website的last_check和is_valid字段
-                        website.last_check = datetime.utcnow()
-                        website.is_valid = is_valid
-                        
-                        # 保存到数据库
-                        db.session.add(check_result)
-                        db.session.commit()
-                    else:
-                        app.logger.warning(f"处理结果时找不到Website ID: {website_id}")
-                
-                except Exception as e:
-                    app.logger.error(f"保存检测结果时出错: {str(e)}")
-                    # 尝试回滚事务
-                    try:
-                        db.session.rollback()
-                    except:
-                        pass
-                
-                # 标记队列任务已完成
-                deadlink_check_task['result_queue'].task_done()
-                
-                # 记录进度
-                if deadlink_check_task['processed'] % 10 == 0 or deadlink_check_task['processed'] == deadlink_check_task['total']:
-                    app.logger.info(f"已处理 {deadlink_check_task['processed']}/{deadlink_check_task['total']} 个链接 "
-                                  f"({deadlink_check_task['processed']/deadlink_check_task['total']*100:.1f}%)")
-            
+                # 等待这一批的第一个结果，最多等待1秒
+                result = result_queue.get(timeout=1)
+                deadline = time.time() + batch_interval
+                while result is not None:
+                    batch.append(result)
+                    if len(batch) >= batch_size:
+                        break
+                    result = result_queue.get(timeout=max(deadline - time.time(), 0))
+                finished = result is None
             except queue.Empty:
-                # 队列为空，检查任务是否已完成
-                if deadlink_check_task['processed'] >= deadlink_check_task['total'] or deadlink_check_task['should_stop']:
-                    # 如果已经处理完所有链接或收到停止信号，则结束处理
-                    app.logger.info("没有更多结果需要处理，结束结果处理线程")
-                    break
-                    
-                # 否则继续等待新的结果
-                continue
-                
-            except Exception as e:
-                app.logger.error(f"处理结果时发生错误: {str(e)}")
-
-def process_deadlink_check(app):
-    """执行死链检测的后台任务"""
-    global deadlink_check_task
-    
-    with app.app_context():
-        try:
-            # 启动结果处理线程
-            result_processor = threading.Thread(
-                target=process_check_results,
-                args=(app,),
-                daemon=True
-            )
-            result_processor.start()
-            
-            # 获取所有需要检测的网站链接
-            websites = Website.query.all()
-            total_websites = len(websites)
-            deadlink_check_task['total'] = total_websites
-            
-            app.logger.info(f"开始死链检测，共有 {total_websites} 个链接需要检测")
-            
-            # 使用线程池进行并行检测
-            max_workers = min(5, total_websites)  # 降低线程数，减少资源占用
-            
-            # 对链接进行分批处理，避免处理过多链接导致内存问题
-            batch_size = 20  # 减小批次大小
+                pass
             
-            for i in range(0, total_websites, batch_size):
-                # 检查是否应该停止
-                if deadlink_check_task['should_stop']:
-                    app.logger.info("收到停止信号，终止死链检测任务...")
-                    break
-                
-                batch = websites[i:i+batch_size]
-                app.logger.info(f"处理批次 {i//batch_size + 1}/{(total_websites+batch_size-1)//batch_size}，包含 {len(batch)} 个链接")
-                
-                with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    # 提交批次任务
-                    future_to_website = {
-                        executor.submit(check_single_link_thread_safe, website): website
-                        for website in batch
-                    }
-                    
-                    # 等待所有任务完成
-                    for future in as_completed(future_to_website):
-                        # 检查是否应该停止
-                        if deadlink_check_task['should_stop']:
-                            app.logger.info("收到停止信号，正在终止当前批次...")
-                            # 取消所有未完成的任务
-                            for f in future_to_website:
-                                if not f.done():
-                                    f.cancel()
-                            break
-                
-                # 每批次处理完成后，短暂休息以减轻系统负担
-                time.sleep(1)
+            if not batch:
+                continue
             
-            # 任务完成
-            deadlink_check_task['end_time'] = time.time()
-            elapsed_seconds = int(deadlink_check_task['end_time'] - deadlink_check_task['start_time'])
-            app.logger.info(f"死链检测完成！共检测 {deadlink_check_task['processed']} 个链接，"
-                           f"有效 {deadlink_check_task['valid']} 个，"
-                           f"无效 {deadlink_check_task['invalid']} 个，"
-                           f"用时 {format_elapsed_time(elapsed_seconds)}")
+            # 更新数据库
+            try:
+                saved = save_check_results(check_id, batch)
+                if saved < len(batch):
+                    app.logger.warning(f"有 {len(batch) - saved} 个检测结果对应的链接已被删除")
+            except Exception as e:
+                app.logger.error(f"保存检测结果时出错: {str(e)}")
             
-            # 等待结果处理线程完成
-            deadlink_check_task['result_queue'].put(None)  # 发送结束信号
-            result_processor.join(timeout=30)  # 最多等待30秒
+            # 更新统计信息
+            valid = sum(1 for result in batch if result[2])
+            job.advance(processed=len(batch), success=valid, failed=len(batch) - valid)
             
-        except Exception as e:
-            app.logger.error(f"死链检测任务发生错误: {str(e)}")
-        finally:
-            deadlink_check_task['is_running'] = False
-            if not deadlink_check_task['end_time']:
-                deadlink_check_task['end_time'] = time.time()
-
-def check_single_link_thread_safe(website):
-    """线程安全的链接检测函数，不直接操作数据库"""
-    global deadlink_check_task
-    
-    url = website.url
-    is_valid = False
-    status_code = None
-    error_type = None
-    error_message = None
-    start_time = time.time()
-    
-    # 确保URL有效
-    if not url or not (url.startswith('http://') or url.startswith('https://')):
-        error_type = 'invalid_url'
-        error_message = 'URL格式无效'
-        response_time = 0
+            # 记录进度
+            processed += len(batch)
+            if total:
+                app.logger.info(f"已处理 {processed}/{total} 个链接 ({processed/total*100:.1f}%)")
         
-        # 将结果放入队列
-        result = (website.id, url, is_valid, status_code, error_type, error_message, response_time)
-        deadlink_check_task['result_queue'].put(result)
-        return is_valid
+        app.logger.info("结果处理完成！")
+
+@job_handler('deadlink', '死链检测')
+def process_deadlink_check(job):
+    """
+    执行死链检测的后台任务
+
+    参数 incremental 为真时只检测到期的链接（从未检测、超过复查周期或失败后到了重试时间）。
+    检测批次ID保存在检查点中，任务中断后继续执行时跳过本批次已有检测记录的链接。
+    """
+    app = current_app._get_current_object()
+    incremental = bool(job.params.get('incremental'))
     
-    try:
-        # 发送HTTP请求检查链接
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Connection': 'keep-alive',
-            'Pragma': 'no-cache',
-            'Cache-Control': 'no-cache'
-        }
-        
-        # 尝试HEAD请求，更轻量和快速
-        try:
-            response = requests.head(url, timeout=15, headers=headers, allow_redirects=True, verify=False)
-            status_code = response.status_code
-            
-            # 有些网站可能不支持HEAD请求，如果得到4xx或5xx状态码，尝试GET请求
-            if status_code >= 400:
-                raise requests.exceptions.RequestException("HEAD请求失败，尝试GET请求")
-                
-        except requests.exceptions.RequestException:
-            # 尝试GET请求，但只获取头部内容以节省带宽
-            response = requests.get(url, timeout=15, headers=headers, allow_redirects=True, stream=True, verify=False)
-            # 只读取少量内容
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:  # 过滤掉保持活动的新行
-                    break
-            status_code = response.status_code
-            response.close()
-        
-        # 2xx和3xx状态码通常表示链接有效
-        # 某些特殊的4xx状态码也可能表示网站正常工作，只是访问受限
-        is_valid = (200 <= status_code < 400) or status_code in [401, 403]
-        
-        if not is_valid:
-            error_type = f'http_{status_code}'
-            error_message = f'HTTP状态码: {status_code}'
-            
-    except requests.exceptions.Timeout:
-        error_type = 'timeout'
-        error_message = '请求超时'
-    except requests.exceptions.SSLError:
-        error_type = 'ssl_error'
-        error_message = 'SSL证书验证失败'
-    except requests.exceptions.ConnectionError:
-        error_type = 'connection_error'
-        error_message = '连接错误'
-    except requests.exceptions.TooManyRedirects:
-        error_type = 'too_many_redirects'
-        error_message = '重定向次数过多'
-    except requests.exceptions.RequestException as e:
-        error_type = 'request_error'
-        error_message = str(e)
-    except Exception as e:
-        error_type = 'unknown_error'
-        error_message = str(e)
+    check_id = (job.checkpoint or {}).get('check_id')
+    if not check_id:
+        check_id = str(uuid.uuid4())
+        job.update(checkpoint={'check_id': check_id})
     
-    # 计算响应时间
-    response_time = time.time() - start_time
+    # 获取需要检测的网站链接（只需要ID和URL）
+    if incremental:
+        links = due_links()
+    else:
+        links = db.session.query(Website.id, Website.url).all()
     
-    # 将结果放入队列，而不是直接操作数据库
-    result = (website.id, url, is_valid, status_code, error_type, error_message, response_time)
-    deadlink_check_task['result_queue'].put(result)
+    # 本批次已经保存过的检测结果计入进度
+    checked = dict(db.session.query(DeadlinkCheck.website_id, DeadlinkCheck.is_valid)
+                   .filter_by(check_id=check_id).all())
+    links = [link for link in links if link[0] not in checked]
+    db.session.remove()
+    valid = sum(1 for is_valid in checked.values() if is_valid)
+    total_websites = len(checked) + len(links)
+    job.update(total=total_websites, processed=len(checked), success=valid, failed=len(checked) - valid)
+    
+    start_time = time.time()
+    app.logger.info(f"开始{'增量' if incremental else ''}死链检测，共有 {total_websites} 个链接需要检测"
+                    f"{f'，已检测 {len(checked)} 个' if checked else ''}")
+    
+    # 启动结果处理线程
+    result_queue = queue.Queue()
+    result_processor = threading.Thread(
+        target=process_check_results,
+        args=(app, job, check_id, total_websites, result_queue),
+        daemon=True
+    )
+    result_processor.start()
     
-    return is_valid
+    try:
+        # 异步并发检测，结果放入队列由结果处理线程写入数据库
+        check_links(
+            links,
+            on_result=result_queue.put,
+            should_stop=job.should_stop,
+            concurrency=app.config.get('DEADLINK_CONCURRENCY', 50),
+            per_host=app.config.get('DEADLINK_PER_HOST', 4),
+            timeout=app.config.get('DEADLINK_TIMEOUT', 15)
+        )
+    finally:
+        # 等待结果处理线程写完已有的结果
+        result_queue.put(None)  # 发送结束信号
+        result_processor.join()
+    
+    if job.should_stop():
+        app.logger.info("收到停止信号，终止死链检测任务...")
+    
+    # 任务完成
+    elapsed_seconds = int(time.time() - start_time)
+    app.logger.info(f"死链检测完成！用时 {format_elapsed_time(elapsed_seconds)}")
+    
+    # 清理超过保留天数的检测记录
+    pruned = prune_check_history()
+    if pruned:
+        app.logger.info(f"已清理 {pruned} 条过期的死链检测记录")
+
+def latest_deadlink_check_id():
+    """最近一次死链检测的批次ID：优先取最近的检测任务，其检测记录已被清理时取最新的检测记录"""
+    job = latest_job('deadlink')
+    check_id = job.checkpoint_data.get('check_id') if job else None
+    if check_id and DeadlinkCheck.query.filter_by(check_id=check_id).first():
+        return check_id
+    latest_check = DeadlinkCheck.query.order_by(DeadlinkCheck.checked_at.desc()).first()
+    return latest_check.check_id if latest_check else None
 
 @bp.route('/deadlink-results')
 @login_required
 @superadmin_required
 def deadlink_results():
     """显示死链检测结果页面"""
-    global deadlink_check_task
-    
-    # 使用全局check_id
-    check_id = deadlink_check_task.get('check_id')
+    check_id = latest_deadlink_check_id()
     if not check_id:
-        # 如果没有最新的检测ID，尝试从数据库获取最新的检测批次ID
-        latest_check = DeadlinkCheck.query.order_by(DeadlinkCheck.checked_at.desc()).first()
-        if latest_check:
-            check_id = latest_check.check_id
-        else:
-            flash('没有找到检测记录', 'warning')
-            return redirect(url_for('admin.data_management'))
+        flash('没有找到检测记录', 'warning')
+        return redirect(url_for('admin.data_management'))
     
     # 获取统计信息
     total = DeadlinkCheck.query.filter_by(check_id=check_id).count()
@@ -2589,18 +2389,10 @@ def deadlink_results():
 @superadmin_required
 def export_deadlink_results():
     """导出死链检测结果为CSV文件"""
-    global deadlink_check_task
-    
-    # 使用全局check_id
-    check_id = deadlink_check_task.get('check_id')
+    check_id = latest_deadlink_check_id()
     if not check_id:
-        # 如果没有最新的检测ID，尝试从数据库获取最新的检测批次ID
-        latest_check = DeadlinkCheck.query.order_by(DeadlinkCheck.checked_at.desc()).first()
-        if latest_check:
-            check_id = latest_check.check_id
-        else:
-            flash('没有找到检测记录', 'warning')
-            return redirect(url_for('admin.deadlink_results'))
+        flash('没有找到检测记录', 'warning')
+        return redirect(url_for('admin.deadlink_results'))
     
     # 准备CSV数据
     output = io.StringIO()
@@ -2720,10 +2512,8 @@ def format_elapsed_time(seconds):
 @superadmin_required
 def clear_deadlink_records():
     """手动清理所有死链检测记录"""
-    global deadlink_check_task
-    
     # 检查是否有任务正在运行
-    if deadlink_check_task['is_running']:
+    if active_job('deadlink'):
         return jsonify({
             'success': False,
             'message': '当前有死链检测任务正在运行，无法清理记录'
@@ -2736,9 +2526,6 @@ def clear_deadlink_records():
         db.session.commit()
         current_app.logger.info(f'已手动清空所有历史死链检测记录，共 {count} 条')
         
-        # 重置检测ID
-        deadlink_check_task['check_id'] = None
-        
         return jsonify({
             'success': True,
             'message': f'已成功清理 {count} 条历史检测记录'
@@ -2788,24 +2575,22 @@ def test_webdav():
 def backup_file_to_webdav(filename):
     """手动将指定备份文件上传到WebDAV"""
     # 安全检查
-    if os.path.sep in filename or ".." in filename:
+    if not is_valid_name(filename):
         return jsonify({
             "success": False,
             "message": "无效的文件名"
         })
 
     try:
-        backup_dir = os.path.join(current_app.root_path, "backups")
-        backup_path = os.path.join(backup_dir, filename)
-
-        if not os.path.exists(backup_path):
+        if not backup_exists(filename):
             return jsonify({
                 "success": False,
                 "message": "备份文件不存在"
             })
 
         settings = SiteSettings.get_settings()
-        success, message = backup_to_webdav(backup_path, settings)
+        with backup_file(filename) as backup_path:
+            success, message = backup_to_webdav(backup_path, settings, filename)
 
         if success:
             current_app.logger.info(f"手动WebDAV备份成功: {filename}")
@@ -2828,51 +2613,70 @@ def backup_file_to_webdav(filename):
 @login_required
 @superadmin_required
 def backup_all_to_webdav():
-    """批量将本地备份文件上传到WebDAV"""
-    try:
-        settings = SiteSettings.get_settings()
-        if not settings.webdav_enabled:
-            return jsonify({
-                "success": False,
-                "message": "WebDAV功能未启用"
-            })
+    """把本地备份同步到WebDAV：提交后台同步任务，只上传远程缺少或有变化的备份"""
+    settings = SiteSettings.get_settings()
+    if not settings.webdav_enabled:
+        return jsonify({
+            "success": False,
+            "message": "WebDAV功能未启用"
+        })
 
-        backup_dir = os.path.join(current_app.root_path, "backups")
-        if not os.path.exists(backup_dir):
-            return jsonify({
-                "success": False,
-                "message": "备份目录不存在"
-            })
+    job = enqueue_job("webdav_sync", created_by_id=current_user.id)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "message": "已有WebDAV同步任务正在执行，请稍后刷新页面查看"
+        })
 
-        backup_files = [f for f in os.listdir(backup_dir) if f.endswith(".db3")]
-        if not backup_files:
-            return jsonify({
-                "success": False,
-                "message": "没有找到备份文件"
-            })
+    job = wait_for_job(job.id, timeout=current_app.config.get("JOB_WAIT_SECONDS", 10))
+    if job is None or job.is_active:
+        return jsonify({
+            "success": True,
+            "message": "同步任务已提交，正在后台执行，可在数据管理页面的任务列表中查看结果"
+        })
+    return jsonify({
+        "success": job.state == JOB_DONE,
+        "message": job.message if job.state == JOB_DONE else f"批量备份失败: {job.message}"
+    })
 
-        success_count = 0
-        failed_count = 0
 
-        for filename in backup_files:
-            backup_path = os.path.join(backup_dir, filename)
-            success, message = backup_to_webdav(backup_path, settings)
+def webdav_retention():
+    """WebDAV远程备份的保留规则，全部为0时不删除远程文件"""
+    config = current_app.config
+    return {
+        "last": config.get("WEBDAV_KEEP_LAST", 0),
+        "daily": config.get("WEBDAV_KEEP_DAILY", 0),
+        "weekly": config.get("WEBDAV_KEEP_WEEKLY", 0),
+        "monthly": config.get("WEBDAV_KEEP_MONTHLY", 0)
+    }
 
-            if success:
-                success_count += 1
-                current_app.logger.info(f"批量WebDAV备份成功: {filename}")
-            else:
-                failed_count += 1
-                current_app.logger.error(f"批量WebDAV备份失败: {filename} - {message}")
 
-        return jsonify({
-            "success": True,
-            "message": f"批量备份完成: 成功 {success_count} 个, 失败 {failed_count} 个"
-        })
-    except Exception as e:
-        current_app.logger.error(f"批量WebDAV备份失败: {str(e)}")
-        return jsonify({
-            "success": False,
-            "message": f"批量备份失败: {str(e)}"
-        })
+def run_webdav_sync(settings):
+    """把全部本地备份同步到WebDAV，返回上传、跳过、失败、删除的计数"""
+    webdav_client = create_webdav_client(settings)
+    if not webdav_client:
+        raise Exception("WebDAV未配置或配置无效")
+    return sync_backups(webdav_client, list_backups(), backup_file,
+                        workers=current_app.config.get("WEBDAV_UPLOAD_WORKERS", 3),
+                        retention=webdav_retention())
+
+
+def format_sync_summary(summary):
+    message = f"同步完成: 上传 {summary['uploaded']} 个, 未变化跳过 {summary['skipped']} 个, 失败 {summary['failed']} 个"
+    if summary["deleted"]:
+        message += f", 删除远程旧备份 {summary['deleted']} 个"
+    return message
+
+
+@job_handler("webdav_sync", "WebDAV同步")
+def process_webdav_sync(job):
+    """同步本地备份到WebDAV；定时提交的任务只在开启了自动备份时执行"""
+    settings = SiteSettings.get_settings()
+    if not settings.webdav_enabled or (job.params.get("scheduled") and not settings.webdav_auto_backup):
+        return "WebDAV自动备份未启用，跳过同步"
+    summary = run_webdav_sync(settings)
+    job.update(total=summary["uploaded"] + summary["skipped"] + summary["failed"],
+               processed=summary["uploaded"] + summary["failed"],
+               success=summary["uploaded"], failed=summary["failed"])
+    return format_sync_summary(summary)
 
@@ -3,6 +3,7 @@ from flask_login import current_user, login_required
 from app import db, csrf
 from app.api import bp
 from app.models import Website, Category, OperationLog
+from app.utils.visits import visit_buffer
 import json
 
 @bp.route('/website/<int:id>/delete', methods=['DELETE'])
@@ -192,23 +193,8 @@ def record_visit(website_id):
     try:
         website = Website.query.get_or_404(website_id)
         
-        # 增加网站浏览次数
-        website.views += 1
-        
-        # 记录今日访问量
-        from datetime import datetime, timedelta
-        today = datetime.utcnow().date()
-        
-        # 如果最后访问日期为空或不是今天，重置今日访问量
-        if website.last_view is None or website.last_view.date() < today:
-            website.views_today = 1
-        else:
-            website.views_today += 1
-        
-        # 更新最后访问时间
-        website.last_view = datetime.utcnow()
-        
-        db.session.commit()
+        # 浏览次数、今日访问量和最后访问时间由后台线程批量写入数据库
+        visit_buffer.record(website.id)
         return jsonify({'success': True, 'message': '访问记录已更新'})
     except Exception as e:
         db.session.rollback()
@@ -2,81 +2,40 @@ from flask import render_template, redirect, url_for, flash, request, jsonify, a
 from flask_login import current_user, login_required
 from app import db, csrf
 from app.main import bp
-from app.models import Category, Website, OperationLog, SiteSettings
+from app.models import Category, Website, OperationLog
 from app.main.forms import SearchForm, WebsiteForm
-from datetime import datetime, timedelta
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
+from app.utils.homepage import homepage_cache
+from app.utils.cache import link_data_generation
+from app.utils.http_cache import conditional_get, conditional_response
+from app.utils.jobs import enqueue_job
+from app.utils.icon_store import is_local_icon, is_remote_icon
+from app.utils.site_info import extract_site_info, get_website_icon
+from app.utils.search import search_websites
+from app.utils.site_settings import site_settings_cache
+from app.utils.suggest import suggest_index
+from app.utils.visits import visit_buffer
+from datetime import timedelta
 import time
-from sqlalchemy import or_
 import json
 import threading
+from queue import Queue
 from flask import current_app
 
 @bp.route('/')
+@conditional_get(link_data_generation, page=True)
 def index():
-    # 获取所有分类，按照排序顺序
-    categories = Category.query.order_by(Category.order.desc()).all()
-    
-    # 获取推荐网站，只显示公开的或当前用户可见的
-    featured_sites_query = Website.query.filter_by(is_featured=True)
-    if not current_user.is_authenticated:
-        featured_sites_query = featured_sites_query.filter_by(is_private=False)
-    elif not current_user.is_admin:
-        featured_sites_query = featured_sites_query.filter(
-            (Website.is_private == False) |  # 公开的
-            (Website.created_by_id == current_user.id) |  # 自己创建的
-            (Website.visible_to.contains(str(current_user.id)))  # 被授权查看的
-        )
-    featured_sites = featured_sites_query.order_by(Website.views.desc()).limit(6).all()
-    
-    # 预先加载每个分类下的网站，按照自定义排序顺序，添加limit限制提升性能
-    for category in categories:
-        # 构建查询条件（用于权限过滤）
-        websites_query = Website.query.filter_by(category_id=category.id)
-        if not current_user.is_authenticated:
-            websites_query = websites_query.filter_by(is_private=False)
-        elif not current_user.is_admin:
-            websites_query = websites_query.filter(
-                (Website.is_private == False) |
-                (Website.created_by_id == current_user.id) |
-                (Website.visible_to.contains(str(current_user.id)))
-            )
-        
-        # 计算该分类下的全部链接数量（用于显示）
-        category.total_count = websites_query.count()
-        
-        # 加载需要显示的链接（性能优化）
-        category.website_list = websites_query.order_by(
-            Website.sort_order.desc(),  # 改为降序，权重大的排在前面
-            Website.created_at.asc(),
-            Website.views.desc()
-        ).limit(category.display_limit).all()  # 添加limit限制，只加载需要显示的链接数量
-        
-        # 为子分类计算链接数量
-        for child in category.children:
-            child_query = Website.query.filter_by(category_id=child.id)
-            if not current_user.is_authenticated:
-                child_query = child_query.filter_by(is_private=False)
-            elif not current_user.is_admin:
-                child_query = child_query.filter(
-                    (Website.is_private == False) |
-                    (Website.created_by_id == current_user.id) |
-                    (Website.visible_to.contains(str(current_user.id)))
-                )
-            child.total_count = child_query.count()
-    
-    # 获取站点设置
-    settings = SiteSettings.get_settings()
+    # 从缓存中获取首页所需的分类、链接数量和展示链接（数据变更后自动失效）
+    categories, featured_sites, icon_bundle = homepage_cache.get(current_user)
     
+    # 站点设置由全局上下文处理器注入
     return render_template('index.html', 
                            title='首页', 
                            categories=categories, 
                            featured_sites=featured_sites,
-                           settings=settings)
+                           icon_bundle=icon_bundle)
 
 @bp.route('/category/<int:id>')
+@conditional_get(link_data_generation, page=True)
 def category(id):
     category = Category.query.get_or_404(id)
     
@@ -87,14 +46,7 @@ def category(id):
     websites_query = Website.query.filter_by(category_id=id)
     
     # 根据用户权限过滤私有链接
-    if not current_user.is_authenticated:
-        websites_query = websites_query.filter_by(is_private=False)
-    elif not current_user.is_admin:
-        websites_query = websites_query.filter(
-            (Website.is_private == False) |
-            (Website.created_by_id == current_user.id) |
-            (Website.visible_to.contains(str(current_user.id)))
-        )
+    websites_query = Website.filter_visible(websites_query, current_user)
     
     websites = websites_query.order_by(
         Website.sort_order.desc(),  # 改为降序，权重大的排在前面
@@ -138,73 +90,41 @@ def category(id):
 def site(id):
     site = Website.query.get_or_404(id)
     
-    # 更新访问量
-    site.views += 1
-    
-    # 更新最后访问时间
-    site.last_view = datetime.utcnow()
-    
-    db.session.commit()
+    # 记录访问量和最后访问时间（由后台线程批量写入数据库）
+    visit_buffer.record(site.id)
     return redirect(site.url)
 
 @bp.route('/search')
+@conditional_get(link_data_generation, page=True)
 def search():
-    query = request.args.get('q', '')
+    # 搜索结果页中的表单以 query 参数提交
+    query = request.args.get('q') or request.args.get('query', '')
     if not query:
         return redirect(url_for('main.index'))
     
-    # 构建搜索查询
-    websites_query = Website.query.filter(
-        Website.title.contains(query) |
-        Website.description.contains(query) |
-        Website.url.contains(query)
-    )
-    
-    # 根据用户权限过滤私有链接
-    if not current_user.is_authenticated:
-        websites_query = websites_query.filter_by(is_private=False)
-    elif not current_user.is_admin:
-        websites_query = websites_query.filter(
-            (Website.is_private == False) |
-            (Website.created_by_id == current_user.id) |
-            (Website.visible_to.contains(str(current_user.id)))
-        )
-    
-    websites = websites_query.all()
+    # 全文索引搜索（按相关度排序），根据用户权限过滤私有链接
+    websites = search_websites(query, current_user)
+    # GET表单不需要CSRF令牌，避免为匿名访问者写入会话
+    form = SearchForm(query=query, meta={'csrf': False})
     return render_template('search.html', 
                          title='搜索结果', 
                          websites=websites, 
-                         query=query)
+                         query=query,
+                         form=form)
 
 # @bp.route('/about')
 # def about():
 #     return render_template('about.html', title='关于我们')
 
 @bp.route('/api/search')
+@conditional_get(link_data_generation)
 def api_search():
     query = request.args.get('q', '')
     if not query:
         return jsonify({"websites": []})
     
-    # 构建搜索查询
-    websites_query = Website.query.filter(
-        Website.title.contains(query) | 
-        Website.description.contains(query) | 
-        Website.url.contains(query)
-    )
-    
-    # 根据用户权限过滤私有链接
-    if not current_user.is_authenticated:
-        websites_query = websites_query.filter_by(is_private=False)
-    elif not current_user.is_admin:
-        websites_query = websites_query.filter(
-            (Website.is_private == False) |
-            (Website.created_by_id == current_user.id) |
-            (Website.visible_to.contains(str(current_user.id)))
-        )
-    
-    # 执行查询
-    websites = websites_query.all()
+    # 全文索引搜索（按相关度排序），根据用户权限过滤私有链接
+    websites = search_websites(query, current_user)
     
     # 将网站对象转换为JSON格式
     websites_data = []
@@ -225,7 +145,9 @@ def api_search():
             'description': site.description,
             'icon': site.icon,
             'category': category_data,
-            'is_private': site.is_private
+            'is_private': site.is_private,
+            'title_highlight': site.title_html,
+            'description_highlight': site.description_html
         })
     
     return jsonify({
@@ -234,6 +156,19 @@ def api_search():
         "keyword": query
     })
 
+@bp.route('/api/suggest')
+def api_suggest():
+    """搜索框输入提示，从进程内前缀索引返回访问量最高的链接"""
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    if not query:
+        return jsonify({"q": "", "items": []})
+    
+    return jsonify({
+        "q": query,
+        "items": suggest_index.suggest(query, current_user, limit)
+    })
+
 @bp.route('/api/website/<int:site_id>/update', methods=['POST'])
 @login_required
 def update_website(site_id):
@@ -285,6 +220,7 @@ def update_website(site_id):
         return jsonify({"success": False, "message": f"更新失败: {str(e)}"}), 500
 
 @bp.route('/site/<int:site_id>/info')
+@conditional_get(link_data_generation)
 def site_info(site_id):
     try:
         site = Website.query.get_or_404(site_id)
@@ -313,198 +249,15 @@ def site_info(site_id):
     except Exception as e:
         return jsonify({"success": False, "message": f"获取失败: {str(e)}"}), 500
 
-# 帮助解析网站信息的函数
-def parse_website_info(url):
-    try:
-        # 确保URL有协议前缀
-        processed_url = url
-        if not processed_url.startswith(('http://', 'https://')):
-            processed_url = 'https://' + processed_url
-            
-        # 添加超时和请求头以模拟浏览器
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-        }
-        response = requests.get(processed_url, headers=headers, timeout=10)
-        response.raise_for_status()  # 确保请求成功
-        
-        # 检测网页编码
-        content_type = response.headers.get('content-type', '').lower()
-        if 'charset=' in content_type:
-            charset = content_type.split('charset=')[-1]
-            response.encoding = charset
-        else:
-            # 尝试从网页内容中检测编码
-            content = response.content
-            soup = BeautifulSoup(content, 'html.parser')
-            meta_charset = soup.find('meta', charset=True)
-            if meta_charset:
-                response.encoding = meta_charset.get('charset')
-            else:
-                meta_content_type = soup.find('meta', {'http-equiv': lambda x: x and x.lower() == 'content-type'})
-                if meta_content_type and 'charset=' in meta_content_type.get('content', '').lower():
-                    charset = meta_content_type.get('content').lower().split('charset=')[-1]
-                    response.encoding = charset
-                elif 'charset=gb' in response.text.lower() or 'charset="gb' in response.text.lower():
-                    response.encoding = 'gb18030'
-                else:
-                    # 如果没有明确指定编码，尝试用 apparent_encoding
-                    response.encoding = response.apparent_encoding
-            
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 提取网站标题
-        title = ""
-        if soup.title:
-            title = soup.title.string.strip() if soup.title.string else ""
-        if not title:
-            h1 = soup.find('h1')
-            if h1:
-                title = h1.get_text().strip()
-        
-        # 提取描述信息
-        description = ""
-        meta_desc = soup.find('meta', attrs={'name': ['description', 'Description']})
-        if meta_desc and meta_desc.get('content'):
-            description = meta_desc.get('content').strip()
-        
-        # 如果没有描述标签，提取页面的第一段有意义的文字作为描述
-        if not description:
-            # 尝试查找第一个非空的p标签
-            for p in soup.find_all('p'):
-                text = p.get_text().strip()
-                if text and len(text) > 20:  # 确保文本有一定长度
-                    description = text
-                    break
-        
-        # 如果描述太长，截断
-        if description and len(description) > 200:
-            description = description[:197] + "..."
-            
-        return {
-            "success": True,
-            "title": title,
-            "description": description
-        }
-    except Exception as e:
-        print(f"解析网站信息出错: {str(e)}")  # 添加错误日志
-        return {
-            "success": False,
-            "message": str(e)
-        }
-
-# 获取网站图标的函数
-def get_website_icon(url):
-    try:
-        # 确保URL有协议前缀
-        processed_url = url
-        if not processed_url.startswith(('http://', 'https://')):
-            processed_url = 'http://' + processed_url
-        
-        # 使用小小API获取图标
-        headers = {
-            'User-Agent': 'xiaoxiaoapi/1.0.0 (https://xxapi.cn)'
-        }
-        
-        # 根据文档示例，完整URL作为参数
-        api_url = f"https://v2.xxapi.cn/api/ico?url={processed_url}"
-        
-        # 添加调试日志
-        print(f"请求小小API: {api_url}")
-        
-        # 发送请求获取响应
-        response = requests.get(api_url, headers=headers, timeout=5)
-        
-        # 打印原始响应内容，帮助调试
-        print(f"小小API响应: {response.text}")
-        
-        # 根据文档示例，尝试解析为JSON
-        try:
-            result = response.json()
-            # 从返回的JSON中获取data字段作为实际图标URL
-            if result.get('code') == 200 and 'data' in result:
-                print(f"成功获取图标URL: {result['data']}")
-                return {
-                    "success": True,
-                    "icon_url": result['data']
-                }
-            else:
-                # 如果API没有返回正确格式，记录错误信息
-                error_msg = result.get('msg', '无法获取图标')
-                print(f"小小API返回错误: {error_msg}")
-                # 备用方案：使用cccyun的favicon服务
-                parsed_url = urlparse(processed_url)
-                domain = parsed_url.netloc
-                return {
-                    "success": False,
-                    "message": error_msg,
-                    "fallback_url": f"https://favicon.cccyun.cc/{domain}"
-                }
-        except ValueError:
-            # 如果不是JSON格式，可能直接返回了图标URL（根据文档返回示例 `123`）
-            if response.status_code == 200 and response.text:
-                icon_url = response.text.strip()
-                if icon_url.startswith('http'):
-                    print(f"成功获取图标URL(纯文本): {icon_url}")
-                    return {
-                        "success": True,
-                        "icon_url": icon_url
-                    }
-        
-        # 如果以上都失败，使用备用图标
-        parsed_url = urlparse(processed_url)
-        domain = parsed_url.netloc
-        return {
-            "success": False,
-            "message": "无法解析API返回内容",
-            "fallback_url": f"https://favicon.cccyun.cc/{domain}"
-        }
-    except Exception as e:
-        print(f"获取网站图标出错: {str(e)}")
-        try:
-            parsed_url = urlparse(processed_url)
-            domain = parsed_url.netloc
-            return {
-                "success": False,
-                "message": str(e),
-                "fallback_url": f"https://favicon.cccyun.cc/{domain}"
-            }
-        except:
-            return {
-                "success": False,
-                "message": "URL解析失败",
-                "fallback_url": None
-            }
-
 @bp.route('/api/fetch_website_info')
 def fetch_website_info():
     url = request.args.get('url', '')
     if not url:
         return jsonify({"success": False, "message": "未提供URL参数"})
+    # refresh=1 时忽略缓存有效期重新获取
+    refresh = request.args.get('refresh') == '1'
     
-    # 获取网站信息
-    result = parse_website_info(url)
-    
-    # 添加图标信息
-    icon_result = get_website_icon(url)
-    if icon_result["success"]:
-        result["icon_url"] = icon_result["icon_url"]
-    elif "fallback_url" in icon_result:
-        result["icon_url"] = icon_result["fallback_url"]
-    
-    # 确保返回完整的数据结构
-    if result["success"]:
-        # 解析域名
-        processed_url = url
-        if not processed_url.startswith(('http://', 'https://')):
-            processed_url = 'https://' + processed_url
-        parsed_url = urlparse(processed_url)
-        domain = parsed_url.netloc
-        result["domain"] = domain
-        
-    return jsonify(result)
+    return jsonify(extract_site_info(url, refresh))
 
 @bp.route('/api/get_website_icon')
 def api_get_website_icon():
@@ -514,9 +267,53 @@ def api_get_website_icon():
         return jsonify({"success": False, "message": "未提供URL参数"})
     
     # 获取网站图标
-    result = get_website_icon(url)
+    result = get_website_icon(url, request.args.get('refresh') == '1')
     return jsonify(result)
 
+# 本进程上次提交图标本地化任务的时间，避免每个图标请求都写一次任务表
+_icon_localize_queued = {'at': 0}
+
+def queue_icon_localize():
+    """提交图标本地化任务，每个进程每 ICON_LOCALIZE_QUEUE_SECONDS 秒最多提交一次"""
+    now = time.time()
+    if now - _icon_localize_queued['at'] < current_app.config.get('ICON_LOCALIZE_QUEUE_SECONDS', 60):
+        return
+    _icon_localize_queued['at'] = now
+    try:
+        # 已有同类任务排队或运行时不会重复提交
+        enqueue_job('icon_localize')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f"提交图标本地化任务失败: {str(e)}")
+
+@bp.route('/icon/<int:website_id>')
+def website_icon(website_id):
+    """
+    尚未本地化的图标在页面中通过此地址请求
+
+    已本地化时跳转到本地文件；否则跳转到原地址，并提交后台任务把图标下载到本地，
+    不在请求中等待第三方地址的下载
+    """
+    website = Website.query.get_or_404(website_id)
+    if website.is_private and not current_user.is_authenticated:
+        abort(404)
+    icon = website.icon
+    if not is_remote_icon(icon):
+        if is_local_icon(icon):
+            response = redirect(icon)
+            # 本地文件地址不会变化，浏览器可以长期记住跳转
+            response.headers['Cache-Control'] = 'public, max-age=86400'
+            return response
+        abort(404)
+    
+    if current_app.config.get('ICON_LOCALIZE', True):
+        queue_icon_localize()
+    
+    response = redirect(icon)
+    # 原地址之后会被本地化，不缓存
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @bp.route('/api/website/update/<int:id>', methods=['POST'])
 @login_required
 def api_update_website(id):
@@ -779,14 +576,7 @@ def update_website_order():
         all_websites_query = Website.query.filter_by(category_id=category_id)
         
         # 根据用户权限过滤私有链接
-        if not current_user.is_authenticated:
-            all_websites_query = all_websites_query.filter_by(is_private=False)
-        elif not current_user.is_admin:
-            all_websites_query = all_websites_query.filter(
-                (Website.is_private == False) |
-                (Website.created_by_id == current_user.id) |
-                (Website.visible_to.contains(str(current_user.id)))
-            )
+        all_websites_query = Website.filter_visible(all_websites_query, current_user)
         
         all_websites = all_websites_query.all()
         total_websites = len(all_websites)
@@ -957,28 +747,8 @@ def search_in_category(category_id):
     # 获取该分类
     category = Category.query.get_or_404(category_id)
     
-    # 搜索该分类下的网站
-    websites = Website.query.filter(
-        Website.category_id == category_id,
-        or_(
-            Website.title.ilike(f'%{query}%'),
-            Website.description.ilike(f'%{query}%'),
-            Website.url.ilike(f'%{query}%')
-        )
-    )
-    
-    # 根据用户权限过滤私有链接
-    if not current_user.is_authenticated:
-        websites = websites.filter_by(is_private=False)
-    elif not current_user.is_admin:
-        websites = websites.filter(
-            (Website.is_private == False) |
-            (Website.created_by_id == current_user.id) |
-            (Website.visible_to.contains(str(current_user.id)))
-        )
-    
-    # 执行查询
-    websites = websites.order_by(Website.sort_order.desc(), Website.created_at.asc(), Website.views.desc()).all()
+    # 在该分类下进行全文索引搜索，根据用户权限过滤私有链接
+    websites = search_websites(query, current_user, category_id=category_id)
     
     result = []
     for site in websites:
@@ -989,7 +759,9 @@ def search_in_category(category_id):
             'description': site.description,
             'icon': site.icon,
             'sort_order': site.sort_order,
-            'is_private': site.is_private
+            'is_private': site.is_private,
+            'title_highlight': site.title_html,
+            'description_highlight': site.description_html
         })
     
     return jsonify({
@@ -1175,30 +947,30 @@ def goto(website_id):
     # 检查cookie中是否设置了不再显示
     if request.cookies.get('disableRedirect') == 'true':
         # 记录访问（无论是否登录都记录）
-        website.views += 1
-        website.last_view = datetime.utcnow()
-        db.session.commit()
+        visit_buffer.record(website.id)
         # 直接重定向到目标网站
         return redirect(website.url)
     
     # 获取网站设置
-    settings = SiteSettings.query.first()
+    settings = site_settings_cache.get()
     
     # 根据用户身份获取倒计时时间
-    if current_user.is_authenticated and current_user.is_admin:
+    is_admin = current_user.is_authenticated and current_user.is_admin
+    if is_admin:
         countdown = settings.admin_transition_time
     else:
         countdown = settings.transition_time
     
     # 记录访问（无论是否登录都记录）
-    website.views += 1
-    website.last_view = datetime.utcnow()
-    db.session.commit()
+    visit_buffer.record(website.id)
     
-    return render_template('transition.html',
+    etag_parts = ('goto', website.id, website.title, website.url, website.description,
+                  website.icon, website.views, site_settings_cache.version(), is_admin)
+    # 访问已经记录，过渡页本身只在链接或设置变化时重新渲染
+    return conditional_response(etag_parts, lambda: render_template('transition.html',
                          website=website,
                          countdown=countdown,
-                         settings=settings)
+                         settings=settings), shared=False)
 
 @bp.route('/api/fetch_website_info_with_progress')
 def fetch_website_info_with_progress():
@@ -1206,134 +978,35 @@ def fetch_website_info_with_progress():
     original_url = request.args.get('url', '')
     if not original_url:
         return jsonify({"success": False, "message": "未提供URL参数"})
+    # refresh=1 时忽略缓存有效期重新获取
+    refresh = request.args.get('refresh') == '1'
+    app = current_app._get_current_object()
+    events = Queue()
     
-    def generate():
+    def report(stage, progress, message):
+        events.put({"stage": stage, "progress": progress, "message": message})
+    
+    def run():
+        # 在后台线程中获取，生成器收到进度后立即发送给浏览器
         try:
-            # 开始连接
-            yield json.dumps({"stage": "init", "progress": 10, "message": "正在连接网站..."}) + "\n"
-            
-            # 准备请求头
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            }
-            
-            # 确保URL有协议前缀
-            processed_url = original_url
-            if not processed_url.startswith(('http://', 'https://')):
-                processed_url = 'https://' + processed_url
-                
-            # 发送请求
-            yield json.dumps({"stage": "connecting", "progress": 20, "message": "正在下载网页内容..."}) + "\n"
-            response = requests.get(processed_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            # 检测编码
-            yield json.dumps({"stage": "analyzing", "progress": 30, "message": "正在分析网页编码..."}) + "\n"
-            content_type = response.headers.get('content-type', '').lower()
-            if 'charset=' in content_type:
-                charset = content_type.split('charset=')[-1]
-                response.encoding = charset
-            else:
-                # 尝试从网页内容中检测编码
-                content = response.content
-                soup = BeautifulSoup(content, 'html.parser')
-                meta_charset = soup.find('meta', charset=True)
-                if meta_charset:
-                    response.encoding = meta_charset.get('charset')
-                else:
-                    meta_content_type = soup.find('meta', {'http-equiv': lambda x: x and x.lower() == 'content-type'})
-                    if meta_content_type and 'charset=' in meta_content_type.get('content', '').lower():
-                        charset = meta_content_type.get('content').lower().split('charset=')[-1]
-                        response.encoding = charset
-                    elif 'charset=gb' in response.text.lower() or 'charset="gb' in response.text.lower():
-                        response.encoding = 'gb18030'
-                    else:
-                        # 如果没有明确指定编码，尝试用 apparent_encoding
-                        response.encoding = response.apparent_encoding
-            
-            # 解析网页
-            yield json.dumps({"stage": "parsing", "progress": 40, "message": "正在解析网页内容..."}) + "\n"
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 提取网站标题
-            yield json.dumps({"stage": "extracting_title", "progress": 50, "message": "正在提取网站标题..."}) + "\n"
-            title = ""
-            if soup.title:
-                title = soup.title.string.strip() if soup.title.string else ""
-            if not title:
-                h1 = soup.find('h1')
-                if h1:
-                    title = h1.get_text().strip()
-            
-            # 提取描述信息
-            yield json.dumps({"stage": "extracting_description", "progress": 60, "message": "正在提取网站描述..."}) + "\n"
-            description = ""
-            meta_desc = soup.find('meta', attrs={'name': ['description', 'Description']})
-            if meta_desc and meta_desc.get('content'):
-                description = meta_desc.get('content').strip()
-            
-            # 如果没有描述标签，提取页面的第一段有意义的文字作为描述
-            if not description:
-                # 尝试查找第一个非空的p标签
-                for p in soup.find_all('p'):
-                    text = p.get_text().strip()
-                    if text and len(text) > 20:  # 确保文本有一定长度
-                        description = text
-                        break
-            
-            # 如果描述太长，截断
-            if description and len(description) > 200:
-                description = description[:197] + "..."
-            
-            # 获取网站图标
-            yield json.dumps({"stage": "extracting_icon", "progress": 70, "message": "正在获取网站图标..."}) + "\n"
-            
-            # 解析域名
-            parsed_url = urlparse(processed_url)
-            domain = parsed_url.netloc
-            
-            # 使用备用图标服务
-            icon_url = f"https://favicon.cccyun.cc/{domain}"
-            
-            # 尝试使用API获取更好的图标
-            yield json.dumps({"stage": "fetching_icon", "progress": 80, "message": "正在获取高质量图标..."}) + "\n"
-            try:
-                icon_result = get_website_icon(processed_url)
-                if icon_result["success"]:
-                    icon_url = icon_result["icon_url"]
-                elif "fallback_url" in icon_result:
-                    icon_url = icon_result["fallback_url"]
-            except Exception as e:
-                print(f"获取图标时出错: {str(e)}")
-                # 使用默认的图标URL，不影响整体流程
-            
-            # 最后，返回完整结果
-            yield json.dumps({
-                "stage": "complete", 
-                "progress": 100, 
-                "message": "网站信息获取完成",
-                "success": True,
-                "title": title,
-                "description": description,
-                "domain": domain,
-                "icon_url": icon_url
-            }) + "\n"
-            
+            with app.app_context():
+                result = extract_site_info(original_url, refresh, report)
         except Exception as e:
-            error_message = str(e)
-            print(f"获取网站信息出错: {error_message}")
-            yield json.dumps({
-                "stage": "error",
-                "progress": 0,
-                "message": f"错误: {error_message}",
-                "success": False,
-                "title": "",
-                "description": "",
-                "domain": "",
-                "icon_url": ""
-            }) + "\n"
+            result = {"success": False, "message": str(e), "title": "", "description": "",
+                      "domain": "", "icon_url": ""}
+        if result["success"]:
+            events.put(dict(result, stage="complete", progress=100, message="网站信息获取完成"))
+        else:
+            print(f"获取网站信息出错: {result['message']}")
+            events.put(dict(result, stage="error", progress=0, message=f"错误: {result['message']}"))
+    
+    def generate():
+        threading.Thread(target=run, name='site-info', daemon=True).start()
+        while True:
+            event = events.get()
+            yield json.dumps(event) + "\n"
+            if event["stage"] in ("complete", "error"):
+                break
     
     return Response(stream_with_context(generate()), 
                    mimetype='text/event-stream',
@@ -1341,6 +1014,7 @@ def fetch_website_info_with_progress():
                             'X-Accel-Buffering': 'no'}) 
 
 @bp.route('/api/category/<int:category_id>/count')
+@conditional_get(link_data_generation)
 def get_category_website_count(category_id):
     """获取分类下网站总数的API接口"""
     try:
@@ -1356,14 +1030,7 @@ def get_category_website_count(category_id):
         websites_query = Website.query.filter_by(category_id=category_id)
         
         # 根据用户权限过滤私有链接
-        if not current_user.is_authenticated:
-            websites_query = websites_query.filter_by(is_private=False)
-        elif not current_user.is_admin:
-            websites_query = websites_query.filter(
-                (Website.is_private == False) |
-                (Website.created_by_id == current_user.id) |
-                (Website.visible_to.contains(str(current_user.id)))
-            )
+        websites_query = Website.filter_visible(websites_query, current_user)
         
         total_count = websites_query.count()
         
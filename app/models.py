@@ -1,8 +1,10 @@
 from datetime import datetime
+import json
 import random
 import string
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy import or_
 from app import db, login_manager
 from config import Config
 
@@ -12,6 +14,13 @@ website_tag = db.Table('website_tag',
     db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
 )
 
+# 私有链接的可见用户关系表（取代 Website.visible_to 逗号分隔字符串）
+website_visibility = db.Table('website_visibility',
+    db.Column('website_id', db.Integer, db.ForeignKey('website.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_website_visibility_user_website', 'user_id', 'website_id')
+)
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True)
@@ -135,7 +144,9 @@ class Website(db.Model):
     
     # 私有链接相关字段
     is_private = db.Column(db.Boolean, default=False)
-    visible_to = db.Column(db.String(512), default='')  # 存储可见用户ID，用逗号分隔
+    visible_to = db.Column(db.String(512), default='')  # 旧字段：可见用户ID逗号分隔，仅用于迁移到 website_visibility
+    visible_users = db.relationship('User', secondary=website_visibility, lazy='dynamic',
+                                    backref=db.backref('shared_websites', lazy='dynamic'))
     
     # 统计相关字段
     views_today = db.Column(db.Integer, default=0)
@@ -163,11 +174,106 @@ class Website(db.Model):
             return True
             
         # 检查是否在可见用户列表中
-        if self.visible_to:
-            visible_user_ids = [int(id) for id in self.visible_to.split(',') if id]
-            return user.id in visible_user_ids
-            
-        return False 
+        return self.visible_users.filter(User.id == user.id).count() > 0
+
+    @classmethod
+    def filter_visible(cls, query, user):
+        """
+        按用户权限过滤私有链接
+
+        Args:
+            query: 包含Website的查询对象
+            user: 当前用户（可以是匿名用户）
+
+        Returns:
+            过滤后的查询对象
+        """
+        if not user.is_authenticated:
+            return query.filter(cls.is_private == False)
+        if user.is_admin:
+            return query
+        # 通过关系表的主键索引判断是否被授权查看
+        granted = db.session.query(website_visibility.c.website_id).filter(
+            website_visibility.c.website_id == cls.id,
+            website_visibility.c.user_id == user.id
+        ).exists()
+        return query.filter(or_(
+            cls.is_private == False,  # 公开的
+            cls.created_by_id == user.id,  # 自己创建的
+            granted  # 被授权查看的
+        ))
+
+
+class WebsitePinyin(db.Model):
+    """链接标题和描述的拼音检索数据，由 app.utils.pinyin_index 在写入链接时维护"""
+    __tablename__ = 'website_pinyin'
+    website_id = db.Column(db.Integer, db.ForeignKey('website.id', ondelete='CASCADE'), primary_key=True)
+    title_pinyin = db.Column(db.String(512), index=True)  # 全拼，如 百度一下 -> baiduyixia
+    title_initials = db.Column(db.String(128), index=True)  # 首字母，如 百度一下 -> bdyx
+    description_pinyin = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<WebsitePinyin {self.website_id}>'
+
+
+class WebsiteVisitStat(db.Model):
+    """链接按天的访问量，由 app.utils.visits 批量写入"""
+    __tablename__ = 'website_visit_stats'
+    website_id = db.Column(db.Integer, db.ForeignKey('website.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    # 按时间窗口统计时只需扫描该索引
+    __table_args__ = (
+        db.Index('ix_website_visit_stats_day_website', 'day', 'website_id', 'count'),
+    )
+
+    def __repr__(self):
+        return f'<WebsiteVisitStat {self.website_id} {self.day}: {self.count}>'
+
+
+class WebsiteCheckState(db.Model):
+    """链接的死链检测计划，由 app.utils.deadlink 在保存检测结果时更新"""
+    __tablename__ = 'website_check_state'
+    website_id = db.Column(db.Integer, db.ForeignKey('website.id', ondelete='CASCADE'), primary_key=True)
+    failures = db.Column(db.Integer, nullable=False, default=0)  # 连续检测失败的次数
+    next_check_at = db.Column(db.DateTime, index=True)  # 下次需要检测的时间
+
+    def __repr__(self):
+        return f'<WebsiteCheckState {self.website_id}: {self.next_check_at}>'
+
+
+def backfill_website_visibility():
+    """
+    将旧的 visible_to 字符串同步到 website_visibility 关系表
+
+    仅在关系表为空且存在旧数据时执行，用于升级和导入旧数据库之后。
+
+    Returns:
+        int: 写入的授权记录数量
+    """
+    if db.session.query(website_visibility).first() is not None:
+        return 0
+
+    legacy_rows = db.session.query(Website.id, Website.visible_to).filter(
+        Website.visible_to.isnot(None),
+        Website.visible_to != ''
+    ).all()
+    if not legacy_rows:
+        return 0
+
+    user_ids = {user_id for (user_id,) in db.session.query(User.id).all()}
+    grants = []
+    for website_id, visible_to in legacy_rows:
+        for value in set(visible_to.split(',')):
+            value = value.strip()
+            if value.isdigit() and int(value) in user_ids:
+                grants.append({'website_id': website_id, 'user_id': int(value)})
+
+    if grants:
+        db.session.execute(website_visibility.insert(), grants)
+    db.session.commit()
+    return len(grants)
 
 
 class SiteSettings(db.Model):
@@ -271,6 +377,72 @@ class OperationLog(db.Model):
         return f'<OperationLog {self.operation_type} - {self.website_title}>'
 
 
+class Job(db.Model):
+    """后台任务，由 app.utils.jobs 的任务进程执行，进度保存在数据库中供所有进程读取"""
+    __tablename__ = 'job'
+    __table_args__ = (db.Index('ix_job_kind_state', 'kind', 'state'),)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)  # 任务类型: deadlink, icon_fetch, import, backup
+    state = db.Column(db.String(16), nullable=False, default='pending', index=True)  # pending, running, done, failed, cancelled
+    params = db.Column(db.Text)  # 任务参数，JSON格式
+    checkpoint = db.Column(db.Text)  # 任务进度检查点，JSON格式，任务进程异常退出后从这里继续
+    total = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    success = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.Text)  # 任务结果或错误信息
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # 被任务进程领取执行的次数
+    worker = db.Column(db.String(64))  # 正在执行的任务进程
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+
+    created_by = db.relationship('User')
+
+    @property
+    def params_data(self):
+        return json.loads(self.params) if self.params else {}
+
+    @property
+    def checkpoint_data(self):
+        return json.loads(self.checkpoint) if self.checkpoint else {}
+
+    @property
+    def is_active(self):
+        return self.state in ('pending', 'running')
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.state}>'
+
+
+class UrlMetadata(db.Model):
+    """
+    网站信息缓存，由 app.utils.metadata_cache 读写
+
+    kind 为 page 时 key 是规范化的网址，保存标题、描述和重新验证用的 ETag/Last-Modified；
+    kind 为 icon 时 key 是 icon:<域名>，保存图标API返回的图标地址
+    """
+    __tablename__ = 'url_metadata'
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(512), nullable=False, unique=True)
+    kind = db.Column(db.String(8), nullable=False)  # page, icon
+    domain = db.Column(db.String(255), index=True)
+    title = db.Column(db.String(256))
+    description = db.Column(db.Text)
+    icon_url = db.Column(db.String(512))
+    charset = db.Column(db.String(32))
+    etag = db.Column(db.String(256))
+    last_modified = db.Column(db.String(64))
+    fetched_at = db.Column(db.DateTime, nullable=False)  # 最近一次从网站取得或重新验证的时间
+    used_at = db.Column(db.DateTime, nullable=False, index=True)  # 最近一次使用的时间，超出数量上限时先删除最久未用的
+
+    def __repr__(self):
+        return f'<UrlMetadata {self.kind} {self.key}>'
+
+
 class DeadlinkCheck(db.Model):
     """死链检测记录模型"""
     id = db.Column(db.Integer, primary_key=True)
@@ -115,7 +115,9 @@ document.addEventListener("DOMContentLoaded", function () {
       const cardDesc = window.currentCard
         .querySelector(".site-description")
         .textContent.trim();
-      const cardIcon = window.currentCard.querySelector(".site-icon img");
+      const cardIcon = window.currentCard.querySelector(
+        ".site-icon img, .site-icon .icon-sprite"
+      );
 
       // 获取排序权重值 - 优先使用data-sort-order，不存在则使用data-sort
       let sortOrder = window.currentCard.getAttribute("data-sort-order");
@@ -135,9 +137,11 @@ document.addEventListener("DOMContentLoaded", function () {
       }
 
       if (cardIcon) {
-        document.getElementById("editIcon").value = cardIcon.src;
+        // 页面中显示的可能是本站的图标代理地址，编辑时使用保存的原始图标地址
+        const iconValue = cardIcon.getAttribute("data-icon") || cardIcon.src;
+        document.getElementById("editIcon").value = iconValue;
         // 更新图标预览
-        editIconPreview.src = cardIcon.src;
+        editIconPreview.src = cardIcon.src || iconValue;
         editIconPreview.style.display = "block";
       } else {
         document.getElementById("editIcon").value = "";
@@ -331,7 +335,9 @@ document.addEventListener("DOMContentLoaded", function () {
         if (window.currentCard) {
           const titleEl = window.currentCard.querySelector(".site-title");
           const descEl = window.currentCard.querySelector(".site-description");
-          const iconImg = window.currentCard.querySelector(".site-icon img");
+          const iconImg = window.currentCard.querySelector(
+            ".site-icon img, .site-icon .icon-sprite"
+          );
           const iconContainer = window.currentCard.querySelector(".site-icon");
 
           if (titleEl) titleEl.textContent = title.trim();
@@ -339,11 +345,12 @@ document.addEventListener("DOMContentLoaded", function () {
 
           // 更新图标
           if (icon) {
-            if (iconImg) {
+            if (iconImg && iconImg.tagName === "IMG") {
               iconImg.src = icon;
+              iconImg.setAttribute("data-icon", icon);
             } else {
               // 如果之前没有图标，创建一个
-              iconContainer.innerHTML = `<img src="${icon}" alt="${title}">`;
+              iconContainer.innerHTML = `<img src="${icon}" data-icon="${icon}" alt="${title}">`;
             }
           } else if (iconImg) {
             // 如果清除了图标，显示默认图标（使用网站标题首字母）
@@ -92,12 +92,21 @@ document.addEventListener("DOMContentLoaded", function () {
 
               const titleEl = document.createElement("h5");
               titleEl.className = "site-title";
-              titleEl.textContent = site.title;
+              // 高亮字段已由服务端转义，只包含<mark>标签
+              if (site.title_highlight) {
+                titleEl.innerHTML = site.title_highlight;
+              } else {
+                titleEl.textContent = site.title;
+              }
               textContainer.appendChild(titleEl);
 
               const descEl = document.createElement("p");
               descEl.className = "site-description";
-              descEl.textContent = site.description || "";
+              if (site.description_highlight) {
+                descEl.innerHTML = site.description_highlight;
+              } else {
+                descEl.textContent = site.description || "";
+              }
               textContainer.appendChild(descEl);
 
               // 组装卡片结构
@@ -148,6 +157,117 @@ document.addEventListener("DOMContentLoaded", function () {
         clearSearch();
       }
     }
+    scheduleSuggest();
+  });
+
+  // 输入提示：请求轻量的 /api/suggest，只在提交时才执行完整搜索
+  const suggestBox = document.createElement("div");
+  suggestBox.className = "search-suggestions";
+  suggestBox.style.display = "none";
+  searchForm.appendChild(suggestBox);
+
+  let suggestTimer = null;
+  let suggestRequestId = 0;
+  let activeSuggestIndex = -1;
+
+  function scheduleSuggest() {
+    clearTimeout(suggestTimer);
+    suggestTimer = setTimeout(fetchSuggestions, 80);
+  }
+
+  function hideSuggestions() {
+    suggestBox.style.display = "none";
+    suggestBox.innerHTML = "";
+    activeSuggestIndex = -1;
+  }
+
+  function fetchSuggestions() {
+    const query = searchInput.value.trim();
+    if (!query) {
+      hideSuggestions();
+      return;
+    }
+    const requestId = ++suggestRequestId;
+    fetch(`/api/suggest?q=${encodeURIComponent(query)}`)
+      .then((response) => response.json())
+      .then((data) => {
+        // 忽略已经过时的响应
+        if (requestId !== suggestRequestId) return;
+        renderSuggestions(data.items || []);
+      })
+      .catch(() => hideSuggestions());
+  }
+
+  function renderSuggestions(items) {
+    suggestBox.innerHTML = "";
+    activeSuggestIndex = -1;
+    if (items.length === 0) {
+      suggestBox.style.display = "none";
+      return;
+    }
+    items.forEach((item) => {
+      const link = document.createElement("a");
+      link.className = "search-suggestion-item";
+      link.href = `/site/${item.id}`;
+      link.target = "_blank";
+
+      if (item.icon) {
+        const img = document.createElement("img");
+        img.src = item.icon;
+        img.alt = "";
+        link.appendChild(img);
+      } else {
+        const defaultIcon = document.createElement("span");
+        defaultIcon.className = "search-suggestion-letter";
+        defaultIcon.textContent = (item.title || "?").charAt(0).toUpperCase();
+        link.appendChild(defaultIcon);
+      }
+
+      const title = document.createElement("span");
+      title.className = "search-suggestion-title";
+      title.textContent = item.title;
+      link.appendChild(title);
+
+      const domain = document.createElement("span");
+      domain.className = "search-suggestion-domain";
+      domain.textContent = item.domain || "";
+      link.appendChild(domain);
+
+      link.addEventListener("click", hideSuggestions);
+      suggestBox.appendChild(link);
+    });
+    suggestBox.style.display = "block";
+  }
+
+  function highlightSuggestion(index) {
+    const items = suggestBox.querySelectorAll(".search-suggestion-item");
+    if (items.length === 0) return;
+    activeSuggestIndex = (index + items.length) % items.length;
+    items.forEach((item, i) =>
+      item.classList.toggle("active", i === activeSuggestIndex)
+    );
+  }
+
+  searchInput.addEventListener("keydown", function (e) {
+    if (suggestBox.style.display === "none") return;
+    if (e.key === "ArrowDown") {
+      e.preventDefault();
+      highlightSuggestion(activeSuggestIndex + 1);
+    } else if (e.key === "ArrowUp") {
+      e.preventDefault();
+      highlightSuggestion(activeSuggestIndex - 1);
+    } else if (e.key === "Enter" && activeSuggestIndex >= 0) {
+      e.preventDefault();
+      suggestBox.querySelectorAll(".search-suggestion-item")[activeSuggestIndex].click();
+    } else if (e.key === "Escape") {
+      hideSuggestions();
+    }
+  });
+
+  // 提交搜索或点击其他区域时收起提示
+  searchForm.addEventListener("submit", hideSuggestions);
+  document.addEventListener("click", function (e) {
+    if (!searchForm.contains(e.target)) hideSuggestions();
   });
 
   // 检查初始状态下是否应该显示清除按钮
@@ -169,6 +289,7 @@ document.addEventListener("DOMContentLoaded", function () {
   // 清除搜索
   function clearSearch() {
     searchInput.value = "";
+    hideSuggestions();
     clearSearchBtn.style.display = "none";
     searchResults.style.display = "none";
     categoriesContainer.style.display = "block";
@@ -0,0 +1,378 @@
+"""
+备份存储模块
+备份不再各自保存为完整的 .db3 文件，而是按数据库页对齐切分为 BACKUP_CHUNK_SIZE 大小的块，
+每块按内容的SHA-256去重、gzip压缩后保存在 backups/store/chunks/ 下；每个备份只保存一份清单
+（backups/store/manifests/<文件名>.json），记录按顺序组成数据库文件的块。
+相邻两次备份之间没有变化的页会得到相同的块，新备份只增加变化部分的块，
+占用空间随数据的变化量而不是备份次数增长。
+
+清单的第一行是备份的文件名、大小、时间等信息，第二行是块列表，备份列表只读取第一行。
+早期直接保存在 backups/ 下的 .db3 文件仍然可以使用，清理备份时会转存到这里。
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from flask import current_app
+from app.utils.db_backup import backup_database
+
+CHUNK_EXT = '.gz'
+
+# 备份目录中临时文件的后缀（还原、导出用），不会出现在备份列表中
+TEMP_SUFFIX = '.db3.tmp'
+
+# SQLite数据库文件头，其后第16、17字节是页大小（大端，1表示65536）
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+
+def backup_dir():
+    return os.path.join(current_app.root_path, 'backups')
+
+
+def _store_dir():
+    return os.path.join(backup_dir(), 'store')
+
+
+def _manifest_path(name):
+    return os.path.join(_store_dir(), 'manifests', f'{name}.json')
+
+
+def _chunk_path(digest):
+    return os.path.join(_store_dir(), 'chunks', digest[:2], digest + CHUNK_EXT)
+
+
+def is_valid_name(name):
+    """备份文件名不能包含路径"""
+    return bool(name) and os.path.sep not in name and '/' not in name and '..' not in name
+
+
+def _page_size(path):
+    with open(path, 'rb') as f:
+        header = f.read(18)
+    if not header.startswith(SQLITE_HEADER):
+        return None
+    size = int.from_bytes(header[16:18], 'big')
+    return 65536 if size == 1 else size
+
+
+def _chunk_size(path):
+    """块大小取 BACKUP_CHUNK_SIZE 向下对齐到页大小的整数倍，同一页的修改只影响一个块"""
+    chunk_size = current_app.config.get('BACKUP_CHUNK_SIZE', 64 * 1024)
+    page_size = _page_size(path)
+    if page_size:
+        chunk_size = max(page_size, chunk_size // page_size * page_size)
+    return chunk_size
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def _put_chunk(data):
+    """
+    保存一个块
+
+    Returns:
+        tuple: (块的哈希, 新写入的字节数)；块已存在时只更新修改时间，新写入字节数为0
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = _chunk_path(digest)
+    if os.path.exists(path):
+        # 更新修改时间，避免正在被引用的块被同时进行的清理删除
+        os.utime(path)
+        return digest, 0
+    compressed = gzip.compress(data, compresslevel=6, mtime=0)
+    _write_atomic(path, compressed)
+    return digest, len(compressed)
+
+
+def store_snapshot(path, name, created=None):
+    """
+    把数据库文件保存到备份存储
+
+    Args:
+        path: 数据库文件（应是一致的快照，如 backup_database 的结果）
+        name: 备份文件名
+        created: 备份时间戳，默认为当前时间
+
+    Returns:
+        dict: 清单信息（filename、size、time、sha256、stored 等）
+    """
+    chunk_size = _chunk_size(path)
+    chunks = []
+    size = 0
+    stored = 0
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            digest, written = _put_chunk(data)
+            chunks.append(digest)
+            size += len(data)
+            stored += written
+            file_hash.update(data)
+    info = {
+        'filename': name,
+        'size': size,
+        'time': created or time.time(),
+        'sha256': file_hash.hexdigest(),
+        'chunk_size': chunk_size,
+        'stored': stored
+    }
+    content = json.dumps(info, ensure_ascii=False) + '\n' + json.dumps(chunks) + '\n'
+    _write_atomic(_manifest_path(name), content.encode('utf-8'))
+    return info
+
+
+def create_temp_file():
+    """
+    在备份目录中创建临时文件，返回其路径，由调用方负责删除
+
+    进程异常退出时遗留的临时文件由 prune_backups 清理
+    """
+    os.makedirs(backup_dir(), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix=TEMP_SUFFIX, dir=backup_dir())
+    os.close(fd)
+    return temp_path
+
+
+def create_backup(name):
+    """
+    备份当前数据库到备份存储
+
+    Returns:
+        dict: 清单信息
+    """
+    temp_path = create_temp_file()
+    try:
+        backup_database(temp_path)
+        return store_snapshot(temp_path, name)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+def _read_manifest(name, with_chunks=False):
+    with open(_manifest_path(name), 'r', encoding='utf-8') as f:
+        info = json.loads(f.readline())
+        if with_chunks:
+            info['chunks'] = json.loads(f.readline())
+    return info
+
+
+def snapshot_info(name):
+    """备份的清单信息，不存在时返回 None"""
+    if not is_valid_name(name):
+        return None
+    try:
+        return _read_manifest(name)
+    except (OSError, ValueError):
+        return None
+
+
+def _legacy_path(name):
+    return os.path.join(backup_dir(), name)
+
+
+def _legacy_backups():
+    directory = backup_dir()
+    if not os.path.isdir(directory):
+        return []
+    return [filename for filename in os.listdir(directory)
+            if filename.endswith('.db3') and os.path.isfile(os.path.join(directory, filename))]
+
+
+def list_backups():
+    """
+    所有备份，按时间从新到旧排序
+
+    Returns:
+        list: 清单信息（filename、size、time，早期的 .db3 文件 stored 为 None）
+    """
+    backups = []
+    manifest_dir = os.path.join(_store_dir(), 'manifests')
+    if os.path.isdir(manifest_dir):
+        for filename in os.listdir(manifest_dir):
+            if not filename.endswith('.json'):
+                continue
+            info = snapshot_info(filename[:-len('.json')])
+            if info is not None:
+                backups.append(info)
+    for filename in _legacy_backups():
+        info = backup_info(filename)
+        if info is not None:
+            backups.append(info)
+    backups.sort(key=lambda x: x['time'], reverse=True)
+    return backups
+
+
+def backup_info(name):
+    """备份的信息（filename、size、time），不存在时返回 None"""
+    info = snapshot_info(name)
+    if info is not None or not is_valid_name(name):
+        return info
+    try:
+        stats = os.stat(_legacy_path(name))
+    except OSError:
+        return None
+    return {'filename': name, 'size': stats.st_size, 'time': stats.st_mtime, 'stored': None}
+
+
+def backup_exists(name):
+    return backup_info(name) is not None
+
+
+def iter_backup(name, block_size=64 * 1024):
+    """
+    按顺序读取备份文件的内容，内存占用与备份大小无关
+
+    从备份存储读取时校验每个块和整个文件的哈希，不一致时抛出 ValueError
+    """
+    if snapshot_info(name) is None:
+        with open(_legacy_path(name), 'rb') as f:
+            while True:
+                data = f.read(block_size)
+                if not data:
+                    return
+                yield data
+    info = _read_manifest(name, with_chunks=True)
+    file_hash = hashlib.sha256()
+    for digest in info['chunks']:
+        with open(_chunk_path(digest), 'rb') as f:
+            data = gzip.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"备份数据块已损坏: {digest}")
+        file_hash.update(data)
+        yield data
+    if file_hash.hexdigest() != info['sha256']:
+        raise ValueError(f"备份文件校验失败: {name}")
+
+
+@contextmanager
+def backup_file(name):
+    """
+    得到备份的数据库文件路径，用于恢复、上传等需要完整文件的操作
+
+    备份存储中的备份先还原到临时文件，退出时删除
+    """
+    if snapshot_info(name) is None:
+        yield _legacy_path(name)
+        return
+    os.makedirs(backup_dir(), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix=TEMP_SUFFIX, dir=backup_dir())
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for data in iter_backup(name):
+                f.write(data)
+        yield temp_path
+    finally:
+        os.unlink(temp_path)
+
+
+def remove_backup(name):
+    """删除备份；备份存储中的块在 collect_garbage 时才删除"""
+    if snapshot_info(name) is not None:
+        os.remove(_manifest_path(name))
+    else:
+        os.remove(_legacy_path(name))
+
+
+def import_legacy_backups():
+    """
+    把早期直接保存在 backups/ 下的 .db3 文件转存到备份存储，保留原来的修改时间作为备份时间
+
+    Returns:
+        int: 转存的文件数
+    """
+    count = 0
+    for filename in _legacy_backups():
+        path = _legacy_path(filename)
+        if snapshot_info(filename) is None:
+            store_snapshot(path, filename, created=os.path.getmtime(path))
+        os.remove(path)
+        count += 1
+    return count
+
+
+def collect_garbage(min_age=3600):
+    """
+    删除没有被任何清单引用的块
+
+    Args:
+        min_age: 只删除修改时间早于这么多秒之前的块，避免删掉正在保存、清单还未写入的备份用到的块
+
+    Returns:
+        tuple: (删除的块数, 释放的字节数)
+    """
+    referenced = set()
+    manifest_dir = os.path.join(_store_dir(), 'manifests')
+    if os.path.isdir(manifest_dir):
+        for filename in os.listdir(manifest_dir):
+            if filename.endswith('.json'):
+                try:
+                    referenced.update(_read_manifest(filename[:-len('.json')], with_chunks=True)['chunks'])
+                except (OSError, ValueError):
+                    # 无法读取的清单：不清理，避免误删
+                    return 0, 0
+    chunk_root = os.path.join(_store_dir(), 'chunks')
+    if not os.path.isdir(chunk_root):
+        return 0, 0
+    removed = 0
+    freed = 0
+    cutoff = time.time() - min_age
+    for bucket in os.listdir(chunk_root):
+        bucket_dir = os.path.join(chunk_root, bucket)
+        if not os.path.isdir(bucket_dir):
+            continue
+        for filename in os.listdir(bucket_dir):
+            if filename[:-len(CHUNK_EXT)] in referenced:
+                continue
+            path = os.path.join(bucket_dir, filename)
+            try:
+                stats = os.stat(path)
+                if stats.st_mtime < cutoff:
+                    os.remove(path)
+                    removed += 1
+                    freed += stats.st_size
+            except OSError:
+                pass
+    return removed, freed
+
+
+def prune_backups(keep):
+    """
+    只保留最新的 keep 个备份，并删除不再被引用的块
+
+    Returns:
+        int: 删除的备份数
+    """
+    import_legacy_backups()
+    expired = list_backups()[keep:]
+    for info in expired:
+        remove_backup(info['filename'])
+    collect_garbage()
+    _remove_stale_temp_files()
+    return len(expired)
+
+
+def _remove_stale_temp_files(max_age=86400):
+    """删除进程异常退出时遗留的临时文件"""
+    cutoff = time.time() - max_age
+    for filename in os.listdir(backup_dir()):
+        if filename.endswith(TEMP_SUFFIX):
+            path = os.path.join(backup_dir(), filename)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,138 @@
+"""
+缓存失效工具模块
+通过共享目录中的版本号文件，让多个gunicorn worker看到一致的缓存状态
+"""
+
+import os
+import uuid
+from types import SimpleNamespace
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+
+class DataGeneration:
+    """
+    保存在文件中的数据版本号
+
+    每次数据变更后写入一个新的随机版本号；各个worker读取该文件即可判断
+    本进程的缓存是否过期，读取本身不产生任何SQL查询。
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def _path(self):
+        state_dir = current_app.config['CACHE_STATE_DIR']
+        return os.path.join(state_dir, f'{self.name}.generation')
+
+    def current(self):
+        """获取当前版本号，文件不存在时返回'0'"""
+        try:
+            with open(self._path(), 'r') as f:
+                return f.read().strip() or '0'
+        except FileNotFoundError:
+            return '0'
+
+    def bump(self):
+        """写入新的版本号，使所有worker中的相关缓存失效"""
+        path = self._path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(uuid.uuid4().hex)
+            # 原子替换，避免其他worker读到写了一半的文件
+            os.replace(temp_path, path)
+        except OSError as e:
+            current_app.logger.error(f"更新缓存版本号失败({self.name}): {str(e)}")
+
+
+# 链接/分类数据的版本号（首页缓存等依赖它）
+link_data_generation = DataGeneration('links')
+
+# 站点设置的版本号（站点设置缓存和页面ETag依赖它）
+site_settings_generation = DataGeneration('settings')
+
+# 这些字段只记录访问统计和检测状态，变化时不需要让首页缓存失效
+WEBSITE_STAT_FIELDS = {'views', 'views_today', 'last_view', 'is_valid', 'last_check'}
+
+
+def snapshot(obj, **extra):
+    """把ORM对象复制为与数据库会话无关的普通对象，便于跨请求缓存"""
+    values = {column.key: getattr(obj, column.key) for column in obj.__mapper__.column_attrs}
+    values.update(extra)
+    return SimpleNamespace(**values)
+
+
+def _touches_link_data(session):
+    """判断本次flush是否修改了会影响首页展示的链接或分类数据"""
+    from app.models import Category, Website
+
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, (Website, Category)):
+            return True
+
+    for obj in session.dirty:
+        if isinstance(obj, Category) and session.is_modified(obj):
+            return True
+        if isinstance(obj, Website):
+            changed = {
+                attr.key for attr in inspect(obj).attrs
+                if attr.history.has_changes()
+            }
+            if changed - WEBSITE_STAT_FIELDS:
+                return True
+    return False
+
+
+@event.listens_for(Session, 'after_flush')
+def _mark_link_data_changed(session, flush_context):
+    if not session.info.get('link_data_changed') and _touches_link_data(session):
+        session.info['link_data_changed'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _mark_bulk_link_data_changed(orm_execute_state):
+    """Query.delete() / Query.update() 等批量操作不会触发flush事件，需要单独处理"""
+    from app.models import Category, Website
+
+    if not (orm_execute_state.is_delete or orm_execute_state.is_update):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in (Website, Category):
+        orm_execute_state.session.info['link_data_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_after_commit(session):
+    if session.info.pop('link_data_changed', False):
+        link_data_generation.bump()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_after_rollback(session):
+    session.info.pop('link_data_changed', None)
+
+
+@event.listens_for(Session, 'after_flush')
+def _mark_site_settings_changed(session, flush_context):
+    from app.models import SiteSettings
+
+    if session.info.get('site_settings_changed'):
+        return
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, SiteSettings) and (obj not in session.dirty or session.is_modified(obj)):
+            session.info['site_settings_changed'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_site_settings_after_commit(session):
+    if session.info.pop('site_settings_changed', False):
+        site_settings_generation.bump()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_site_settings_after_rollback(session):
+    session.info.pop('site_settings_changed', None)
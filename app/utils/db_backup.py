@@ -0,0 +1,109 @@
+"""
+数据库备份模块
+用SQLite的在线备份接口复制数据库，而不是直接复制文件：数据库使用WAL模式，已提交的数据可能还在
+-wal 文件中，直接复制 app.db 会丢失这些数据，复制过程中有写入时还会得到损坏的文件。
+备份按 BACKUP_STEP_PAGES 页分步复制，每步之间释放读锁，写入和检查点可以继续进行；
+复制过程中数据库被修改时SQLite会从头重新复制，得到的始终是某一时刻的一致快照。
+"""
+
+import os
+import sqlite3
+from flask import current_app
+
+# 分步复制被写入打断重来超过这么多次后，改为一次复制完成
+BACKUP_MAX_RESTARTS = 3
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def database_path():
+    """当前使用的SQLite数据库文件的绝对路径"""
+    db_path = current_app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
+    # 数据库路径可能是相对路径，需要转换为绝对路径
+    if not os.path.isabs(db_path):
+        db_path = os.path.join(current_app.root_path, db_path)
+    return db_path
+
+
+def _copy_pages(source, target, pages, sleep):
+    """分步复制，被写入打断重来的次数过多时抛出 _BackupRestarted"""
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        # 剩余页数变多说明数据库被修改，SQLite从头重新复制
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        state['remaining'] = remaining
+
+    source.backup(target, pages=pages, progress=progress, sleep=sleep)
+
+
+def backup_database(dest_path, source_path=None):
+    """
+    把数据库的一致快照保存到 dest_path
+
+    先写入临时文件，完成后再替换目标文件，备份列表和清理脚本不会看到写了一半的文件。
+    备份文件使用 DELETE 日志模式，是不依赖 -wal 文件的单个文件，可以直接下载或导入。
+
+    Args:
+        dest_path: 备份文件路径
+        source_path: 要备份的数据库，默认为当前使用的数据库
+
+    Returns:
+        int: 备份文件的字节数
+    """
+    source_path = source_path or database_path()
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(f"找不到数据库文件: {source_path}")
+    pages = current_app.config.get('BACKUP_STEP_PAGES', 1024)
+    sleep = current_app.config.get('BACKUP_STEP_SLEEP', 0.01)
+
+    temp_path = f"{dest_path}.{os.getpid()}.tmp"
+    source = sqlite3.connect(source_path)
+    try:
+        target = sqlite3.connect(temp_path)
+        try:
+            try:
+                _copy_pages(source, target, pages, sleep)
+            except _BackupRestarted:
+                # 写入频繁时一次复制完成；WAL模式下这只占用一个读事务，不阻塞写入
+                current_app.logger.info("数据库备份多次被写入打断，改为一次复制")
+                source.backup(target)
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    finally:
+        source.close()
+    os.replace(temp_path, dest_path)
+    return os.path.getsize(dest_path)
+
+
+def restore_database(backup_path, db_path=None):
+    """
+    用备份文件的内容替换数据库
+
+    通过备份接口在一个写事务中写入，其他连接看到的要么是恢复前、要么是恢复后的完整数据，
+    不会像覆盖文件那样和残留的 -wal 文件混在一起导致数据库损坏。
+
+    Args:
+        backup_path: 备份文件路径
+        db_path: 要替换的数据库，默认为当前使用的数据库
+    """
+    db_path = db_path or database_path()
+    source = sqlite3.connect(backup_path)
+    try:
+        target = sqlite3.connect(db_path, timeout=30)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
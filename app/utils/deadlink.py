@@ -0,0 +1,514 @@
+"""
+死链检测模块
+基于asyncio的链接检测引擎：全局并发上限、按主机限制并发、keep-alive连接复用、
+DNS解析结果缓存，HEAD请求失败时改用只取前1KB的Range GET请求；
+检测结果按批次写入数据库，并按每个链接的检测结果安排下次检测时间
+"""
+
+import asyncio
+import socket
+import ssl
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urljoin, urlsplit
+from flask import current_app
+from sqlalchemy import and_, bindparam, or_
+from sqlalchemy.dialects.sqlite import insert
+from app import db
+from app.models import DeadlinkCheck, Website, WebsiteCheckState
+
+CHECK_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Pragma': 'no-cache',
+    'Cache-Control': 'no-cache'
+}
+
+# 与 requests 的默认值保持一致
+MAX_REDIRECTS = 30
+
+# Range GET 只读取这么多字节
+RANGE_BYTES = 1024
+
+# 不超过该大小的响应体会被读完，以便连接继续复用（主要是重定向响应）
+MAX_DRAIN_BYTES = 64 * 1024
+
+# 空闲连接的最长保留时间（秒）
+IDLE_TIMEOUT = 30
+
+# 与原先逐个检测时的判断一致：401/403 表示网站正常但访问受限
+ACCESS_DENIED_CODES = (401, 403)
+
+
+class CheckError(Exception):
+    """检测失败，error_type/error_message 与结果中的字段对应"""
+
+    def __init__(self, error_type, error_message):
+        super().__init__(error_message)
+        self.error_type = error_type
+        self.error_message = error_message
+
+
+class _StaleConnection(Exception):
+    """复用的空闲连接已被服务器关闭，需要换一个新连接重试"""
+
+
+def is_valid_status(status_code):
+    """2xx和3xx状态码表示链接有效，某些4xx只是访问受限"""
+    return 200 <= status_code < 400 or status_code in ACCESS_DENIED_CODES
+
+
+def _create_ssl_context():
+    # 与原先 verify=False 一致，只检测网站能否访问，不校验证书
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.idle_since = time.monotonic()
+
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class _Response:
+    def __init__(self, status_code, headers, reusable):
+        self.status_code = status_code
+        self.headers = headers
+        self.reusable = reusable
+
+
+class LinkChecker:
+    """
+    异步链接检测器
+
+    Args:
+        concurrency: 同时检测的链接数量上限
+        per_host: 同一主机同时进行的请求数量上限
+        timeout: 单个请求的超时时间（秒）
+        dns_ttl: DNS解析结果的缓存时间（秒）
+    """
+
+    def __init__(self, concurrency=50, per_host=4, timeout=15, dns_ttl=300):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.dns_ttl = dns_ttl
+        self._ssl_context = _create_ssl_context()
+        self._dns_cache = {}
+        self._host_limits = {}
+        self._idle = {}
+
+    async def _resolve(self, host, port):
+        """解析主机地址，同一主机只解析一次"""
+        key = (host, port)
+        cached = self._dns_cache.get(key)
+        now = time.monotonic()
+        if cached and now - cached[0] < self.dns_ttl:
+            return await asyncio.shield(cached[1])
+
+        # 缓存的是解析任务本身，同时检测同一主机的多个链接时共用一次解析
+        task = asyncio.ensure_future(asyncio.get_running_loop().getaddrinfo(
+            host, port, type=socket.SOCK_STREAM))
+        self._dns_cache[key] = (now, task)
+        try:
+            # 单个请求超时被取消时不能取消共用的解析任务
+            addresses = await asyncio.shield(task)
+        except Exception:
+            self._dns_cache.pop(key, None)
+            raise
+        return addresses
+
+    async def _connect(self, scheme, host, port):
+        addresses = await self._resolve(host, port)
+        last_error = None
+        for family, _, proto, _, address in addresses:
+            try:
+                reader, writer = await asyncio.open_connection(
+                    address[0], port, family=family, proto=proto,
+                    ssl=self._ssl_context if scheme == 'https' else None,
+                    server_hostname=host if scheme == 'https' else None,
+                    limit=MAX_DRAIN_BYTES
+                )
+                return _Connection(reader, writer)
+            except OSError as e:
+                last_error = e
+        raise last_error or OSError(f'无法连接到 {host}')
+
+    def _take_idle(self, key):
+        idle = self._idle.get(key)
+        now = time.monotonic()
+        while idle:
+            connection = idle.pop()
+            if now - connection.idle_since < IDLE_TIMEOUT and not connection.reader.at_eof():
+                return connection
+            connection.close()
+        return None
+
+    def _release(self, key, connection):
+        connection.idle_since = time.monotonic()
+        self._idle.setdefault(key, []).append(connection)
+
+    def close(self):
+        """关闭所有空闲连接"""
+        for connections in self._idle.values():
+            for connection in connections:
+                connection.close()
+        self._idle.clear()
+
+    @staticmethod
+    def _request_bytes(method, host_header, path, extra_headers):
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {host_header}']
+        headers = dict(CHECK_HEADERS)
+        headers['Connection'] = 'keep-alive'
+        headers.update(extra_headers)
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    @staticmethod
+    async def _read_head(reader):
+        """读取状态行和响应头，跳过 1xx 临时响应"""
+        while True:
+            head = await reader.readuntil(b'\r\n\r\n')
+            lines = head.decode('latin-1').split('\r\n')
+            parts = lines[0].split(' ', 2)
+            if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+                raise CheckError('request_error', f'无效的HTTP响应: {lines[0][:100]}')
+            status_code = int(parts[1])
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+            if status_code >= 200:
+                return parts[0], status_code, headers
+
+    @staticmethod
+    async def _drain_body(reader, headers, limit):
+        """
+        读取响应体，最多读取 limit 字节
+
+        Returns:
+            bool: 响应体是否已完整读取（连接能否复用）
+        """
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            remaining = limit
+            while True:
+                size_line = await reader.readuntil(b'\r\n')
+                size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+                if size == 0:
+                    # 跳过可能存在的trailer
+                    while (await reader.readuntil(b'\r\n')) != b'\r\n':
+                        pass
+                    return True
+                if size > remaining:
+                    return False
+                await reader.readexactly(size + 2)
+                remaining -= size
+        length = headers.get('content-length')
+        if length is None:
+            # 没有长度信息时只能读到连接关闭为止
+            return False
+        length = int(length)
+        if length > limit:
+            return False
+        await reader.readexactly(length)
+        return True
+
+    async def _request(self, method, url, extra_headers=None, body_limit=MAX_DRAIN_BYTES):
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https') or not parts.hostname:
+            raise CheckError('request_error', f'不支持的URL: {url}')
+        try:
+            host = parts.hostname.encode('idna').decode('ascii')
+        except UnicodeError:
+            raise CheckError('invalid_url', 'URL格式无效')
+        port = parts.port or (443 if scheme == 'https' else 80)
+        default_port = 443 if scheme == 'https' else 80
+        host_header = host if port == default_port else f'{host}:{port}'
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        request = self._request_bytes(method, host_header, path, extra_headers or {})
+
+        key = (scheme, host, port)
+        limit = self._host_limits.get(key)
+        if limit is None:
+            limit = self._host_limits[key] = asyncio.Semaphore(self.per_host)
+
+        # 超时只计算占到名额之后的连接和收发，排队等待同一主机的名额不算超时，
+        # 否则同一慢主机上排在后面的链接没有发出请求就会被判为超时
+        async with limit:
+            return await asyncio.wait_for(
+                self._send(key, scheme, host, port, method, request, body_limit), self.timeout)
+
+    async def _send(self, key, scheme, host, port, method, request, body_limit):
+        connection = self._take_idle(key)
+        if connection is not None:
+            try:
+                response = await self._exchange(connection, method, request, body_limit, reused=True)
+            except _StaleConnection:
+                connection = None
+        if connection is None:
+            connection = await self._connect(scheme, host, port)
+            response = await self._exchange(connection, method, request, body_limit, reused=False)
+        if response.reusable:
+            self._release(key, connection)
+        else:
+            connection.close()
+        return response
+
+    async def _exchange(self, connection, method, request, body_limit, reused):
+        try:
+            connection.writer.write(request)
+            await connection.writer.drain()
+            version, status_code, headers = await self._read_head(connection.reader)
+        except (asyncio.IncompleteReadError, ConnectionResetError, BrokenPipeError):
+            connection.close()
+            if reused:
+                raise _StaleConnection()
+            raise CheckError('connection_error', '连接错误')
+        except BaseException:
+            connection.close()
+            raise
+
+        try:
+            reusable = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+            if reusable and method != 'HEAD' and status_code not in (204, 304):
+                reusable = await self._drain_body(connection.reader, headers, body_limit)
+        except BaseException:
+            connection.close()
+            raise
+        return _Response(status_code, headers, reusable)
+
+    async def _fetch(self, method, url, extra_headers=None, body_limit=MAX_DRAIN_BYTES):
+        """发送请求并跟随重定向，返回最终的状态码"""
+        for _ in range(MAX_REDIRECTS + 1):
+            response = await self._request(method, url, extra_headers, body_limit)
+            location = response.headers.get('location')
+            if response.status_code in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                if response.status_code == 303:
+                    method = 'GET'
+                continue
+            return response.status_code
+        raise CheckError('too_many_redirects', '重定向次数过多')
+
+    async def check(self, website_id, url):
+        """
+        检测单个链接
+
+        Returns:
+            tuple: (website_id, url, is_valid, status_code, error_type, error_message, response_time)
+        """
+        start_time = time.time()
+        if not url or not (url.startswith('http://') or url.startswith('https://')):
+            return (website_id, url, False, None, 'invalid_url', 'URL格式无效', 0)
+
+        status_code = None
+        error_type = None
+        error_message = None
+        try:
+            # 先尝试更轻量的HEAD请求，失败或返回错误状态码时改用只取开头的GET请求
+            try:
+                status_code = await self._fetch('HEAD', url)
+            except (CheckError, OSError, asyncio.TimeoutError):
+                status_code = None
+            if status_code is None or status_code >= 400:
+                status_code = await self._fetch(
+                    'GET', url, {'Range': f'bytes=0-{RANGE_BYTES - 1}'}, body_limit=RANGE_BYTES)
+                # 服务器对Range的回应说明资源存在
+                if status_code == 416:
+                    status_code = 200
+
+            if not is_valid_status(status_code):
+                error_type = f'http_{status_code}'
+                error_message = f'HTTP状态码: {status_code}'
+        except CheckError as e:
+            error_type = e.error_type
+            error_message = e.error_message
+        except asyncio.TimeoutError:
+            error_type = 'timeout'
+            error_message = '请求超时'
+        except ssl.SSLError:
+            error_type = 'ssl_error'
+            error_message = 'SSL证书验证失败'
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            error_type = 'connection_error'
+            error_message = '连接错误'
+        except Exception as e:
+            error_type = 'unknown_error'
+            error_message = str(e)
+
+        is_valid = error_type is None
+        return (website_id, url, is_valid, status_code, error_type, error_message, time.time() - start_time)
+
+    async def run(self, links, on_result, should_stop=None):
+        """
+        检测一组链接
+
+        Args:
+            links: 可迭代的 (website_id, url)
+            on_result: 每得到一个结果调用一次，参数为结果元组
+            should_stop: 返回True时不再开始新的检测
+        """
+        links = iter(links)
+
+        async def worker():
+            for website_id, url in links:
+                if should_stop and should_stop():
+                    return
+                on_result(await self.check(website_id, url))
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            self.close()
+
+
+def check_links(links, on_result, should_stop=None, **options):
+    """
+    在当前线程中运行异步检测，直到所有链接检测完成或收到停止信号
+
+    Args:
+        links: 可迭代的 (website_id, url)
+        on_result: 每得到一个结果调用一次，参数为结果元组
+        should_stop: 返回True时不再开始新的检测
+        options: 传给 LinkChecker 的参数（concurrency、per_host、timeout、dns_ttl）
+    """
+    checker = LinkChecker(**options)
+    asyncio.run(checker.run(links, on_result, should_stop))
+
+
+# 按批次更新链接检测状态
+WEBSITE_STATUS_UPDATE = Website.__table__.update()\
+    .where(Website.__table__.c.id == bindparam('b_website_id'))\
+    .values(is_valid=bindparam('b_is_valid'), last_check=bindparam('b_checked_at'))
+
+
+def next_check_time(checked_at, is_valid, failures):
+    """
+    计算下次检测时间：有效链接在 DEADLINK_CHECK_TTL_DAYS 天后复查；
+    失败的链接按 DEADLINK_RETRY_BASE_HOURS 指数退避（1、2、4…倍），最长不超过复查周期
+    """
+    ttl = timedelta(days=current_app.config.get('DEADLINK_CHECK_TTL_DAYS', 30))
+    if is_valid:
+        return checked_at + ttl
+    base = timedelta(hours=current_app.config.get('DEADLINK_RETRY_BASE_HOURS', 1))
+    # 限制指数，避免连续失败次数很大时溢出
+    return checked_at + min(base * (2 ** min(failures - 1, 16)), ttl)
+
+
+def due_links(now=None):
+    """
+    获取到期需要检测的链接
+
+    从未检测过的链接立即到期；有旧版检测时间但还没有检测计划的链接按复查周期判断。
+
+    Returns:
+        list: [(website_id, url), ...]
+    """
+    now = now or datetime.utcnow()
+    ttl = timedelta(days=current_app.config.get('DEADLINK_CHECK_TTL_DAYS', 30))
+    state = WebsiteCheckState
+    return db.session.query(Website.id, Website.url)\
+        .outerjoin(state, state.website_id == Website.id)\
+        .filter(or_(
+            state.next_check_at <= now,
+            and_(state.website_id == None, or_(Website.last_check == None, Website.last_check <= now - ttl))
+        ))\
+        .order_by(Website.id)\
+        .all()
+
+
+def prune_check_history(now=None):
+    """
+    删除超过 DEADLINK_HISTORY_DAYS 天的检测记录
+
+    Returns:
+        int: 删除的记录数量
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=current_app.config.get('DEADLINK_HISTORY_DAYS', 90))
+    with db.engine.begin() as conn:
+        result = conn.execute(DeadlinkCheck.__table__.delete().where(DeadlinkCheck.__table__.c.checked_at < cutoff))
+    return result.rowcount
+
+
+def save_check_results(check_id, results, checked_at=None):
+    """
+    在一个事务中保存一批检测结果：批量插入检测记录、批量更新链接状态和检测计划
+
+    Args:
+        check_id: 检测批次ID
+        results: 检测结果元组列表
+        checked_at: 检测时间，默认为当前时间
+
+    Returns:
+        int: 实际保存的结果数量（已被删除的链接会被跳过）
+    """
+    if not results:
+        return 0
+    checked_at = checked_at or datetime.utcnow()
+    website_ids = {result[0] for result in results}
+    website_table = Website.__table__
+    state_table = WebsiteCheckState.__table__
+
+    with db.engine.begin() as conn:
+        # 检测期间可能有链接被删除；同时取出之前连续失败的次数
+        failures = {
+            website_id: previous or 0
+            for website_id, previous in conn.execute(
+                website_table.select()
+                .with_only_columns([website_table.c.id, state_table.c.failures])
+                .select_from(website_table.outerjoin(state_table, state_table.c.website_id == website_table.c.id))
+                .where(website_table.c.id.in_(website_ids))
+            )
+        }
+        rows = [
+            {
+                'check_id': check_id,
+                'website_id': website_id,
+                'url': url,
+                'is_valid': is_valid,
+                'status_code': status_code,
+                'error_type': error_type,
+                'error_message': error_message,
+                'response_time': response_time,
+                'checked_at': checked_at
+            }
+            for website_id, url, is_valid, status_code, error_type, error_message, response_time in results
+            if website_id in failures
+        ]
+        if not rows:
+            return 0
+        conn.execute(DeadlinkCheck.__table__.insert(), rows)
+        conn.execute(WEBSITE_STATUS_UPDATE, [
+            {'b_website_id': row['website_id'], 'b_is_valid': row['is_valid'], 'b_checked_at': checked_at}
+            for row in rows
+        ])
+
+        states = []
+        for row in rows:
+            count = 0 if row['is_valid'] else failures[row['website_id']] + 1
+            states.append({
+                'website_id': row['website_id'],
+                'failures': count,
+                'next_check_at': next_check_time(checked_at, row['is_valid'], count)
+            })
+        upsert = insert(state_table)
+        conn.execute(upsert.on_conflict_do_update(
+            index_elements=[state_table.c.website_id],
+            set_={'failures': upsert.excluded.failures, 'next_check_at': upsert.excluded.next_check_at}
+        ), states)
+    return len(rows)
@@ -0,0 +1,173 @@
+"""
+首页数据加载模块
+用一次分组统计和一次窗口查询取代按分类逐个查询的N+1模式，
+并按访问者身份缓存计算结果，数据变更时通过版本号失效
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import func, or_
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import Category, Website
+from app.utils.cache import link_data_generation, snapshot
+from app.utils.icon_bundle import build_icon_bundle
+
+# 首页卡片的排序规则，与分类页保持一致
+WEBSITE_ORDERING = (
+    Website.sort_order.desc(),  # 权重大的排在前面
+    Website.created_at.asc(),
+    Website.views.desc()
+)
+
+
+def load_homepage_data(user):
+    """
+    加载首页所需的全部分类和链接数据
+
+    每个分类会被附加以下属性，供 index.html 使用：
+        total_count: 当前用户可见的链接总数
+        website_list: 按排序规则取前 display_limit 个链接（为空时全部）
+        child_list: 子分类列表（替代模板中的 category.children 动态查询）
+
+    Args:
+        user: 当前用户（可以是匿名用户）
+
+    Returns:
+        tuple: (categories: list, featured_sites: list)
+    """
+    # 获取所有分类，按照排序顺序
+    categories = Category.query.order_by(Category.order.desc()).all()
+
+    # 获取推荐网站，只显示公开的或当前用户可见的
+    featured_query = Website.filter_visible(Website.query.filter_by(is_featured=True), user)
+    featured_sites = featured_query.order_by(Website.views.desc()).limit(6).all()
+
+    # 一次分组统计得到每个分类的可见链接数量
+    count_query = Website.filter_visible(
+        db.session.query(Website.category_id, func.count(Website.id)),
+        user
+    )
+    totals = dict(count_query.group_by(Website.category_id).all())
+
+    # 一次窗口查询取出每个分类排名前N的链接
+    row_number = func.row_number().over(
+        partition_by=Website.category_id,
+        order_by=WEBSITE_ORDERING
+    ).label('row_number')
+    ranked = Website.filter_visible(db.session.query(Website, row_number), user).subquery()
+    ranked_website = aliased(Website, ranked)
+    top_websites = db.session.query(ranked_website)\
+        .join(Category, Category.id == ranked.c.category_id)\
+        .filter(or_(
+            # display_limit 为空时不限制数量，与原先 .limit(None) 一致
+            Category.display_limit.is_(None),
+            ranked.c.row_number <= Category.display_limit
+        ))\
+        .order_by(ranked.c.category_id, ranked.c.row_number)\
+        .all()
+
+    websites_by_category = {}
+    for website in top_websites:
+        websites_by_category.setdefault(website.category_id, []).append(website)
+
+    # 按ID顺序组装子分类，与原先 category.children 的返回顺序一致
+    children_by_parent = {}
+    for category in sorted(categories, key=lambda c: c.id):
+        if category.parent_id is not None:
+            children_by_parent.setdefault(category.parent_id, []).append(category)
+
+    for category in categories:
+        category.total_count = totals.get(category.id, 0)
+        category.website_list = websites_by_category.get(category.id, [])
+        category.child_list = children_by_parent.get(category.id, [])
+
+    return categories, featured_sites
+
+
+def _snapshot_homepage(categories, featured_sites):
+    websites = {}
+
+    def website_snapshot(website):
+        if website.id not in websites:
+            websites[website.id] = snapshot(website)
+        return websites[website.id]
+
+    snapshots = {
+        category.id: snapshot(
+            category,
+            total_count=category.total_count,
+            website_list=[website_snapshot(w) for w in category.website_list]
+        )
+        for category in categories
+    }
+    for category in categories:
+        snapshots[category.id].child_list = [snapshots[child.id] for child in category.child_list]
+    featured = [website_snapshot(site) for site in featured_sites]
+
+    # 首页展示的本地图标合并为一个样式表，卡片通过类名显示图标
+    icon_bundle, icon_classes = build_icon_bundle([website.icon for website in websites.values()])
+    for website in websites.values():
+        website.icon_class = icon_classes.get(website.icon)
+
+    return [snapshots[category.id] for category in categories], featured, icon_bundle
+
+
+class HomepageCache:
+    """
+    进程内的首页数据缓存
+
+    按访问者身份分组：匿名用户、管理员（可见全部链接）以及每个普通登录用户
+    （私有链接授权各不相同）。缓存项记录生成时的数据版本号，版本号变化或超过
+    HOMEPAGE_CACHE_TTL 后重新计算。
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def audience_key(user):
+        """获取用户对应的缓存分组"""
+        if not user.is_authenticated:
+            return 'anonymous'
+        if user.is_admin:
+            return 'admin'
+        return f'user:{user.id}'
+
+    def get(self, user):
+        """获取首页数据，命中缓存时不执行任何SQL查询"""
+        key = self.audience_key(user)
+        generation = link_data_generation.current()
+        ttl = current_app.config.get('HOMEPAGE_CACHE_TTL', 300)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['generation'] == generation and time.time() - entry['built_at'] < ttl:
+                self._entries.move_to_end(key)
+                return entry['data']
+
+        # 先读取版本号再加载数据，加载期间发生的修改会在下次请求时失效本缓存
+        data = _snapshot_homepage(*load_homepage_data(user))
+
+        with self._lock:
+            self._entries[key] = {
+                'generation': generation,
+                'built_at': time.time(),
+                'data': data
+            }
+            self._entries.move_to_end(key)
+            # 限制缓存的登录用户数量（匿名和管理员分组各占一项）
+            max_entries = current_app.config.get('HOMEPAGE_CACHE_MAX_USERS', 256) + 2
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+homepage_cache = HomepageCache()
@@ -0,0 +1,119 @@
+"""
+HTTP条件请求工具模块
+用数据版本号和访问者身份计算ETag，浏览器或Nginx缓存的内容仍然有效时直接返回304，
+不再执行视图函数；匿名访问的响应允许Nginx按 Cache-Control 短时间共享缓存
+"""
+
+import hashlib
+import time
+from functools import wraps
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+from app.utils.cache import site_settings_generation
+from app.utils.homepage import homepage_cache
+
+
+def compute_etag(*parts):
+    """由若干版本号和参数计算ETag"""
+    value = '|'.join(str(part) for part in parts)
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+
+def _stats_period():
+    """
+    访问量等统计数据的变化不会更新数据版本号，
+    按 HTTP_ETAG_MAX_AGE 分段计入ETag，统计数据最多延迟这么久反映到页面上
+    """
+    max_age = current_app.config.get('HTTP_ETAG_MAX_AGE', 300)
+    return int(time.time() // max_age) if max_age > 0 else 0
+
+
+def _page_parts():
+    """
+    页面中与登录用户相关的内容
+
+    登录用户的页面中包含用户名和CSRF令牌，签名后的令牌在 WTF_CSRF_TIME_LIMIT 后过期，
+    按半个有效期分段计入ETag，保证浏览器缓存的页面中的令牌仍然可用。
+    匿名用户的页面不包含这些内容，可以被多个访问者共享。
+    """
+    if not current_user.is_authenticated:
+        return ()
+    generate_csrf()
+    time_limit = current_app.config.get('WTF_CSRF_TIME_LIMIT') or 0
+    period = int(time.time() // (time_limit // 2)) if time_limit >= 2 else 0
+    return current_user.username, session.get('csrf_token', ''), period
+
+
+def set_cache_headers(response, shared=True):
+    """
+    设置缓存策略：浏览器每次都用ETag重新验证；
+    匿名且没有写入会话的响应允许共享缓存保存 HTTP_CACHE_SHARED_MAX_AGE 秒
+    """
+    shared_max_age = current_app.config.get('HTTP_CACHE_SHARED_MAX_AGE', 30)
+    if shared and shared_max_age > 0 and not current_user.is_authenticated and not session.modified:
+        response.cache_control.public = True
+        response.cache_control.max_age = 0
+        response.cache_control.s_maxage = shared_max_age
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+
+def conditional_response(etag_parts, render, shared=True):
+    """
+    按ETag处理条件请求
+
+    Args:
+        etag_parts: 决定响应内容的版本号和参数
+        render: 生成响应的函数，只在需要重新生成时调用
+        shared: 匿名访问的响应是否允许共享缓存
+
+    Returns:
+        Response: 304响应或带ETag的响应
+    """
+    etag = compute_etag(*etag_parts)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render())
+        # 错误响应不参与缓存
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    return set_cache_headers(response, shared)
+
+
+def conditional_get(*generations, page=False):
+    """
+    视图装饰器：按数据版本号、请求参数和访问者身份计算ETag，
+    命中 If-None-Match 时直接返回304，不执行视图函数
+
+    Args:
+        generations: 响应内容依赖的数据版本号（DataGeneration）
+        page: 是否为继承 base.html 的页面（额外依赖站点设置和登录用户信息）
+    """
+    if page:
+        generations += (site_settings_generation,)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # 有待显示的提示消息时页面内容与版本号无关，直接渲染
+            if page and session.get('_flashes'):
+                return set_cache_headers(make_response(view(*args, **kwargs)), shared=False)
+
+            etag_parts = (
+                request.endpoint,
+                sorted(request.view_args.items()),
+                request.query_string.decode('latin-1'),
+                homepage_cache.audience_key(current_user),
+                _stats_period(),
+                *(generation.current() for generation in generations),
+                *(_page_parts() if page else ())
+            )
+            return conditional_response(etag_parts, lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
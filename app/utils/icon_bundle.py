@@ -0,0 +1,124 @@
+"""
+首页图标合并模块
+把首页展示的链接（每个分类前 display_limit 个）的本地图标以 data URI 的形式合并为一个样式表，
+首屏只需一次请求即可得到全部图标。样式表按内容哈希命名，首页链接或图标变化后生成新的文件。
+"""
+
+import base64
+import hashlib
+import os
+import time
+from flask import current_app
+from app.utils.icon_store import ICON_SUBDIR, icon_url_prefix, is_local_icon
+
+BUNDLE_SUBDIR = f'{ICON_SUBDIR}/bundles'
+
+ICON_MIME_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'gif': 'image/gif',
+    'ico': 'image/x-icon',
+    'webp': 'image/webp'
+}
+
+
+def _bundle_dir():
+    return os.path.join(current_app.static_folder, *BUNDLE_SUBDIR.split('/'))
+
+
+def _icon_rule(icon):
+    """
+    生成一个图标的样式规则
+
+    Returns:
+        tuple: (类名, 样式规则)；图标文件不存在时返回 (None, None)
+    """
+    relative = icon[len(icon_url_prefix()):]
+    filename = relative.rsplit('/', 1)[-1]
+    digest, _, ext = filename.partition('.')
+    mime_type = ICON_MIME_TYPES.get(ext)
+    if mime_type is None:
+        return None, None
+    path = os.path.join(current_app.static_folder, *ICON_SUBDIR.split('/'), *relative.split('/'))
+    try:
+        with open(path, 'rb') as f:
+            data = base64.b64encode(f.read()).decode('ascii')
+    except OSError:
+        return None, None
+    class_name = f'si-{digest[:16]}'
+    return class_name, f'.{class_name}{{background-image:url("data:{mime_type};base64,{data}")}}'
+
+
+def build_icon_bundle(icons):
+    """
+    把一组本地图标合并为样式表
+
+    样式表累计超过 ICON_BUNDLE_MAX_BYTES 后剩余的图标不再合并，仍由 <img> 单独加载。
+
+    Args:
+        icons: 图标地址列表（按页面中出现的顺序），非本地图标会被忽略
+
+    Returns:
+        tuple: (样式表地址或None, {图标地址: 类名})
+    """
+    max_bytes = current_app.config.get('ICON_BUNDLE_MAX_BYTES', 1024 * 1024)
+    classes = {}
+    rules = []
+    size = 0
+    for icon in icons:
+        if icon in classes or not is_local_icon(icon):
+            continue
+        class_name, rule = _icon_rule(icon)
+        if rule is None:
+            continue
+        if size + len(rule) > max_bytes:
+            break
+        classes[icon] = class_name
+        rules.append(rule)
+        size += len(rule)
+    if not rules:
+        return None, {}
+
+    content = '\n'.join(rules).encode('utf-8')
+    digest = hashlib.sha256(content).hexdigest()
+    path = os.path.join(_bundle_dir(), f'{digest}.css')
+    try:
+        if os.path.exists(path):
+            # 记录最近一次使用时间，长期不用的样式表才会被清理
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+            prune_icon_bundles()
+    except OSError as e:
+        current_app.logger.error(f"生成首页图标样式表失败: {str(e)}")
+        return None, {}
+    return f"{current_app.static_url_path}/{BUNDLE_SUBDIR}/{digest}.css", classes
+
+
+def prune_icon_bundles(max_age=86400):
+    """
+    删除超过 max_age 秒没有使用的样式表
+
+    正在使用的样式表在首页缓存重建时（最长 HOMEPAGE_CACHE_TTL）都会更新修改时间
+
+    Returns:
+        int: 删除的文件数
+    """
+    bundle_dir = _bundle_dir()
+    if not os.path.isdir(bundle_dir):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age
+    for filename in os.listdir(bundle_dir):
+        path = os.path.join(bundle_dir, filename)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
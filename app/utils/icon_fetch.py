@@ -0,0 +1,306 @@
+"""
+批量抓取图标模块
+固定大小的线程池并发解析图标，每个上游服务（小小API、cccyun备用图标服务、网站自身的
+/favicon.ico）各用一个令牌桶限制请求速率；解析结果按批次写入数据库。开启本地化时图标下载后保存为本地文件（见 icon_store）
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+import requests
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam
+from app import db
+from app.models import Website
+from app.utils.cache import link_data_generation
+from app.utils.icon_store import download_icon
+
+CHECK_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+# 上游服务名称，对应 ICON_FETCH_RATES 中的键
+UPSTREAM_XXAPI = 'xxapi'
+UPSTREAM_CCCYUN = 'cccyun'
+UPSTREAM_DIRECT = 'direct'
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+
+    每秒补充 rate 个令牌，最多积累 burst 个；rate 不大于0时不限速。
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = max(burst or rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, should_stop=None):
+        """
+        取得一个令牌，令牌不足时等待
+
+        Returns:
+            bool: 是否取得令牌；等待期间 should_stop() 返回True时放弃并返回False
+        """
+        if self.rate <= 0:
+            return True
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_seconds = (1 - self._tokens) / self.rate
+            if should_stop and should_stop():
+                return False
+            # 分段等待，停止请求最多延迟0.1秒生效
+            time.sleep(min(wait_seconds, 0.1))
+
+
+def favicon_url(url):
+    """网站自身的 /favicon.ico 地址，无法解析时返回 None"""
+    if not url.startswith(('http://', 'https://')):
+        url = 'http://' + url
+    parts = urlsplit(url)
+    if not parts.netloc:
+        return None
+    return f'{parts.scheme}://{parts.netloc}/favicon.ico'
+
+
+class IconFetcher:
+    """
+    图标解析器
+
+    依次尝试：小小API返回的图标地址、cccyun备用图标（HEAD验证可访问）、
+    网站自身的 /favicon.ico（HEAD验证可访问）。每次请求前从对应上游的令牌桶取令牌。
+    开启本地化时直接下载候选图标代替HEAD验证，下载成功的保存为本地文件。
+
+    Args:
+        rates: {上游名称: 每秒请求数}
+        timeout: 验证图标地址的超时时间（秒）
+        should_stop: 返回True时放弃尚未发出的请求
+        get_icon: 调用小小API的函数，默认为 app.utils.site_info.get_website_icon
+        localize: 把图标下载到本地
+        app: Flask应用，工作线程在它的上下文中调用 get_icon 和下载图标（读写网站信息缓存、保存图标文件）
+    """
+
+    def __init__(self, rates=None, timeout=5, should_stop=None, get_icon=None, localize=False, app=None):
+        if get_icon is None:
+            from app.utils.site_info import get_website_icon
+            get_icon = get_website_icon
+        rates = rates or {}
+        self.buckets = {
+            name: TokenBucket(rates.get(name, 0))
+            for name in (UPSTREAM_XXAPI, UPSTREAM_CCCYUN, UPSTREAM_DIRECT)
+        }
+        self.timeout = timeout
+        self.should_stop = should_stop or (lambda: False)
+        self.get_icon = get_icon
+        self.localize = localize
+        self.app = app
+        self._local = threading.local()
+
+    def _session(self):
+        # 每个线程一个会话，复用到同一上游的连接
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers.update(CHECK_HEADERS)
+        return session
+
+    def _take(self, upstream):
+        return not self.should_stop() and self.buckets[upstream].acquire(self.should_stop)
+
+    def _reachable(self, url):
+        try:
+            response = self._session().head(url, timeout=self.timeout)
+            response.close()
+            return response.status_code < 400  # 2xx或3xx状态码表示可访问
+        except requests.RequestException:
+            return False
+
+    def download(self, url):
+        """下载图标到本地，返回本地地址，失败时返回 None"""
+        with self.app.app_context():
+            return download_icon(url, self._session(), self.timeout)
+
+    def _accept(self, icon_url, verify):
+        """
+        确定候选图标最终保存的地址
+
+        Args:
+            verify: 是否要求候选图标可以访问（备用图标和 /favicon.ico 需要验证）
+
+        Returns:
+            str: 图标地址；不可用时返回 None
+        """
+        if self.localize:
+            local_url = self.download(icon_url)
+            if local_url or not verify:
+                # 小小API返回的图标下载失败时仍使用原地址，由之后的本地化任务重试
+                return local_url or icon_url
+            return None
+        if not verify or self._reachable(icon_url):
+            return icon_url
+        return None
+
+    def resolve(self, website_id, url):
+        """
+        解析一个网站的图标
+
+        Returns:
+            tuple: (website_id, 图标地址或None)；收到停止请求而放弃时返回 None
+        """
+        if not self._take(UPSTREAM_XXAPI):
+            return None
+        if self.app is not None:
+            with self.app.app_context():
+                result = self.get_icon(url)
+        else:
+            result = self.get_icon(url)
+        if result.get('success') and result.get('icon_url'):
+            return website_id, self._accept(result['icon_url'], verify=False)
+
+        fallback_url = result.get('fallback_url')
+        if fallback_url:
+            if not self._take(UPSTREAM_CCCYUN):
+                return None
+            icon = self._accept(fallback_url, verify=True)
+            if icon:
+                return website_id, icon
+
+        direct_url = favicon_url(url)
+        if direct_url:
+            if not self._take(UPSTREAM_DIRECT):
+                return None
+            icon = self._accept(direct_url, verify=True)
+            if icon:
+                return website_id, icon
+        return website_id, None
+
+
+class IconLocalizer:
+    """
+    把已保存的第三方图标地址下载为本地文件
+
+    同一次运行中相同的图标地址只下载一次（同一域名的网站通常使用同一个图标地址）。
+    """
+
+    def __init__(self, app, timeout=5):
+        self.app = app
+        self.timeout = timeout
+        self._results = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def localize(self, website_id, icon_url):
+        """
+        Returns:
+            tuple: (website_id, 本地图标地址或None)
+        """
+        with self._lock:
+            event = self._results.get(icon_url)
+            owner = event is None
+            if owner:
+                event = self._results[icon_url] = threading.Event()
+        if owner:
+            session = getattr(self._local, 'session', None)
+            if session is None:
+                session = self._local.session = requests.Session()
+            event.local_url = None
+            try:
+                with self.app.app_context():
+                    event.local_url = download_icon(icon_url, session, self.timeout)
+            finally:
+                event.set()
+        else:
+            event.wait()
+        return website_id, event.local_url
+
+
+def _run_pool(tasks, func, on_result, should_stop, workers):
+    """
+    用固定大小的线程池执行 func(*task)，在调用线程中按完成顺序回调非 None 的结果
+
+    同时提交给线程池的任务不超过 workers 的两倍；收到停止请求后不再提交新任务。
+    """
+    tasks = iter(tasks)
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='icon-fetch') as executor:
+        while True:
+            while len(pending) < workers * 2 and not should_stop():
+                task = next(tasks, None)
+                if task is None:
+                    break
+                pending.add(executor.submit(func, *task))
+            if not pending:
+                break
+            done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    current_app.logger.error(f"解析图标出错: {str(e)}")
+                    continue
+                if result is not None:
+                    on_result(result)
+
+
+def fetch_icons(links, on_result, should_stop=None, workers=8, **options):
+    """
+    并发解析一组网站的图标，在调用线程中按完成顺序回调结果
+
+    收到停止请求后不再提交新任务，正在进行的解析在当前请求结束后放弃。
+
+    Args:
+        links: 可迭代的 (website_id, url)
+        on_result: 每得到一个结果调用一次，参数为 (website_id, 图标地址或None)
+        should_stop: 返回True时停止
+        workers: 线程数
+        options: 传给 IconFetcher 的参数（rates、timeout、get_icon、localize）
+    """
+    should_stop = should_stop or (lambda: False)
+    if has_app_context():
+        options.setdefault('app', current_app._get_current_object())
+    fetcher = IconFetcher(should_stop=should_stop, **options)
+    _run_pool(links, fetcher.resolve, on_result, should_stop, workers)
+
+
+def localize_icons(icons, on_result, should_stop=None, workers=8, timeout=5):
+    """
+    并发把一组网站的第三方图标下载到本地，在调用线程中按完成顺序回调结果
+
+    Args:
+        icons: 可迭代的 (website_id, 图标地址)
+        on_result: 每得到一个结果调用一次，参数为 (website_id, 本地图标地址或None)
+    """
+    localizer = IconLocalizer(current_app._get_current_object(), timeout)
+    _run_pool(icons, localizer.localize, on_result, should_stop or (lambda: False), workers)
+
+
+# 按批次更新链接图标
+WEBSITE_ICON_UPDATE = Website.__table__.update()\
+    .where(Website.__table__.c.id == bindparam('b_website_id'))\
+    .values(icon=bindparam('b_icon'))
+
+
+def save_icon_results(results):
+    """
+    在一个事务中保存一批图标解析结果，没有解析到图标的网站保持不变
+
+    Returns:
+        int: 更新了图标的网站数量
+    """
+    rows = [{'b_website_id': website_id, 'b_icon': icon} for website_id, icon in results if icon]
+    if not rows:
+        return 0
+    with db.engine.begin() as conn:
+        conn.execute(WEBSITE_ICON_UPDATE, rows)
+    # 直接执行的UPDATE不经过会话事件，需要手动让首页等缓存失效
+    link_data_generation.bump()
+    return len(rows)
@@ -0,0 +1,175 @@
+"""
+本地图标存储模块
+把第三方图标下载一次后保存到 static/uploads/icons/ 下，文件名为内容的SHA-256，
+相同内容的图标（如同一域名下的多个网站）只保存一份；安装了Pillow时统一缩放为小尺寸PNG。
+文件内容不会变化，由Nginx以长期不可变缓存提供服务。
+"""
+
+import hashlib
+import io
+import os
+import time
+import requests
+from flask import current_app
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装Pillow时按原格式保存，不做缩放
+    Image = None
+
+ICON_SUBDIR = 'uploads/icons'
+
+DOWNLOAD_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+
+# 文件头 -> 扩展名；不接受SVG，避免在本站域名下提供可执行脚本的文件
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'\x00\x00\x01\x00', 'ico'),
+)
+
+
+def sniff_image_type(data):
+    """根据文件头判断图片格式，返回扩展名，不是支持的图片时返回 None"""
+    for signature, ext in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def icon_url_prefix():
+    return f"{current_app.static_url_path}/{ICON_SUBDIR}/"
+
+
+def is_local_icon(icon):
+    """图标是否已经保存在本地"""
+    return bool(icon) and icon.startswith(icon_url_prefix())
+
+
+def is_remote_icon(icon):
+    """图标是否为需要下载到本地的第三方地址"""
+    return bool(icon) and icon.startswith(('http://', 'https://'))
+
+
+def _icon_dir():
+    return os.path.join(current_app.static_folder, *ICON_SUBDIR.split('/'))
+
+
+def normalize_icon(data):
+    """
+    把图片缩放为 ICON_SIZE 大小以内的PNG
+
+    Returns:
+        tuple: (图片数据, 扩展名)；不是支持的图片时返回 (None, None)
+    """
+    ext = sniff_image_type(data)
+    if ext is None:
+        return None, None
+    if Image is None:
+        return data, ext
+    size = current_app.config.get('ICON_SIZE', 64)
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format == 'ICO':
+                # ICO中包含多个尺寸，取最大的一个再缩小
+                image.size = max(image.ico.sizes())
+            image.load()
+            image = image.convert('RGBA')
+            image.thumbnail((size, size), Image.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, format='PNG', optimize=True)
+            return output.getvalue(), 'png'
+    except Exception as e:
+        current_app.logger.warning(f"无法处理图标图片: {str(e)}")
+        return None, None
+
+
+def store_icon(data):
+    """
+    按内容保存图标
+
+    Returns:
+        str: 图标的本地地址；不是支持的图片时返回 None
+    """
+    data, ext = normalize_icon(data)
+    if data is None:
+        return None
+    digest = hashlib.sha256(data).hexdigest()
+    relative = f"{digest[:2]}/{digest}.{ext}"
+    path = os.path.join(_icon_dir(), digest[:2], f"{digest}.{ext}")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        # 原子替换，并发保存同一图标时其他请求不会读到写了一半的文件
+        os.replace(temp_path, path)
+    return icon_url_prefix() + relative
+
+
+def download_icon(url, session=None, timeout=5):
+    """
+    下载图标并保存到本地
+
+    Returns:
+        str: 图标的本地地址；下载失败、不是图片或超过 ICON_MAX_BYTES 时返回 None
+    """
+    max_bytes = current_app.config.get('ICON_MAX_BYTES', 512 * 1024)
+    try:
+        response = (session or requests).get(url, headers=DOWNLOAD_HEADERS, timeout=timeout, stream=True)
+        try:
+            if response.status_code != 200:
+                return None
+            chunks = []
+            received = 0
+            for chunk in response.iter_content(16 * 1024):
+                received += len(chunk)
+                if received > max_bytes:
+                    return None
+                chunks.append(chunk)
+        finally:
+            response.close()
+        return store_icon(b''.join(chunks))
+    except (requests.RequestException, OSError) as e:
+        current_app.logger.warning(f"下载图标失败 {url}: {str(e)}")
+        return None
+
+
+def prune_icon_files(referenced, min_age=86400):
+    """
+    删除没有网站引用的图标文件
+
+    Args:
+        referenced: 仍在使用的图标地址集合
+        min_age: 只删除修改时间早于这么多秒之前的文件，避免删掉刚保存、还未写入数据库的图标
+
+    Returns:
+        int: 删除的文件数
+    """
+    prefix = icon_url_prefix()
+    keep = {icon[len(prefix):] for icon in referenced if icon and icon.startswith(prefix)}
+    icon_dir = _icon_dir()
+    if not os.path.isdir(icon_dir):
+        return 0
+    removed = 0
+    cutoff = time.time() - min_age
+    for bucket in os.listdir(icon_dir):
+        bucket_dir = os.path.join(icon_dir, bucket)
+        # 只处理按哈希前两位分的子目录（首页图标样式表另有清理规则）
+        if len(bucket) != 2 or not os.path.isdir(bucket_dir):
+            continue
+        for filename in os.listdir(bucket_dir):
+            path = os.path.join(bucket_dir, filename)
+            if f"{bucket}/{filename}" in keep:
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
@@ -0,0 +1,484 @@
+"""
+后台任务模块
+死链检测、批量抓取图标、数据导入和备份等耗时任务保存在 job 表中，由任务进程（flask run-jobs）
+领取执行。任务进度、心跳和停止请求都记录在数据库里，任意gunicorn worker都能读取；
+任务进程异常退出后，可恢复的任务会重新排队并从检查点继续执行
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, exists, func, literal, or_, select
+from app import db
+from app.models import Job
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+ACTIVE_STATES = (JOB_PENDING, JOB_RUNNING)
+
+JOB_STATE_LABELS = {
+    JOB_PENDING: '排队中',
+    JOB_RUNNING: '运行中',
+    JOB_DONE: '已完成',
+    JOB_FAILED: '失败',
+    JOB_CANCELLED: '已停止'
+}
+
+# 被领取执行超过这个次数仍未完成的任务不再自动恢复，避免反复让任务进程崩溃
+MAX_ATTEMPTS = 3
+
+# 定时提交的任务：(任务类型, 参数, 间隔小时数的配置项)
+SCHEDULED_JOBS = [
+    ('deadlink', {'incremental': True}, 'DEADLINK_SCHEDULE_HOURS'),
+    ('icon_localize', {}, 'ICON_LOCALIZE_SCHEDULE_HOURS'),
+    ('webdav_sync', {'scheduled': True}, 'WEBDAV_SYNC_SCHEDULE_HOURS'),
+]
+
+JOB_TABLE = Job.__table__
+
+# 任务类型 -> (处理函数, 显示名称, 是否可恢复)
+_handlers = {}
+
+
+def job_handler(kind, label, resumable=True):
+    """
+    注册任务处理函数
+
+    处理函数接收 JobContext，返回值作为任务结果信息保存；抛出异常时任务标记为失败。
+    resumable 为 False 的任务在任务进程异常退出后直接标记为失败，不会重新执行。
+    """
+    def decorator(func):
+        _handlers[kind] = (func, label, resumable)
+        return func
+    return decorator
+
+
+def job_labels():
+    """各任务类型的显示名称"""
+    return {kind: label for kind, (_, label, _) in _handlers.items()}
+
+
+def enqueue_job(kind, params=None, created_by_id=None, start_worker=True):
+    """
+    提交任务
+
+    Args:
+        kind: 任务类型
+        params: 任务参数（可序列化为JSON）
+        created_by_id: 提交任务的用户ID
+        start_worker: 启用 JOB_WORKER_EMBEDDED 时是否在当前进程中启动任务线程
+
+    Returns:
+        Job: 新建的任务；同类任务正在排队或运行时返回 None
+    """
+    values = {
+        'kind': kind,
+        'state': JOB_PENDING,
+        'params': json.dumps(params or {}, ensure_ascii=False),
+        'total': 0,
+        'processed': 0,
+        'success': 0,
+        'failed': 0,
+        'cancel_requested': False,
+        'attempts': 0,
+        'created_by_id': created_by_id,
+        'created_at': datetime.utcnow()
+    }
+    # 检查和插入在同一条语句中完成，多个worker同时提交同类任务时只有一个会成功
+    active = exists().where(and_(JOB_TABLE.c.kind == kind, JOB_TABLE.c.state.in_(ACTIVE_STATES)))
+    row = select(*[literal(value, JOB_TABLE.c[key].type) for key, value in values.items()]).where(~active)
+    result = db.session.execute(JOB_TABLE.insert().from_select(list(values), row))
+    db.session.commit()
+    if not result.rowcount:
+        return None
+
+    if start_worker:
+        _start_embedded_worker()
+    return Job.query.get(result.lastrowid)
+
+
+def active_job(kind):
+    """同类正在排队或运行的任务"""
+    return Job.query.filter(Job.kind == kind, Job.state.in_(ACTIVE_STATES))\
+        .order_by(Job.id.desc()).first()
+
+
+def latest_job(kind):
+    """同类最近提交的任务"""
+    return Job.query.filter_by(kind=kind).order_by(Job.id.desc()).first()
+
+
+def request_cancel(kind):
+    """
+    请求停止同类任务：排队中的任务直接取消，运行中的任务由处理函数在下次检查时停止
+
+    Returns:
+        bool: 是否有需要停止的任务
+    """
+    now = datetime.utcnow()
+    cancelled = db.session.execute(
+        JOB_TABLE.update()
+        .where(JOB_TABLE.c.kind == kind, JOB_TABLE.c.state == JOB_PENDING)
+        .values(state=JOB_CANCELLED, cancel_requested=True, finished_at=now)
+    ).rowcount
+    requested = db.session.execute(
+        JOB_TABLE.update()
+        .where(JOB_TABLE.c.kind == kind, JOB_TABLE.c.state == JOB_RUNNING)
+        .values(cancel_requested=True)
+    ).rowcount
+    db.session.commit()
+    return bool(cancelled or requested)
+
+
+def wait_for_job(job_id, timeout=None):
+    """
+    等待任务结束
+
+    Args:
+        job_id: 任务ID
+        timeout: 最长等待秒数，None表示一直等待
+
+    Returns:
+        Job: 任务的最新状态（超时返回时任务可能仍在运行）
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        db.session.expire_all()
+        job = Job.query.get(job_id)
+        # 替换模式导入会连同 job 表一起替换数据库文件，任务结束时才重新写入任务记录
+        if job is not None and not job.is_active:
+            return job
+        if deadline is not None and time.time() >= deadline:
+            return job
+        time.sleep(0.2)
+
+
+def job_progress(job):
+    """任务进度，供各任务的状态接口使用；没有任务时各项为0"""
+    if job is None:
+        return {'is_running': False, 'total': 0, 'processed': 0, 'success': 0, 'failed': 0,
+                'elapsed_seconds': 0}
+    elapsed_seconds = 0
+    if job.started_at:
+        end = job.finished_at or datetime.utcnow()
+        elapsed_seconds = max(int((end - job.started_at).total_seconds()), 0)
+    return {
+        'is_running': job.is_active,
+        'total': job.total,
+        'processed': job.processed,
+        'success': job.success,
+        'failed': job.failed,
+        'elapsed_seconds': elapsed_seconds
+    }
+
+
+def recover_stale_jobs():
+    """
+    处理心跳超时的任务：所在任务进程已退出，
+    可恢复的任务重新排队，从检查点继续执行；其余任务标记为失败
+
+    Returns:
+        int: 处理的任务数量
+    """
+    deadline = datetime.utcnow() - timedelta(seconds=current_app.config.get('JOB_HEARTBEAT_TIMEOUT', 60))
+    stale = or_(JOB_TABLE.c.heartbeat_at.is_(None), JOB_TABLE.c.heartbeat_at < deadline)
+    jobs = db.session.query(Job.id, Job.kind, Job.attempts, Job.cancel_requested)\
+        .filter(Job.state == JOB_RUNNING, stale).all()
+
+    recovered = 0
+    for job_id, kind, attempts, cancel_requested in jobs:
+        _, _, resumable = _handlers.get(kind, (None, None, False))
+        if cancel_requested:
+            values = {'state': JOB_CANCELLED, 'finished_at': datetime.utcnow()}
+        elif resumable and attempts < MAX_ATTEMPTS:
+            values = {'state': JOB_PENDING, 'message': '任务进程异常退出，等待从检查点继续执行'}
+        else:
+            values = {'state': JOB_FAILED, 'finished_at': datetime.utcnow(), 'message': '任务进程异常退出'}
+        # 带上原来的条件，避免覆盖其他任务进程同时做出的处理
+        recovered += db.session.execute(
+            JOB_TABLE.update()
+            .where(JOB_TABLE.c.id == job_id, JOB_TABLE.c.state == JOB_RUNNING, stale)
+            .values(worker=None, **values)
+        ).rowcount
+        current_app.logger.warning(f"任务 {job_id}({kind}) 心跳超时，已标记为 {values['state']}")
+    db.session.commit()
+    return recovered
+
+
+class JobContext:
+    """
+    任务处理函数使用的上下文
+
+    提供任务参数和上次保存的检查点，update / advance 把进度和检查点写入任务表；
+    心跳线程每秒读取一次停止请求，should_stop() 只检查内存中的标志，可以在检测循环中频繁调用。
+    """
+
+    def __init__(self, job, engine, shutdown):
+        self.job_id = job.id
+        self.kind = job.kind
+        self.params = job.params_data
+        self.checkpoint = json.loads(job.checkpoint) if job.checkpoint else None
+        self.resumed = job.attempts > 1
+        self.interrupted = False
+        self._engine = engine
+        self._shutdown = shutdown
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+        self._heartbeat_thread = None
+
+    def _write(self, values):
+        values['heartbeat_at'] = datetime.utcnow()
+        if 'checkpoint' in values:
+            values['checkpoint'] = json.dumps(values['checkpoint'], ensure_ascii=False)
+        with self._engine.begin() as conn:
+            conn.execute(JOB_TABLE.update().where(JOB_TABLE.c.id == self.job_id).values(**values))
+
+    def update(self, **values):
+        """设置任务的 total / processed / success / failed / message / checkpoint"""
+        self._write(values)
+
+    def advance(self, processed=0, success=0, failed=0, checkpoint=None):
+        """累加进度计数，可同时保存检查点"""
+        values = {
+            'processed': JOB_TABLE.c.processed + processed,
+            'success': JOB_TABLE.c.success + success,
+            'failed': JOB_TABLE.c.failed + failed
+        }
+        if checkpoint is not None:
+            values['checkpoint'] = checkpoint
+        self._write(values)
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def should_stop(self):
+        """收到停止请求或任务进程正在退出时返回True"""
+        if self._cancel.is_set():
+            return True
+        if self._shutdown.is_set():
+            self.interrupted = True
+            return True
+        return False
+
+    def start_heartbeat(self, app):
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat, args=(app,), name=f'job-heartbeat-{self.job_id}', daemon=True)
+        self._heartbeat_thread.start()
+
+    def stop_heartbeat(self):
+        self._finished.set()
+        if self._heartbeat_thread:
+            self._heartbeat_thread.join()
+
+    def _heartbeat(self, app):
+        interval = app.config.get('JOB_HEARTBEAT_INTERVAL', 10)
+        last_beat = time.time()
+        while not self._finished.wait(1):
+            try:
+                with self._engine.begin() as conn:
+                    if time.time() - last_beat >= interval:
+                        conn.execute(JOB_TABLE.update().where(JOB_TABLE.c.id == self.job_id)
+                                     .values(heartbeat_at=datetime.utcnow()))
+                        last_beat = time.time()
+                    cancel_requested = conn.execute(
+                        select(JOB_TABLE.c.cancel_requested).where(JOB_TABLE.c.id == self.job_id)
+                    ).scalar()
+                if cancel_requested:
+                    self._cancel.set()
+            except Exception as e:
+                app.logger.warning(f"更新任务 {self.job_id} 心跳失败: {str(e)}")
+
+
+class JobWorker:
+    """
+    任务进程：轮询 job 表领取任务并执行
+
+    领取任务使用带状态条件的UPDATE，多个任务进程同时运行也不会重复执行同一个任务。
+    运行中的任务每隔 JOB_HEARTBEAT_INTERVAL 秒更新心跳，心跳超过 JOB_HEARTBEAT_TIMEOUT 秒
+    未更新的任务由 recover_stale_jobs() 处理。
+    """
+
+    def __init__(self, app, idle_exit=False):
+        self.app = app
+        self.idle_exit = idle_exit
+        self.name = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'[:64]
+        self.shutdown = threading.Event()
+        self.started_at = datetime.utcnow()
+        self._next_schedule_check = 0
+
+    def stop(self):
+        """请求退出：运行中的可恢复任务会在下次检查时停止并重新排队"""
+        self.shutdown.set()
+
+    def run(self):
+        """循环领取并执行任务；idle_exit 为真时没有排队的任务就退出"""
+        poll_interval = self.app.config.get('JOB_POLL_INTERVAL', 2)
+        self.app.logger.info(f"任务进程 {self.name} 已启动")
+        try:
+            while not self.shutdown.is_set():
+                job_id = None
+                with self.app.app_context():
+                    try:
+                        recover_stale_jobs()
+                        if not self.idle_exit:
+                            self._schedule()
+                        job_id = self.claim()
+                    except Exception as e:
+                        db.session.rollback()
+                        self.app.logger.error(f"领取任务失败: {str(e)}")
+                    finally:
+                        db.session.remove()
+
+                if job_id:
+                    self.run_job(job_id)
+                elif self.idle_exit:
+                    if _embedded_worker_idle():
+                        break
+                else:
+                    self.shutdown.wait(poll_interval)
+        finally:
+            if self.idle_exit:
+                _embedded_worker_exited()
+        self.app.logger.info(f"任务进程 {self.name} 已退出")
+
+    def claim(self, job_id=None):
+        """
+        领取指定任务或最早排队的任务
+
+        Returns:
+            int: 领取到的任务ID；没有可领取的任务或被其他任务进程抢先时返回 None
+        """
+        if job_id is None:
+            job_id = db.session.execute(
+                select(JOB_TABLE.c.id).where(JOB_TABLE.c.state == JOB_PENDING)
+                .order_by(JOB_TABLE.c.id).limit(1)
+            ).scalar()
+            if job_id is None:
+                return None
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            JOB_TABLE.update()
+            .where(JOB_TABLE.c.id == job_id, JOB_TABLE.c.state == JOB_PENDING)
+            .values(state=JOB_RUNNING, worker=self.name, attempts=JOB_TABLE.c.attempts + 1, message=None,
+                    started_at=func.coalesce(JOB_TABLE.c.started_at, now), heartbeat_at=now)
+        ).rowcount
+        db.session.commit()
+        return job_id if claimed else None
+
+    def execute(self, job_id):
+        """领取并在当前线程中执行指定任务，返回是否领取成功"""
+        with self.app.app_context():
+            try:
+                job_id = self.claim(job_id)
+            finally:
+                db.session.remove()
+        if job_id:
+            self.run_job(job_id)
+        return bool(job_id)
+
+    def run_job(self, job_id):
+        """执行已领取的任务，结束后写入最终状态"""
+        with self.app.app_context():
+            job = Job.query.get(job_id)
+            handler, _, resumable = _handlers.get(job.kind, (None, None, False))
+            context = JobContext(job, db.engine, self.shutdown)
+            snapshot = {column.key: getattr(job, column.key) for column in JOB_TABLE.columns}
+            db.session.remove()
+
+            if handler is None:
+                self._finish(snapshot, JOB_FAILED, f'未知的任务类型: {job.kind}')
+                return
+
+            self.app.logger.info(f"开始执行任务 {job_id}({context.kind})"
+                                 f"{'，从检查点继续' if context.resumed else ''}")
+            state, message = JOB_DONE, None
+            context.start_heartbeat(self.app)
+            try:
+                message = handler(context)
+                if context.cancelled:
+                    state = JOB_CANCELLED
+                elif context.interrupted and resumable:
+                    state = JOB_PENDING
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.exception(f"任务 {job_id}({context.kind}) 执行失败")
+                state, message = JOB_FAILED, str(e)
+            finally:
+                context.stop_heartbeat()
+                db.session.remove()
+            self._finish(snapshot, state, message)
+            self.app.logger.info(f"任务 {job_id}({context.kind}) 结束: {state}")
+
+    def _finish(self, snapshot, state, message):
+        now = datetime.utcnow()
+        values = {'state': state, 'worker': None, 'heartbeat_at': now}
+        if state != JOB_PENDING:
+            values['finished_at'] = now
+        if message is not None:
+            values['message'] = message
+        with db.engine.begin() as conn:
+            updated = conn.execute(
+                JOB_TABLE.update()
+                .where(JOB_TABLE.c.id == snapshot['id'], JOB_TABLE.c.worker == self.name)
+                .values(**values)
+            ).rowcount
+            # 替换模式导入会替换整个数据库文件，任务记录随之消失，需要重新写入
+            if not updated and conn.execute(
+                    select(JOB_TABLE.c.id).where(JOB_TABLE.c.id == snapshot['id'])).first() is None:
+                conn.execute(JOB_TABLE.insert().values(**dict(snapshot, **values)))
+
+    def _schedule(self):
+        """按 SCHEDULED_JOBS 定时提交任务（每分钟检查一次）"""
+        if time.time() < self._next_schedule_check:
+            return
+        self._next_schedule_check = time.time() + 60
+        for kind, params, config_key in SCHEDULED_JOBS:
+            hours = self.app.config.get(config_key, 0)
+            if hours <= 0:
+                continue
+            last = latest_job(kind)
+            # 从未执行过的任务从任务进程启动时开始计时
+            since = last.created_at if last else self.started_at
+            if datetime.utcnow() - since >= timedelta(hours=hours):
+                if enqueue_job(kind, params, start_worker=False):
+                    self.app.logger.info(f"已提交定时任务: {kind}")
+
+
+# 没有独立任务进程时（如开发环境），由提交任务的web进程启动线程执行，排队的任务执行完后线程退出
+_embedded_lock = threading.Lock()
+_embedded_state = {'running': False, 'wakeup': False}
+
+
+def _start_embedded_worker():
+    app = current_app._get_current_object()
+    if not app.config.get('JOB_WORKER_EMBEDDED'):
+        return
+    with _embedded_lock:
+        _embedded_state['wakeup'] = True
+        if _embedded_state['running']:
+            return
+        _embedded_state['running'] = True
+    threading.Thread(target=JobWorker(app, idle_exit=True).run, name='job-worker', daemon=True).start()
+
+
+def _embedded_worker_idle():
+    """线程准备退出前再确认一次，期间提交的任务会让线程继续运行"""
+    with _embedded_lock:
+        if _embedded_state['wakeup']:
+            _embedded_state['wakeup'] = False
+            return False
+        _embedded_state['running'] = False
+        return True
+
+
+def _embedded_worker_exited():
+    with _embedded_lock:
+        _embedded_state['running'] = False
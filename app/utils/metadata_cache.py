@@ -0,0 +1,158 @@
+"""
+网站信息缓存模块
+添加链接时解析到的标题、描述按规范化网址保存，图标API的结果按域名保存（同一域名的网站共用图标），
+都保存在 url_metadata 表中，所有worker共享。缓存在有效期内直接使用；过期后带上
+If-None-Match / If-Modified-Since 重新请求，网站返回304时只传输响应头。
+记录数超过上限时删除最久未使用的记录。
+"""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+from app import db
+from app.models import UrlMetadata
+
+METADATA_TABLE = UrlMetadata.__table__
+
+KIND_PAGE = 'page'
+KIND_ICON = 'icon'
+
+
+def normalize_url(url):
+    """
+    规范化网址，用作缓存键
+
+    忽略协议、默认端口、片段和末尾的斜杠，主机名转为小写；域名去掉开头的 www.
+
+    Returns:
+        tuple: (网址键, 域名)；无法解析时返回 (None, None)
+    """
+    url = (url or '').strip()
+    if not url.startswith(('http://', 'https://')):
+        url = 'http://' + url
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or '').lower()
+        port = parts.port
+    except ValueError:
+        return None, None
+    if not host:
+        return None, None
+    netloc = host if port in (None, 80, 443) else f'{host}:{port}'
+    key = netloc + parts.path.rstrip('/')
+    if parts.query:
+        key += '?' + parts.query
+    domain = host[4:] if host.startswith('www.') else host
+    return key[:512], domain
+
+
+class MetadataCache:
+    """
+    url_metadata 表的读写
+
+    使用独立的连接执行语句，不影响调用方会话中未提交的修改。
+    """
+
+    def _lookup(self, key):
+        if key is None:
+            return None
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                row = conn.execute(select(METADATA_TABLE).where(METADATA_TABLE.c.key == key)).first()
+                if row is None:
+                    return None
+                conn.execute(METADATA_TABLE.update().where(METADATA_TABLE.c.id == row.id).values(used_at=now))
+        except Exception as e:
+            # 缓存不可用时按没有缓存处理
+            current_app.logger.error(f"读取网站信息缓存失败: {str(e)}")
+            return None
+        return SimpleNamespace(**row._mapping)
+
+    def _save(self, key, kind, domain, **values):
+        if key is None:
+            return
+        now = datetime.utcnow()
+        values.update(fetched_at=now, used_at=now)
+        statement = insert(METADATA_TABLE).values(key=key, kind=kind, domain=domain, **values)
+        statement = statement.on_conflict_do_update(index_elements=['key'], set_=values)
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(statement)
+                self._evict(conn)
+        except Exception as e:
+            current_app.logger.error(f"保存网站信息缓存失败: {str(e)}")
+
+    def _evict(self, conn):
+        """超过 METADATA_CACHE_MAX_ENTRIES 时删除最久未使用的记录"""
+        max_entries = current_app.config.get('METADATA_CACHE_MAX_ENTRIES', 5000)
+        excess = conn.execute(select(func.count()).select_from(METADATA_TABLE)).scalar() - max_entries
+        if excess > 0:
+            oldest = select(METADATA_TABLE.c.id).order_by(METADATA_TABLE.c.used_at).limit(excess)
+            conn.execute(METADATA_TABLE.delete().where(METADATA_TABLE.c.id.in_(oldest.scalar_subquery())))
+
+    @staticmethod
+    def _is_fresh(entry, ttl_hours):
+        return datetime.utcnow() - entry.fetched_at < timedelta(hours=ttl_hours)
+
+    def lookup_page(self, url):
+        """
+        查找网页信息
+
+        Returns:
+            SimpleNamespace: 缓存记录（title、description、charset、etag、last_modified 等），
+            fresh 属性表示是否仍在有效期内；没有缓存时返回 None
+        """
+        key, _ = normalize_url(url)
+        entry = self._lookup(key)
+        if entry is not None:
+            entry.fresh = self._is_fresh(entry, current_app.config.get('METADATA_CACHE_TTL_HOURS', 24))
+        return entry
+
+    @staticmethod
+    def conditional_headers(entry):
+        """重新验证过期缓存用的请求头"""
+        headers = {}
+        if entry is not None and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def save_page(self, url, title, description, charset=None, response=None):
+        """保存网页信息，response 为本次请求的响应，用于记录 ETag/Last-Modified"""
+        key, domain = normalize_url(url)
+        headers = response.headers if response is not None else {}
+        self._save(key, KIND_PAGE, domain,
+                   title=(title or '')[:256],
+                   description=description or '',
+                   charset=(charset or '')[:32] or None,
+                   etag=(headers.get('ETag') or '')[:256] or None,
+                   last_modified=(headers.get('Last-Modified') or '')[:64] or None)
+
+    def revalidated(self, entry):
+        """网站返回304后延长缓存的有效期"""
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(METADATA_TABLE.update().where(METADATA_TABLE.c.id == entry.id)
+                             .values(fetched_at=datetime.utcnow()))
+        except Exception as e:
+            current_app.logger.error(f"更新网站信息缓存失败: {str(e)}")
+
+    def lookup_icon(self, url):
+        """查找网址所在域名仍在有效期内的图标地址，没有时返回 None"""
+        _, domain = normalize_url(url)
+        entry = self._lookup(domain and f'icon:{domain}')
+        if entry is None or not self._is_fresh(entry, current_app.config.get('METADATA_ICON_TTL_HOURS', 168)):
+            return None
+        return entry.icon_url
+
+    def save_icon(self, url, icon_url):
+        _, domain = normalize_url(url)
+        self._save(domain and f'icon:{domain}', KIND_ICON, domain, icon_url=str(icon_url)[:512])
+
+
+metadata_cache = MetadataCache()
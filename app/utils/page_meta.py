@@ -0,0 +1,203 @@
+"""
+网页标题和描述提取模块
+分块读取响应，只读到 </head>（头部缺少标题或描述时继续读到找到 <h1>/<p> 为止），
+并且不超过 PAGE_META_MAX_BYTES 字节和 PAGE_META_DEADLINE 秒；用最先读到的几KB判断编码，
+再交给 lxml 的增量解析器解析，每个请求的内存和耗时都有上限。
+"""
+
+import codecs
+import re
+import time
+from types import SimpleNamespace
+from lxml import etree
+from requests.compat import chardet
+
+# 用于判断编码的前缀长度
+CHARSET_SNIFF_BYTES = 4096
+
+CHUNK_SIZE = 16 * 1024
+
+# 同时匹配 <meta charset="x"> 和 <meta http-equiv="Content-Type" content="text/html; charset=x">
+META_CHARSET_RE = re.compile(rb'<meta[^>]+?charset\s*=\s*["\']?\s*([a-zA-Z0-9_\-]+)', re.I)
+
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+# 可以出现在 <head> 中的元素，读到其他元素说明头部已经结束（有的网页没有 <head> 标签）
+HEAD_TAGS = {'html', 'head', 'title', 'meta', 'link', 'script', 'style', 'base', 'noscript', 'template'}
+
+# 描述的最大长度，超出部分截断
+DESCRIPTION_MAX_LENGTH = 200
+
+
+def normalize_charset(name):
+    """规范化编码名称，GB2312/GBK统一按其超集GB18030解码；无法识别时返回 None"""
+    if not name:
+        return None
+    name = name.strip().strip('"\'').lower()
+    if name in ('gb2312', 'gbk', 'gb_2312-80', 'x-gbk'):
+        return 'gb18030'
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def header_charset(response):
+    """响应头 Content-Type 中声明的编码"""
+    content_type = response.headers.get('content-type', '')
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'charset':
+            return normalize_charset(value)
+    return None
+
+
+def sniff_charset(prefix, response, hint=None):
+    """
+    判断网页编码
+
+    依次使用：BOM、响应头、网页开头的 <meta> 声明、hint（如上次检测到的编码）、
+    UTF-8 试解码，最后按内容猜测
+
+    Args:
+        prefix: 网页开头的若干字节
+        response: 响应对象
+        hint: 之前检测到的编码
+    """
+    for bom, charset in BOMS:
+        if prefix.startswith(bom):
+            return charset
+    charset = header_charset(response)
+    if charset:
+        return charset
+    match = META_CHARSET_RE.search(prefix)
+    if match:
+        charset = normalize_charset(match.group(1).decode('ascii'))
+        if charset:
+            return charset
+    charset = normalize_charset(hint)
+    if charset:
+        return charset
+    try:
+        # 前缀可能截断在多字节字符中间
+        codecs.getincrementaldecoder('utf-8')().decode(prefix)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    return normalize_charset((chardet.detect(prefix) or {}).get('encoding')) or 'utf-8'
+
+
+def _text(element):
+    return ' '.join(''.join(element.itertext()).split())
+
+
+class HeadExtractor:
+    """
+    增量解析网页，提取标题和描述
+
+    标题取 <title>，没有时取第一个 <h1>；描述取 <meta name="description">，
+    没有时取第一段超过20个字的 <p>。
+    """
+
+    def __init__(self, charset):
+        self.parser = etree.HTMLPullParser(events=('end',), encoding=charset)
+        self.title = ''
+        self.description = ''
+        self.h1 = ''
+        self.paragraph = ''
+        self.head_done = False
+
+    @property
+    def done(self):
+        """已经得到全部需要的信息，不必继续读取"""
+        if self.title and self.description:
+            return True
+        # 头部结束后只需要补充缺少的一项
+        return self.head_done and (self.title or self.h1) and (self.description or self.paragraph)
+
+    def feed(self, data):
+        self.parser.feed(data)
+        self._read_events()
+
+    def _read_events(self):
+        for _, element in self.parser.read_events():
+            tag = element.tag
+            if not isinstance(tag, str):
+                continue
+            tag = tag.lower()
+            if tag not in HEAD_TAGS or tag == 'head':
+                self.head_done = True
+            if tag == 'title' and not self.title:
+                self.title = _text(element)
+            elif tag == 'meta' and not self.description:
+                if (element.get('name') or '').lower() == 'description':
+                    self.description = (element.get('content') or '').strip()
+            elif tag == 'h1' and not self.h1:
+                self.h1 = _text(element)
+            elif tag == 'p' and not self.paragraph:
+                text = ''.join(element.itertext()).strip()
+                if len(text) > 20:  # 确保文本有一定长度
+                    self.paragraph = text
+
+    def close(self):
+        """输入结束，处理解析器中剩余的元素"""
+        try:
+            self.parser.close()
+        except etree.LxmlError:
+            return
+        self._read_events()
+
+    def result(self):
+        description = self.description or self.paragraph
+        if len(description) > DESCRIPTION_MAX_LENGTH:
+            description = description[:DESCRIPTION_MAX_LENGTH - 3] + "..."
+        return self.title or self.h1, description
+
+
+def extract_page_meta(response, max_bytes=512 * 1024, deadline=15, charset_hint=None):
+    """
+    从以 stream=True 发出的请求的响应中提取标题和描述，读取结束后关闭响应
+
+    Args:
+        response: requests 响应
+        max_bytes: 最多读取的字节数
+        deadline: 读取的总时长上限（秒），requests 的 timeout 只限制单次读取
+        charset_hint: 网页没有声明编码时优先尝试的编码
+
+    Returns:
+        SimpleNamespace: title、description、charset、bytes_read
+    """
+    started = time.monotonic()
+    prefix = b''
+    extractor = None
+    charset = None
+    bytes_read = 0
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            bytes_read += len(chunk)
+            if extractor is None:
+                prefix += chunk
+                if len(prefix) < CHARSET_SNIFF_BYTES and b'</head' not in prefix.lower():
+                    continue
+                charset = sniff_charset(prefix, response, charset_hint)
+                extractor = HeadExtractor(charset)
+                chunk, prefix = prefix, b''
+            extractor.feed(chunk)
+            if extractor.done or bytes_read >= max_bytes or time.monotonic() - started > deadline:
+                break
+        if extractor is None:
+            # 整个网页不足 CHARSET_SNIFF_BYTES
+            charset = sniff_charset(prefix, response, charset_hint)
+            extractor = HeadExtractor(charset)
+            extractor.feed(prefix)
+        if not extractor.done:
+            extractor.close()
+    finally:
+        response.close()
+
+    title, description = extractor.result()
+    return SimpleNamespace(title=title, description=description, charset=charset, bytes_read=bytes_read)
@@ -0,0 +1,297 @@
+"""
+拼音检索模块
+为链接标题和描述预先计算全拼、首字母，保存在 website_pinyin 表中，
+并建立 trigram 全文索引，支持 "bd" -> 百度、"baidu" -> 百度 以及少量拼写错误的匹配
+"""
+
+import re
+from pypinyin import lazy_pinyin
+from markupsafe import Markup, escape
+from sqlalchemy import event, inspect, text, or_, Integer
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, joinedload
+from app import db
+from app.models import Website, WebsitePinyin
+
+PINYIN_FTS_TABLE = 'website_pinyin_fts'
+
+# 索引默认排序(rank)使用的bm25列权重：标题全拼 / 标题首字母 / 描述全拼
+PINYIN_RANK = 'bm25(10.0, 8.0, 1.0)'
+
+# 描述只取前面一段计算拼音，避免长描述拖慢写入
+DESCRIPTION_PINYIN_CHARS = 200
+
+# 参与打分的候选数量上限
+FUZZY_CANDIDATES = 200
+
+# 模糊匹配至少需要命中的两字母片段比例
+FUZZY_MIN_SCORE = 0.5
+
+# 拼音长度达到该值才做容错匹配，太短的词容错后误匹配太多
+FUZZY_MIN_LENGTH = 5
+
+# 子串匹配的结果少于该数量时才进行容错匹配
+FUZZY_MIN_RESULTS = 10
+
+CJK_PATTERN = re.compile(r'([\u3400-\u4dbf\u4e00-\u9fff]+)')
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS {PINYIN_FTS_TABLE}_ai AFTER INSERT ON website_pinyin BEGIN
+    INSERT INTO {PINYIN_FTS_TABLE}(rowid, title_pinyin, title_initials, description_pinyin)
+    VALUES (new.website_id, new.title_pinyin, new.title_initials, new.description_pinyin);
+END;
+CREATE TRIGGER IF NOT EXISTS {PINYIN_FTS_TABLE}_ad AFTER DELETE ON website_pinyin BEGIN
+    INSERT INTO {PINYIN_FTS_TABLE}({PINYIN_FTS_TABLE}, rowid, title_pinyin, title_initials, description_pinyin)
+    VALUES ('delete', old.website_id, old.title_pinyin, old.title_initials, old.description_pinyin);
+END;
+CREATE TRIGGER IF NOT EXISTS {PINYIN_FTS_TABLE}_au AFTER UPDATE ON website_pinyin BEGIN
+    INSERT INTO {PINYIN_FTS_TABLE}({PINYIN_FTS_TABLE}, rowid, title_pinyin, title_initials, description_pinyin)
+    VALUES ('delete', old.website_id, old.title_pinyin, old.title_initials, old.description_pinyin);
+    INSERT INTO {PINYIN_FTS_TABLE}(rowid, title_pinyin, title_initials, description_pinyin)
+    VALUES (new.website_id, new.title_pinyin, new.title_initials, new.description_pinyin);
+END;
+"""
+
+# 每个进程缓存一次索引状态: None表示尚未检测
+_index_state = {'fts': None}
+
+
+def to_pinyin(value):
+    """
+    将文本转换为紧凑的全拼和首字母
+
+    中文按字转换为拼音，英文和数字按单词保留；结果只包含小写字母和数字。
+    例如 "百度一下 Search" -> ("baiduyixiasearch", "bdyxs")
+
+    Returns:
+        tuple: (全拼, 首字母)
+    """
+    full = []
+    initials = []
+    for segment in CJK_PATTERN.split((value or '').lower()):
+        if not segment:
+            continue
+        if CJK_PATTERN.fullmatch(segment):
+            syllables = lazy_pinyin(segment)
+        else:
+            syllables = WORD_PATTERN.findall(segment)
+        full.extend(syllables)
+        initials.extend(s[0] for s in syllables if s)
+    return ''.join(full), ''.join(initials)
+
+
+def build_pinyin_row(website_id, title, description):
+    """计算一条链接的拼音检索数据"""
+    title_pinyin, title_initials = to_pinyin(title)
+    description_pinyin, _ = to_pinyin((description or '')[:DESCRIPTION_PINYIN_CHARS])
+    return {
+        'website_id': website_id,
+        'title_pinyin': title_pinyin,
+        'title_initials': title_initials,
+        'description_pinyin': description_pinyin
+    }
+
+
+def _write_rows(connection, rows, deleted_ids=()):
+    """先删除再插入，让 website_pinyin_fts 的触发器同步更新索引"""
+    table = WebsitePinyin.__table__
+    ids = [row['website_id'] for row in rows] + list(deleted_ids)
+    if ids:
+        connection.execute(table.delete().where(table.c.website_id.in_(ids)))
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+@event.listens_for(Session, 'after_flush')
+def _refresh_pinyin_rows(session, flush_context):
+    """链接新增、修改标题/描述或删除时，在同一事务中刷新拼音数据"""
+    rows = []
+    deleted_ids = []
+    for obj in session.new:
+        if isinstance(obj, Website):
+            rows.append(build_pinyin_row(obj.id, obj.title, obj.description))
+    for obj in session.dirty:
+        if isinstance(obj, Website):
+            state = inspect(obj)
+            if state.attrs.title.history.has_changes() or state.attrs.description.history.has_changes():
+                rows.append(build_pinyin_row(obj.id, obj.title, obj.description))
+    for obj in session.deleted:
+        if isinstance(obj, Website):
+            deleted_ids.append(obj.id)
+    if rows or deleted_ids:
+        _write_rows(session.connection(), rows, deleted_ids)
+
+
+def ensure_pinyin_index(cursor):
+    """
+    创建拼音全文索引和同步触发器（已存在时跳过）
+
+    Args:
+        cursor: 原生SQLite游标，由调用方负责提交
+
+    Returns:
+        bool: 拼音全文索引是否可用
+    """
+    _index_state['fts'] = None
+    # 索引的内容表由 db.create_all() 创建；旧数据库中还没有时不能建立索引和触发器
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='website_pinyin'")
+    if cursor.fetchone() is None:
+        print("缺少 website_pinyin 表，跳过创建拼音索引")
+        return False
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (PINYIN_FTS_TABLE,))
+    if cursor.fetchone() is None:
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {PINYIN_FTS_TABLE} USING fts5("
+                f"title_pinyin, title_initials, description_pinyin, "
+                f"content='website_pinyin', content_rowid='website_id', tokenize='trigram')"
+            )
+        except Exception as e:
+            print(f"当前SQLite不支持trigram分词，拼音搜索将使用LIKE查询: {str(e)}")
+            return False
+        cursor.execute(f"INSERT INTO {PINYIN_FTS_TABLE}({PINYIN_FTS_TABLE}, rank) VALUES('rank', ?)", (PINYIN_RANK,))
+        cursor.execute(f"INSERT INTO {PINYIN_FTS_TABLE}({PINYIN_FTS_TABLE}) VALUES('rebuild')")
+    cursor.executescript(_TRIGGERS)
+    return True
+
+
+def sync_pinyin_index(full=False, batch_size=1000):
+    """
+    为缺少拼音数据的链接补全记录
+
+    原生SQL写入（替换导入、恢复备份等）不会触发会话事件，启动时调用本函数补齐。
+
+    Args:
+        full: 为True时重新计算全部链接
+
+    Returns:
+        int: 写入的记录数
+    """
+    query = db.session.query(Website.id, Website.title, Website.description)
+    if not full:
+        query = query.outerjoin(WebsitePinyin, WebsitePinyin.website_id == Website.id)\
+            .filter(WebsitePinyin.website_id.is_(None))
+    pending = query.order_by(Website.id).all()
+
+    connection = db.session.connection()
+    for start in range(0, len(pending), batch_size):
+        rows = [build_pinyin_row(*item) for item in pending[start:start + batch_size]]
+        _write_rows(connection, rows)
+    db.session.commit()
+    return len(pending)
+
+
+def _has_fts():
+    if _index_state['fts'] is None:
+        try:
+            row = db.session.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+                {'name': PINYIN_FTS_TABLE}
+            ).fetchone()
+        except OperationalError:
+            row = None
+        _index_state['fts'] = row is not None
+    return _index_state['fts']
+
+
+def _ngrams(value, n):
+    return {value[i:i + n] for i in range(len(value) - n + 1)}
+
+
+def _score(key, grams, title_pinyin, title_initials, description_pinyin):
+    """完全匹配 > 前缀匹配 > 子串匹配 > 两字母片段重合度，描述的得分打折扣"""
+    best = 0
+    for field, weight in ((title_initials, 1.0), (title_pinyin, 1.0), (description_pinyin, 0.6)):
+        if not field:
+            continue
+        if field == key:
+            score = 4
+        elif field.startswith(key):
+            score = 3
+        elif key in field:
+            score = 2
+        elif grams:
+            score = len(grams & _ngrams(field, 2)) / len(grams)
+        else:
+            score = 0
+        best = max(best, score * weight)
+    return best
+
+
+def _fts_candidates(query, match, order_by):
+    """在拼音全文索引中取前 FUZZY_CANDIDATES 条候选，排序截断在索引内部完成"""
+    fts = text(
+        f"SELECT rowid AS website_id FROM {PINYIN_FTS_TABLE} "
+        f"WHERE {PINYIN_FTS_TABLE} MATCH :match ORDER BY {order_by} LIMIT :limit"
+    ).bindparams(match=match, limit=FUZZY_CANDIDATES).columns(website_id=Integer).subquery('pinyin_fts')
+    return query.join(fts, fts.c.website_id == Website.id).all()
+
+
+def _candidates(query, key):
+    if len(key) < 3:
+        # 按索引顺序做前缀范围扫描，完全相同的首字母/全拼自然排在最前
+        upper = key[:-1] + chr(ord(key[-1]) + 1)
+        rows = []
+        for column in (WebsitePinyin.title_initials, WebsitePinyin.title_pinyin):
+            rows.extend(query.filter(column >= key, column < upper)
+                        .order_by(column).limit(FUZZY_CANDIDATES).all())
+        return rows
+
+    if not _has_fts():
+        pattern = f'%{key}%'
+        return query.filter(or_(
+            WebsitePinyin.title_pinyin.like(pattern),
+            WebsitePinyin.title_initials.like(pattern),
+            WebsitePinyin.description_pinyin.like(pattern)
+        )).order_by(Website.views.desc()).limit(FUZZY_CANDIDATES).all()
+
+    # 先做完整子串匹配：按rowid倒序（新链接优先）取候选，不必为全部命中计算bm25，
+    # 最终顺序由 _score 决定
+    rows = _fts_candidates(query, '"' + key + '"', 'rowid DESC')
+    if len(rows) < FUZZY_MIN_RESULTS and len(key) >= FUZZY_MIN_LENGTH:
+        # 子串匹配结果太少时，用三字母片段的任意组合召回拼写错误的候选，命中片段多的排在前面
+        match = ' OR '.join(f'"{gram}"' for gram in sorted(_ngrams(key, 3)))
+        rows.extend(_fts_candidates(query, match, 'rank'))
+    return rows
+
+
+def pinyin_search(keyword, user, category_id=None, limit=None, exclude_ids=()):
+    """
+    按拼音/首字母搜索用户可见的网站
+
+    只处理包含中文或纯字母的关键词；少于3个字母时按首字母和全拼前缀匹配，
+    否则先在拼音索引中做子串匹配，再用三字母片段召回候选并按重合度打分以容忍拼写错误。
+
+    Returns:
+        list: Website对象列表，附加 title_html / description_html 属性
+    """
+    if not (CJK_PATTERN.search(keyword) or re.fullmatch(r'[A-Za-z\s]+', keyword)):
+        return []
+    key, _ = to_pinyin(keyword)
+    if not key:
+        return []
+
+    query = db.session.query(
+        Website, WebsitePinyin.title_pinyin, WebsitePinyin.title_initials, WebsitePinyin.description_pinyin
+    ).join(WebsitePinyin, WebsitePinyin.website_id == Website.id).options(joinedload(Website.category))
+    if category_id is not None:
+        query = query.filter(Website.category_id == category_id)
+    query = Website.filter_visible(query, user)
+
+    grams = _ngrams(key, 2) if len(key) >= FUZZY_MIN_LENGTH else set()
+    scored = {}
+    for website, title_pinyin, title_initials, description_pinyin in _candidates(query, key):
+        if website.id in exclude_ids or website.id in scored:
+            continue
+        score = _score(key, grams, title_pinyin, title_initials, description_pinyin)
+        if score >= FUZZY_MIN_SCORE:
+            scored[website.id] = (score, website)
+    ranked = sorted(scored.values(), key=lambda item: (-item[0], -(item[1].views or 0)))
+
+    results = []
+    for _, website in ranked[:limit] if limit else ranked:
+        website.title_html = Markup(escape(website.title or ''))
+        website.description_html = Markup(escape(website.description or ''))
+        results.append(website)
+    return results
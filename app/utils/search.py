@@ -0,0 +1,256 @@
+"""
+网站全文搜索模块
+基于SQLite FTS5建立 website_fts 索引，通过触发器与 website 表保持同步，
+使用bm25排序并生成高亮片段；FTS5不可用时退回LIKE查询。
+原文匹配之后再补充 app.utils.pinyin_index 提供的拼音匹配结果
+"""
+
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import text, or_, Integer, Float, String
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models import Website
+from app.utils.pinyin_index import ensure_pinyin_index, sync_pinyin_index, pinyin_search
+
+FTS_TABLE = 'website_fts'
+
+# 高亮标记先用控制字符占位，转义HTML后再替换为<mark>，避免注入
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+# bm25列权重：标题 > 描述 > URL
+BM25_WEIGHTS = '10.0, 4.0, 1.0'
+
+# trigram分词器要求每个检索词至少3个字符
+TRIGRAM_MIN_LENGTH = 3
+
+_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON website BEGIN
+    INSERT INTO {FTS_TABLE}(rowid, title, description, url)
+    VALUES (new.id, new.title, new.description, new.url);
+END;
+CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON website BEGIN
+    INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, url)
+    VALUES ('delete', old.id, old.title, old.description, old.url);
+END;
+CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, description, url ON website BEGIN
+    INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, url)
+    VALUES ('delete', old.id, old.title, old.description, old.url);
+    INSERT INTO {FTS_TABLE}(rowid, title, description, url)
+    VALUES (new.id, new.title, new.description, new.url);
+END;
+"""
+
+# 每个进程缓存一次索引状态: None表示尚未检测
+_index_state = {'tokenizer': None}
+
+
+def _create_index(cursor, tokenizer):
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        f"title, description, url, content='website', content_rowid='id', tokenize='{tokenizer}')"
+    )
+
+
+def ensure_search_index():
+    """
+    创建FTS5索引、拼音索引和同步触发器（已存在时跳过），并补全缺少的拼音数据
+
+    优先使用trigram分词器以支持中文子串匹配，SQLite版本过低时使用unicode61。
+
+    Returns:
+        bool: FTS5索引是否可用
+    """
+    _index_state['tokenizer'] = None
+    available = True
+    conn = db.engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (FTS_TABLE,))
+        if cursor.fetchone() is None:
+            try:
+                _create_index(cursor, 'trigram')
+            except Exception:
+                try:
+                    _create_index(cursor, 'unicode61 remove_diacritics 2')
+                except Exception as e:
+                    print(f"当前SQLite不支持FTS5，搜索将使用LIKE查询: {str(e)}")
+                    available = False
+            if available:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+        if available:
+            cursor.executescript(_TRIGGERS)
+        ensure_pinyin_index(cursor)
+        conn.commit()
+        # 还没有执行 db.create_all() 的旧数据库中没有拼音表，跳过补全
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='website_pinyin'")
+        has_pinyin_table = cursor.fetchone() is not None
+    finally:
+        conn.close()
+
+    if has_pinyin_table:
+        sync_pinyin_index()
+    return available
+
+
+def rebuild_search_index():
+    """
+    从 website 表重建全文索引和拼音数据
+
+    Returns:
+        int: 索引的链接数量
+    """
+    if ensure_search_index():
+        db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')"))
+        db.session.commit()
+    return sync_pinyin_index(full=True)
+
+
+def get_tokenizer():
+    """获取当前数据库中索引使用的分词器，索引不存在时返回空字符串"""
+    if _index_state['tokenizer'] is None:
+        try:
+            row = db.session.execute(
+                text("SELECT sql FROM sqlite_master WHERE type='table' AND name=:name"),
+                {'name': FTS_TABLE}
+            ).fetchone()
+        except OperationalError:
+            row = None
+        if row is None:
+            _index_state['tokenizer'] = ''
+        else:
+            _index_state['tokenizer'] = 'trigram' if 'trigram' in row[0] else 'unicode61'
+    return _index_state['tokenizer']
+
+
+def build_match_expression(keyword, tokenizer):
+    """
+    将用户输入转换为FTS5 MATCH表达式
+
+    每个词都用双引号包裹以避免语法错误；unicode61分词器下使用前缀匹配。
+    无法用索引表达时返回None（例如trigram下少于3个字符的词）。
+    """
+    terms = [term for term in re.split(r'\s+', keyword.strip()) if term]
+    if not terms:
+        return None
+
+    parts = []
+    for term in terms:
+        quoted = '"' + term.replace('"', '""') + '"'
+        if tokenizer == 'trigram':
+            if len(term) < TRIGRAM_MIN_LENGTH:
+                return None
+            parts.append(quoted)
+        else:
+            parts.append(quoted + '*')
+    return ' AND '.join(parts)
+
+
+def render_highlight(value):
+    """把带占位标记的文本转换为安全的HTML"""
+    if not value:
+        return Markup('')
+    html = str(escape(value))
+    return Markup(html.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
+
+
+def _highlight_like(value, keyword):
+    """LIKE模式下在Python中生成高亮文本"""
+    if not value:
+        return Markup('')
+    pattern = re.compile(re.escape(keyword), re.IGNORECASE)
+    marked = pattern.sub(lambda m: HIGHLIGHT_START + m.group(0) + HIGHLIGHT_END, value)
+    return render_highlight(marked)
+
+
+def _like_search(keyword, user, category_id=None, limit=None):
+    query = Website.query.options(joinedload(Website.category)).filter(or_(
+        Website.title.ilike(f'%{keyword}%'),
+        Website.description.ilike(f'%{keyword}%'),
+        Website.url.ilike(f'%{keyword}%')
+    ))
+    if category_id is not None:
+        query = query.filter(Website.category_id == category_id)
+    query = Website.filter_visible(query, user)
+    query = query.order_by(Website.sort_order.desc(), Website.created_at.asc(), Website.views.desc())
+    if limit:
+        query = query.limit(limit)
+
+    results = []
+    for website in query.all():
+        website.title_html = _highlight_like(website.title, keyword)
+        website.description_html = _highlight_like(website.description, keyword)
+        results.append(website)
+    return results
+
+
+def _fts_search(match, user, category_id=None, limit=None):
+    fts = text(
+        f"SELECT rowid AS website_id, "
+        f"bm25({FTS_TABLE}, {BM25_WEIGHTS}) AS rank, "
+        f"highlight({FTS_TABLE}, 0, :hl_start, :hl_end) AS title_html, "
+        f"snippet({FTS_TABLE}, 1, :hl_start, :hl_end, '…', 24) AS description_html "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+    ).bindparams(
+        match=match, hl_start=HIGHLIGHT_START, hl_end=HIGHLIGHT_END
+    ).columns(
+        website_id=Integer, rank=Float, title_html=String, description_html=String
+    ).subquery('fts')
+
+    query = db.session.query(Website, fts.c.title_html, fts.c.description_html)\
+        .join(fts, fts.c.website_id == Website.id)\
+        .options(joinedload(Website.category))
+    if category_id is not None:
+        query = query.filter(Website.category_id == category_id)
+    query = Website.filter_visible(query, user)
+    query = query.order_by(fts.c.rank, Website.views.desc())
+    if limit:
+        query = query.limit(limit)
+
+    results = []
+    for website, title_html, description_html in query.all():
+        website.title_html = render_highlight(title_html)
+        website.description_html = render_highlight(description_html)
+        results.append(website)
+    return results
+
+
+def search_websites(keyword, user, category_id=None, limit=None):
+    """
+    搜索用户可见的网站
+
+    Args:
+        keyword: 搜索关键词
+        user: 当前用户（可以是匿名用户）
+        category_id: 只在指定分类中搜索
+        limit: 最多返回的数量
+
+    Returns:
+        list: Website对象列表，按相关度排序，并附加 title_html / description_html 高亮属性
+    """
+    keyword = (keyword or '').strip()
+    if not keyword:
+        return []
+
+    tokenizer = get_tokenizer()
+    match = build_match_expression(keyword, tokenizer) if tokenizer else None
+    results = None
+    if match:
+        try:
+            results = _fts_search(match, user, category_id, limit)
+        except OperationalError as e:
+            db.session.rollback()
+            print(f"全文搜索失败，退回LIKE查询: {str(e)}")
+    if results is None:
+        results = _like_search(keyword, user, category_id, limit)
+
+    # 原文匹配排在前面，再补充拼音、首字母和容错匹配的结果
+    if not limit or len(results) < limit:
+        remaining = limit - len(results) if limit else None
+        results.extend(pinyin_search(
+            keyword, user, category_id, remaining,
+            exclude_ids={website.id for website in results}
+        ))
+    return results
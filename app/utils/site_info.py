@@ -0,0 +1,232 @@
+"""
+网站信息提取模块
+添加链接时获取网站标题、描述和图标。extract_site_info 在后台线程中解析图标的同时读取网页，
+总耗时取两者中较长的一个；进度通过回调报告，普通接口和带进度的流式接口共用这一流程。
+"""
+
+import threading
+from urllib.parse import urlparse
+import requests
+from flask import current_app
+from app.utils.metadata_cache import metadata_cache
+from app.utils.page_meta import extract_page_meta
+
+# 模拟浏览器的请求头
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+}
+
+
+def _no_progress(stage, progress, message):
+    pass
+
+
+def parse_website_info(url, refresh=False, on_progress=None):
+    """
+    解析网站标题和描述
+
+    结果保存在网站信息缓存中，有效期内直接返回缓存；过期后带条件请求头重新请求，
+    网站返回304时沿用缓存。refresh 为True时忽略有效期
+
+    Args:
+        on_progress: 进度回调 on_progress(阶段, 进度百分比, 说明)
+    """
+    on_progress = on_progress or _no_progress
+    try:
+        cached = metadata_cache.lookup_page(url)
+        if cached and cached.fresh and not refresh:
+            on_progress("cached", 60, "已使用缓存的网站信息")
+            return {
+                "success": True,
+                "title": cached.title or "",
+                "description": cached.description or "",
+                "cached": True
+            }
+        
+        # 确保URL有协议前缀
+        processed_url = url
+        if not processed_url.startswith(('http://', 'https://')):
+            processed_url = 'https://' + processed_url
+        
+        headers = dict(BROWSER_HEADERS)
+        headers.update(metadata_cache.conditional_headers(cached))
+        # 只读取网页头部，不下载整个网页
+        on_progress("connecting", 20, "正在下载网页内容...")
+        response = requests.get(processed_url, headers=headers, timeout=10, stream=True)
+        if response.status_code == 304 and cached:
+            # 网页未变化，只传输了响应头
+            response.close()
+            metadata_cache.revalidated(cached)
+            on_progress("cached", 60, "网页未变化，已使用缓存的网站信息")
+            return {
+                "success": True,
+                "title": cached.title or "",
+                "description": cached.description or "",
+                "cached": True
+            }
+        response.raise_for_status()  # 确保请求成功
+        
+        on_progress("parsing", 40, "正在解析网页头部...")
+        page = extract_page_meta(
+            response,
+            max_bytes=current_app.config.get('PAGE_META_MAX_BYTES', 512 * 1024),
+            deadline=current_app.config.get('PAGE_META_DEADLINE', 15),
+            charset_hint=cached.charset if cached else None
+        )
+        metadata_cache.save_page(url, page.title, page.description, page.charset, response)
+        on_progress("extracted", 60, "已获取网站标题和描述")
+        return {
+            "success": True,
+            "title": page.title,
+            "description": page.description
+        }
+    except Exception as e:
+        print(f"解析网站信息出错: {str(e)}")  # 添加错误日志
+        return {
+            "success": False,
+            "message": str(e)
+        }
+
+
+# 获取网站图标的函数
+def get_website_icon(url, refresh=False):
+    # 同一域名的网站共用图标，有效期内不再调用图标API
+    cached_icon = None if refresh else metadata_cache.lookup_icon(url)
+    if cached_icon:
+        return {
+            "success": True,
+            "icon_url": cached_icon
+        }
+    try:
+        # 确保URL有协议前缀
+        processed_url = url
+        if not processed_url.startswith(('http://', 'https://')):
+            processed_url = 'http://' + processed_url
+        
+        # 使用小小API获取图标
+        headers = {
+            'User-Agent': 'xiaoxiaoapi/1.0.0 (https://xxapi.cn)'
+        }
+        
+        # 根据文档示例，完整URL作为参数
+        api_url = f"https://v2.xxapi.cn/api/ico?url={processed_url}"
+        
+        # 添加调试日志
+        print(f"请求小小API: {api_url}")
+        
+        # 发送请求获取响应
+        response = requests.get(api_url, headers=headers, timeout=5)
+        
+        # 打印原始响应内容，帮助调试
+        print(f"小小API响应: {response.text}")
+        
+        # 根据文档示例，尝试解析为JSON
+        try:
+            result = response.json()
+            # 从返回的JSON中获取data字段作为实际图标URL
+            if result.get('code') == 200 and 'data' in result:
+                print(f"成功获取图标URL: {result['data']}")
+                metadata_cache.save_icon(url, result['data'])
+                return {
+                    "success": True,
+                    "icon_url": result['data']
+                }
+            else:
+                # 如果API没有返回正确格式，记录错误信息
+                error_msg = result.get('msg', '无法获取图标')
+                print(f"小小API返回错误: {error_msg}")
+                # 备用方案：使用cccyun的favicon服务
+                parsed_url = urlparse(processed_url)
+                domain = parsed_url.netloc
+                return {
+                    "success": False,
+                    "message": error_msg,
+                    "fallback_url": f"https://favicon.cccyun.cc/{domain}"
+                }
+        except ValueError:
+            # 如果不是JSON格式，可能直接返回了图标URL（根据文档返回示例 `123`）
+            if response.status_code == 200 and response.text:
+                icon_url = response.text.strip()
+                if icon_url.startswith('http'):
+                    print(f"成功获取图标URL(纯文本): {icon_url}")
+                    metadata_cache.save_icon(url, icon_url)
+                    return {
+                        "success": True,
+                        "icon_url": icon_url
+                    }
+        
+        # 如果以上都失败，使用备用图标
+        parsed_url = urlparse(processed_url)
+        domain = parsed_url.netloc
+        return {
+            "success": False,
+            "message": "无法解析API返回内容",
+            "fallback_url": f"https://favicon.cccyun.cc/{domain}"
+        }
+    except Exception as e:
+        print(f"获取网站图标出错: {str(e)}")
+        try:
+            parsed_url = urlparse(processed_url)
+            domain = parsed_url.netloc
+            return {
+                "success": False,
+                "message": str(e),
+                "fallback_url": f"https://favicon.cccyun.cc/{domain}"
+            }
+        except:
+            return {
+                "success": False,
+                "message": "URL解析失败",
+                "fallback_url": None
+            }
+
+
+def extract_site_info(url, refresh=False, on_progress=None):
+    """
+    获取网站的标题、描述、域名和图标
+
+    图标在后台线程中解析，与读取网页同时进行
+
+    Args:
+        url: 网站地址
+        refresh: 忽略缓存有效期重新获取
+        on_progress: 进度回调 on_progress(阶段, 进度百分比, 说明)，在调用线程中执行
+
+    Returns:
+        dict: success、title、description、domain、icon_url，失败时还有 message
+    """
+    on_progress = on_progress or _no_progress
+    app = current_app._get_current_object()
+    icon_result = {}
+
+    def resolve_icon():
+        try:
+            with app.app_context():
+                icon_result.update(get_website_icon(url, refresh))
+        except Exception as e:
+            print(f"获取图标时出错: {str(e)}")
+
+    on_progress("init", 10, "正在连接网站...")
+    icon_thread = threading.Thread(target=resolve_icon, name='site-info-icon', daemon=True)
+    icon_thread.start()
+    result = parse_website_info(url, refresh, on_progress)
+
+    if icon_thread.is_alive():
+        on_progress("fetching_icon", 80, "正在获取网站图标...")
+    icon_thread.join()
+
+    processed_url = url if url.startswith(('http://', 'https://')) else 'https://' + url
+    domain = urlparse(processed_url).netloc
+    if icon_result.get("success"):
+        icon_url = icon_result["icon_url"]
+    else:
+        # 图标API失败时使用备用图标服务
+        icon_url = icon_result.get("fallback_url") or (domain and f"https://favicon.cccyun.cc/{domain}")
+
+    result.setdefault("title", "")
+    result.setdefault("description", "")
+    result["domain"] = domain if result["success"] else ""
+    result["icon_url"] = icon_url or ""
+    return result
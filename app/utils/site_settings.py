@@ -0,0 +1,50 @@
+"""
+站点设置缓存模块
+站点设置是一条很少修改的单例记录，每个worker在内存中保存一份快照，
+通过共享的版本号文件判断是否过期，渲染页面时不再查询数据库
+"""
+
+import threading
+from app.models import SiteSettings
+from app.utils.cache import site_settings_generation, snapshot
+
+
+class SiteSettingsCache:
+    """
+    进程内的站点设置缓存
+
+    缓存的是与数据库会话无关的快照，只能用于读取；需要修改设置时仍然使用
+    SiteSettings.get_settings()，提交后版本号变化，各worker在下次读取时重新加载。
+    """
+
+    def __init__(self):
+        self._settings = None
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """获取站点设置快照，命中缓存时只读取版本号文件"""
+        generation = site_settings_generation.current()
+        with self._lock:
+            if self._settings is not None and self._generation == generation:
+                return self._settings
+
+        # 先读取版本号再加载数据，加载期间发生的修改会在下次读取时失效本缓存
+        settings = snapshot(SiteSettings.get_settings())
+
+        with self._lock:
+            self._settings = settings
+            self._generation = generation
+        return settings
+
+    def version(self):
+        """当前站点设置的版本号，用于计算页面的ETag"""
+        return site_settings_generation.current()
+
+    def clear(self):
+        with self._lock:
+            self._settings = None
+            self._generation = None
+
+
+site_settings_cache = SiteSettingsCache()
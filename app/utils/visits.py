@@ -0,0 +1,238 @@
+"""
+访问计数模块
+点击链接时只在进程内累加计数，由后台线程每隔几秒批量写入按天统计表和 website 表，
+跳转请求不再等待数据库写锁
+"""
+
+import atexit
+import os
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import text, func, case
+from app import db
+from app.models import Website, WebsiteVisitStat
+
+# 与SQLAlchemy在SQLite中保存DateTime的格式一致
+SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# 计数直接在SQL中累加，避免多个worker之间的更新丢失
+STATS_SQL = text("""
+    INSERT INTO website_visit_stats (website_id, day, count)
+    VALUES (:website_id, :day, :count)
+    ON CONFLICT (website_id, day) DO UPDATE SET count = count + excluded.count
+""")
+
+# 今日访问量取自按天统计表，与统计数据保持一致
+WEBSITE_SQL = text("""
+    UPDATE website SET
+        views = COALESCE(views, 0) + :count,
+        views_today = COALESCE((
+            SELECT s.count FROM website_visit_stats s
+            WHERE s.website_id = website.id AND s.day = :today
+        ), 0),
+        last_view = CASE
+            WHEN last_view IS NULL OR last_view < :last_view THEN :last_view
+            ELSE last_view
+        END
+    WHERE id = :website_id
+""")
+
+
+class VisitBuffer:
+    """
+    进程内的访问计数缓冲区
+
+    record() 只修改内存中以 (链接ID, 日期) 为键的字典；第一次记录时启动后台线程，
+    每隔 VISIT_FLUSH_INTERVAL 秒调用 flush() 把累计的计数写入数据库，
+    写入失败的计数会合并回缓冲区等待下次重试。
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    def record(self, website_id, visited_at=None):
+        """记录一次访问"""
+        visited_at = visited_at or datetime.utcnow()
+        key = (website_id, visited_at.date())
+        self._ensure_flusher()
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [1, visited_at]
+            else:
+                entry[0] += 1
+                if visited_at > entry[1]:
+                    entry[1] = visited_at
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def _restore(self, pending):
+        with self._lock:
+            for key, (count, visited_at) in pending.items():
+                entry = self._pending.get(key)
+                if entry is None:
+                    self._pending[key] = [count, visited_at]
+                else:
+                    entry[0] += count
+                    entry[1] = max(entry[1], visited_at)
+
+    def flush(self):
+        """
+        将缓冲的访问计数写入数据库（需要在应用上下文中调用）
+
+        Returns:
+            int: 写入的访问次数
+        """
+        pending = self._take()
+        if not pending:
+            return 0
+
+        stats_params = []
+        totals = {}
+        for (website_id, day), (count, visited_at) in pending.items():
+            stats_params.append({'website_id': website_id, 'day': day.isoformat(), 'count': count})
+            total = totals.setdefault(website_id, [0, visited_at])
+            total[0] += count
+            total[1] = max(total[1], visited_at)
+
+        today = datetime.utcnow().date().isoformat()
+        website_params = [
+            {
+                'website_id': website_id,
+                'count': count,
+                'today': today,
+                'last_view': visited_at.strftime(SQLITE_DATETIME_FORMAT)
+            }
+            for website_id, (count, visited_at) in totals.items()
+        ]
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(STATS_SQL, stats_params)
+                conn.execute(WEBSITE_SQL, website_params)
+        except Exception as e:
+            self._restore(pending)
+            current_app.logger.error(f"写入访问计数失败，稍后重试: {str(e)}")
+            return 0
+        return sum(count for count, _ in pending.values())
+
+    def _ensure_flusher(self):
+        # gunicorn fork出的worker不会继承父进程的线程，需要按进程启动
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pending = {}
+            self._pid = os.getpid()
+            self._app = current_app._get_current_object()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='visit-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = self._app.config.get('VISIT_FLUSH_INTERVAL', 5)
+        while not self._stop.wait(interval):
+            with self._app.app_context():
+                self.flush()
+
+    def shutdown(self):
+        """停止后台线程并写入剩余的计数"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        with self._app.app_context():
+            self.flush()
+
+
+visit_buffer = VisitBuffer()
+
+# worker正常退出时写入剩余的计数
+atexit.register(visit_buffer.shutdown)
+
+
+def top_websites(start_day, end_day, limit=10):
+    """
+    统计时间窗口内访问量最高的链接
+
+    Args:
+        start_day: 开始日期（包含）
+        end_day: 结束日期（包含）
+        limit: 返回数量
+
+    Returns:
+        list: [(Website, 访问次数), ...]，按访问次数从高到低
+    """
+    total = func.sum(WebsiteVisitStat.count).label('total')
+    ranked = db.session.query(WebsiteVisitStat.website_id, total)\
+        .filter(WebsiteVisitStat.day >= start_day, WebsiteVisitStat.day <= end_day)\
+        .group_by(WebsiteVisitStat.website_id)\
+        .order_by(total.desc())\
+        .limit(limit)\
+        .subquery()
+    return db.session.query(Website, ranked.c.total)\
+        .join(ranked, ranked.c.website_id == Website.id)\
+        .order_by(ranked.c.total.desc())\
+        .all()
+
+
+def trending_websites(days=7, limit=10, today=None):
+    """
+    最近 days 天访问量最高的链接，并附带前一个同等长度窗口的访问量用于比较
+
+    Returns:
+        list: [(Website, 最近访问量, 之前访问量), ...]
+    """
+    today = today or datetime.utcnow().date()
+    recent_start = today - timedelta(days=days - 1)
+    previous_start = recent_start - timedelta(days=days)
+
+    recent = func.sum(case((WebsiteVisitStat.day >= recent_start, WebsiteVisitStat.count), else_=0)).label('recent')
+    previous = func.sum(case((WebsiteVisitStat.day < recent_start, WebsiteVisitStat.count), else_=0)).label('previous')
+    ranked = db.session.query(WebsiteVisitStat.website_id, recent, previous)\
+        .filter(WebsiteVisitStat.day >= previous_start, WebsiteVisitStat.day <= today)\
+        .group_by(WebsiteVisitStat.website_id)\
+        .having(recent > 0)\
+        .order_by(recent.desc())\
+        .limit(limit)\
+        .subquery()
+    return db.session.query(Website, ranked.c.recent, ranked.c.previous)\
+        .join(ranked, ranked.c.website_id == Website.id)\
+        .order_by(ranked.c.recent.desc())\
+        .all()
+
+
+def rollup_visit_stats(today=None):
+    """
+    定时汇总任务：按统计表校正所有链接的今日访问量
+
+    只在有访问时才会更新 views_today，跨天后没有访问的链接需要由本任务清零。
+
+    Returns:
+        int: 被校正的链接数量
+    """
+    # 先写入本进程尚未提交的计数
+    visit_buffer.flush()
+    today = (today or datetime.utcnow().date()).isoformat()
+    result = db.session.execute(text("""
+        UPDATE website SET views_today = COALESCE((
+            SELECT s.count FROM website_visit_stats s
+            WHERE s.website_id = website.id AND s.day = :today
+        ), 0)
+        WHERE COALESCE(views_today, 0) != COALESCE((
+            SELECT s.count FROM website_visit_stats s
+            WHERE s.website_id = website.id AND s.day = :today
+        ), 0)
+    """), {'today': today})
+    db.session.commit()
+    return result.rowcount
@@ -1,21 +1,111 @@
 """
 WebDAV备份工具模块
 支持HTTP和HTTPS协议的WebDAV备份功能
+
+上传先写入远程的 <文件名>.part，完成后再 MOVE 为正式文件名，远程不会出现写了一半的备份。
+服务器支持 sabre/dav 的部分更新（PATCH + X-Update-Range，Nextcloud等基于sabre/dav的服务）时
+按 WEBDAV_CHUNK_SIZE 分块上传，连接中断后从服务器上已有的字节数继续；不支持时整个文件一次上传，
+失败后从头重试。多个文件由线程池并发上传，共用一个会话和一个限制总带宽的令牌桶。
+
+同步（sync_backups）用一次 PROPFIND Depth: 1 列出远程目录，结合远程目录中 SYNC_INDEX 记录的
+内容哈希，只上传远程缺少或内容不同的备份，再按保留规则删除远程的旧备份。
 """
 
+import hashlib
+import json
 import os
+import re
+import time
+import threading
 import requests
-from urllib.parse import urljoin, urlparse
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from urllib.parse import unquote, urljoin, urlparse
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 import base64
 from datetime import datetime
 from flask import current_app
+from app.utils.icon_fetch import TokenBucket
+
+# 限速的计量单位：每个令牌代表的字节数，与 http.client 每次读取请求体的块大小一致
+THROTTLE_UNIT = 8192
+
+# 这些状态码表示暂时性错误，可以重试
+RETRY_STATUS = {408, 423, 429, 500, 502, 503, 504}
+
+# 远程目录中记录已上传备份的大小和SHA-256的文件
+SYNC_INDEX = 'booknav-backups.json'
+
+PROPFIND_BODY = (b'<?xml version="1.0" encoding="utf-8"?>'
+                 b'<d:propfind xmlns:d="DAV:"><d:prop>'
+                 b'<d:resourcetype/><d:getcontentlength/><d:getlastmodified/>'
+                 b'</d:prop></d:propfind>')
+
+DAV_NS = '{DAV:}'
+
+# 备份文件名中的时间，如 booknav_20250414193523.db3
+BACKUP_TIME_RE = re.compile(r'_(\d{14})\.db3$')
+
+
+class WebDAVError(Exception):
+    """WebDAV请求返回了意外的状态码"""
+
+    def __init__(self, method, status_code):
+        super().__init__(f"{method} 失败: HTTP {status_code}")
+        self.status_code = status_code
+
+    @property
+    def retryable(self):
+        return self.status_code in RETRY_STATUS
+
+
+class _FileRange:
+    """
+    文件中的一段，作为请求体按块读取
+
+    设置了令牌桶时每读取 THROTTLE_UNIT 字节先取得一个令牌，限制上传速度。
+    """
+
+    def __init__(self, path, start, length, limiter=None):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._length = length
+        self._remaining = length
+        self._limiter = limiter
+
+    def __len__(self):
+        # requests 据此设置 Content-Length
+        return self._length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        size = min(size, THROTTLE_UNIT)
+        if size <= 0:
+            return b''
+        if self._limiter is not None:
+            self._limiter.acquire()
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 class WebDAVBackup:
     """WebDAV备份客户端"""
 
-    def __init__(self, url, username, password, remote_path='/backups/'):
+    def __init__(self, url, username, password, remote_path='/backups/', chunk_size=8 * 1024 * 1024,
+                 retries=3, timeout=60, max_rate=0, pool_size=4):
         """
         初始化WebDAV客户端
 
@@ -24,6 +114,11 @@ class WebDAVBackup:
             username: 用户名
             password: 密码
             remote_path: 远程备份路径
+            chunk_size: 分块上传时每块的字节数
+            retries: 上传失败后的重试次数（分块上传有进展时重新计数）
+            timeout: 单次读写的超时时间（秒）
+            max_rate: 所有上传合计每秒最多发送的字节数，0表示不限速
+            pool_size: 连接池大小，不小于并发上传数
         """
         self.url = url.rstrip('/')
         self.username = username
@@ -31,10 +126,22 @@ class WebDAVBackup:
         self.remote_path = remote_path.strip('/')
         if self.remote_path and not self.remote_path.endswith('/'):
             self.remote_path += '/'
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.timeout = timeout
+        self.limiter = TokenBucket(max_rate / THROTTLE_UNIT) if max_rate > 0 else None
 
-        # 配置请求会话
+        # 已确认存在的远程目录，每个目录只 MKCOL 一次；并发上传时由锁保证只有一个线程探测
+        self._directories = set()
+        self._partial_update = None
+        self._probe_lock = threading.Lock()
+
+        # 配置请求会话，所有上传复用同一个会话的连接池
         self.session = requests.Session()
         self.session.auth = HTTPBasicAuth(username, password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
         # 支持HTTP和HTTPS
         parsed_url = urlparse(self.url)
@@ -78,9 +185,12 @@ class WebDAVBackup:
         except Exception as e:
             return False, f"未知错误：{str(e)}"
 
+    def _full_url(self, path):
+        return urljoin(self.url + '/', path.lstrip('/'))
+
     def create_directory(self, path):
         """
-        创建远程目录
+        创建远程目录（包括不存在的上级目录），已确认存在的目录不再请求
 
         Args:
             path: 目录路径
@@ -88,15 +198,80 @@ class WebDAVBackup:
         Returns:
             bool: 是否成功
         """
-        try:
-            full_url = urljoin(self.url + '/', path.lstrip('/'))
-            response = self.session.request('MKCOL', full_url, timeout=30)
-
-            # 201: 创建成功, 405: 目录已存在
-            return response.status_code in [201, 405]
-        except Exception as e:
-            current_app.logger.error(f"创建WebDAV目录失败: {str(e)}")
-            return False
+        current = ''
+        with self._probe_lock:
+            for part in path.strip('/').split('/'):
+                if not part:
+                    continue
+                current += part + '/'
+                if current in self._directories:
+                    continue
+                try:
+                    response = self.session.request('MKCOL', self._full_url(current), timeout=30)
+                except Exception as e:
+                    current_app.logger.error(f"创建WebDAV目录失败: {str(e)}")
+                    return False
+                # 201: 创建成功, 405: 目录已存在
+                if response.status_code not in [201, 405]:
+                    current_app.logger.error(f"创建WebDAV目录失败: {current} HTTP {response.status_code}")
+                    return False
+                self._directories.add(current)
+        return True
+
+    def supports_partial_update(self):
+        """服务器是否支持 sabre/dav 的部分更新（OPTIONS 响应的 DAV 头中声明）"""
+        with self._probe_lock:
+            if self._partial_update is None:
+                try:
+                    response = self.session.request('OPTIONS', self._full_url(self.remote_path),
+                                                    timeout=self.timeout)
+                    self._partial_update = 'sabredav-partialupdate' in response.headers.get('DAV', '').lower()
+                except requests.RequestException:
+                    return False
+            return self._partial_update
+
+    def _remote_size(self, url):
+        """远程文件的字节数，不存在时返回 0"""
+        response = self.session.head(url, timeout=self.timeout)
+        if response.status_code == 404:
+            return 0
+        if response.status_code != 200:
+            raise WebDAVError('HEAD', response.status_code)
+        return int(response.headers.get('Content-Length') or 0)
+
+    def _send(self, method, url, local_path, start, length, headers=None):
+        with _FileRange(local_path, start, length, self.limiter) as body:
+            response = self.session.request(method, url, data=body, headers=headers,
+                                            timeout=(10, self.timeout))
+        if response.status_code not in (200, 201, 204):
+            raise WebDAVError(method, response.status_code)
+
+    def _upload_chunks(self, local_path, size, part_url):
+        """从远程 .part 文件已有的字节数开始，逐块上传剩余部分"""
+        offset = self._remote_size(part_url)
+        if offset > size:
+            # 不是这个文件的未完成上传
+            self.session.delete(part_url, timeout=self.timeout)
+            offset = 0
+        if offset == 0:
+            # 部分更新只能修改已存在的文件，第一块用 PUT 创建
+            length = min(self.chunk_size, size)
+            self._send('PUT', part_url, local_path, 0, length)
+            offset = length
+        while offset < size:
+            length = min(self.chunk_size, size - offset)
+            # 指定写入位置而不是追加，中断后重发同一块不会写重复
+            self._send('PATCH', part_url, local_path, offset, length, headers={
+                'Content-Type': 'application/x-sabredav-partialupdate',
+                'X-Update-Range': f'bytes={offset}-{offset + length - 1}'
+            })
+            offset += length
+
+    def _move(self, source_url, target_url):
+        response = self.session.request('MOVE', source_url, timeout=self.timeout,
+                                        headers={'Destination': target_url, 'Overwrite': 'T'})
+        if response.status_code not in (201, 204):
+            raise WebDAVError('MOVE', response.status_code)
 
     def upload_file(self, local_path, remote_filename):
         """
@@ -123,50 +298,112 @@ class WebDAVBackup:
             else:
                 remote_file_path = remote_filename
 
-            full_url = urljoin(self.url + '/', remote_file_path)
-
-            # 上传文件
-            with open(local_path, 'rb') as f:
-                response = self.session.put(full_url, data=f, timeout=300)
-
-            if response.status_code in [200, 201, 204]:
-                file_size = os.path.getsize(local_path)
-                return True, f"上传成功 ({self._format_size(file_size)})"
-            else:
-                return False, f"上传失败: HTTP {response.status_code}"
+            full_url = self._full_url(remote_file_path)
+            part_url = full_url + '.part'
+            file_size = os.path.getsize(local_path)
+            chunked = self.supports_partial_update()
+
+            failures = 0
+            uploaded = 0
+            while True:
+                try:
+                    if chunked:
+                        self._upload_chunks(local_path, file_size, part_url)
+                    else:
+                        self._send('PUT', part_url, local_path, 0, file_size)
+                    self._move(part_url, full_url)
+                    return True, f"上传成功 ({self._format_size(file_size)})"
+                except (requests.RequestException, WebDAVError) as e:
+                    if isinstance(e, WebDAVError) and not e.retryable:
+                        raise
+                    failures += 1
+                    if failures > self.retries:
+                        raise
+                    current_app.logger.warning(f"WebDAV上传中断，准备重试 {remote_filename}: {str(e)}")
+                    time.sleep(min(2 ** failures, 30))
+                    if chunked:
+                        # 分块上传有进展时重新计算重试次数
+                        try:
+                            remote_size = self._remote_size(part_url)
+                            if remote_size > uploaded:
+                                failures = 0
+                                uploaded = remote_size
+                        except (requests.RequestException, WebDAVError):
+                            pass
 
         except Exception as e:
             current_app.logger.error(f"WebDAV上传失败: {str(e)}")
             return False, f"上传失败: {str(e)}"
 
+    def _remote_dir_url(self):
+        return self._full_url(self.remote_path) if self.remote_path else self.url + '/'
+
     def list_files(self):
         """
-        列出远程备份目录的文件
+        列出远程备份目录的文件，一次 PROPFIND Depth: 1 请求得到所有文件的大小和修改时间
 
         Returns:
-            tuple: (success: bool, files: list or error_message: str)
+            tuple: (success: bool, files: list or error_message: str)，
+            files 中每项为 {'name', 'size', 'modified'}，modified 为时间戳，服务器未返回时为 None
         """
         try:
-            if self.remote_path:
-                list_url = urljoin(self.url + '/', self.remote_path)
-            else:
-                list_url = self.url
-
-            response = self.session.request('PROPFIND', list_url, timeout=30)
-
-            if response.status_code in [200, 207]:
-                # 简单解析响应（实际实现可能需要更复杂的XML解析）
-                files = []
-                # 这里可以解析WebDAV的XML响应来获取文件列表
-                # 为了简化，返回成功状态
-                return True, files
-            else:
+            response = self.session.request('PROPFIND', self._remote_dir_url(), data=PROPFIND_BODY,
+                                            headers={'Depth': '1', 'Content-Type': 'application/xml'},
+                                            timeout=30)
+
+            if response.status_code == 404:
+                # 远程目录还不存在
+                return True, []
+            if response.status_code not in [200, 207]:
                 return False, f"列表获取失败: HTTP {response.status_code}"
 
+            files = []
+            for item in ET.fromstring(response.content).iter(f'{DAV_NS}response'):
+                href = item.findtext(f'{DAV_NS}href') or ''
+                prop = None
+                for propstat in item.iter(f'{DAV_NS}propstat'):
+                    if ' 200 ' in (propstat.findtext(f'{DAV_NS}status') or '') + ' ':
+                        prop = propstat.find(f'{DAV_NS}prop')
+                        break
+                # 跳过目录本身和子目录
+                if prop is None or href.endswith('/') or prop.find(f'{DAV_NS}resourcetype/{DAV_NS}collection') is not None:
+                    continue
+                modified = prop.findtext(f'{DAV_NS}getlastmodified')
+                try:
+                    modified = parsedate_to_datetime(modified).timestamp() if modified else None
+                except (TypeError, ValueError):
+                    modified = None
+                files.append({
+                    'name': unquote(href.rsplit('/', 1)[-1]),
+                    'size': int(prop.findtext(f'{DAV_NS}getcontentlength') or 0),
+                    'modified': modified
+                })
+            return True, files
+
         except Exception as e:
             current_app.logger.error(f"WebDAV文件列表获取失败: {str(e)}")
             return False, f"获取文件列表失败: {str(e)}"
 
+    def read_index(self):
+        """读取远程的 SYNC_INDEX，不存在或无法解析时返回空字典"""
+        response = self.session.get(self._full_url(f"{self.remote_path}{SYNC_INDEX}"), timeout=self.timeout)
+        if response.status_code == 404:
+            return {}
+        if response.status_code != 200:
+            raise WebDAVError('GET', response.status_code)
+        try:
+            index = response.json()
+        except ValueError:
+            return {}
+        return index if isinstance(index, dict) else {}
+
+    def write_index(self, index):
+        data = json.dumps(index, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        response = self.session.put(self._full_url(f"{self.remote_path}{SYNC_INDEX}"), data=data,
+                                    timeout=self.timeout)
+        if response.status_code not in (200, 201, 204):
+            raise WebDAVError('PUT', response.status_code)
+
     def delete_file(self, remote_filename):
         """
         删除远程文件
@@ -248,24 +485,31 @@ def create_webdav_client(settings):
         if not decoded_password:
             return None
 
+        config = current_app.config
         return WebDAVBackup(
             url=settings.webdav_url,
             username=settings.webdav_username,
             password=decoded_password,
-            remote_path=settings.webdav_path or '/backups/'
+            remote_path=settings.webdav_path or '/backups/',
+            chunk_size=config.get('WEBDAV_CHUNK_SIZE', 8 * 1024 * 1024),
+            retries=config.get('WEBDAV_UPLOAD_RETRIES', 3),
+            timeout=config.get('WEBDAV_TIMEOUT', 60),
+            max_rate=config.get('WEBDAV_MAX_RATE', 0),
+            pool_size=config.get('WEBDAV_UPLOAD_WORKERS', 3)
         )
     except Exception as e:
         current_app.logger.error(f"创建WebDAV客户端失败: {str(e)}")
         return None
 
 
-def backup_to_webdav(backup_file_path, settings):
+def backup_to_webdav(backup_file_path, settings, remote_filename=None):
     """
     执行WebDAV备份
 
     Args:
         backup_file_path: 本地备份文件路径
         settings: SiteSettings对象
+        remote_filename: 远程文件名，默认与本地文件名相同
 
     Returns:
         tuple: (success: bool, message: str)
@@ -278,7 +522,7 @@ def backup_to_webdav(backup_file_path, settings):
         return False, f"备份文件不存在: {backup_file_path}"
 
     # 生成远程文件名
-    filename = os.path.basename(backup_file_path)
+    filename = remote_filename or os.path.basename(backup_file_path)
 
     # 上传文件
     success, message = webdav_client.upload_file(backup_file_path, filename)
@@ -288,4 +532,170 @@ def backup_to_webdav(backup_file_path, settings):
     else:
         current_app.logger.error(f"WebDAV备份失败: {message}")
 
-    return success, message
\ No newline at end of file
+    return success, message
+
+
+def upload_backups(client, filenames, open_file, workers=3):
+    """
+    用线程池并发上传多个备份文件
+
+    Args:
+        client: WebDAV客户端，所有线程共用其会话、目录缓存和限速令牌桶
+        filenames: 要上传的备份文件名
+        open_file: 上下文管理器工厂，open_file(文件名) 得到本地文件路径（如 backup_store.backup_file）
+        workers: 并发上传的文件数
+
+    Returns:
+        dict: {文件名: (success, message)}
+    """
+    app = current_app._get_current_object()
+
+    def upload(filename):
+        with app.app_context():
+            try:
+                with open_file(filename) as path:
+                    return client.upload_file(path, filename)
+            except Exception as e:
+                app.logger.error(f"WebDAV上传失败 {filename}: {str(e)}")
+                return False, f"上传失败: {str(e)}"
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='webdav-upload') as executor:
+        futures = {executor.submit(upload, filename): filename for filename in filenames}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+
+def backup_time(filename, default=None):
+    """备份时间：优先取文件名中的时间，否则为 default"""
+    match = BACKUP_TIME_RE.search(filename)
+    if match:
+        try:
+            return datetime.strptime(match.group(1), '%Y%m%d%H%M%S').timestamp()
+        except ValueError:
+            pass
+    return default
+
+
+def select_expired(files, last=0, daily=0, weekly=0, monthly=0):
+    """
+    按保留规则选出应删除的备份
+
+    保留最新的 last 个，以及最近 daily 天、weekly 周、monthly 个月中每天/周/月最新的一个；
+    所有规则都为0时全部保留。
+
+    Args:
+        files: [(文件名, 时间戳)]
+
+    Returns:
+        list: 应删除的文件名
+    """
+    if not any((last, daily, weekly, monthly)):
+        return []
+    ordered = sorted(files, key=lambda item: item[1], reverse=True)
+    keep = {name for name, _ in ordered[:last]}
+    for count, period in ((daily, '%Y-%m-%d'), (weekly, '%G-%V'), (monthly, '%Y-%m')):
+        seen = set()
+        for name, timestamp in ordered:
+            if len(seen) >= count:
+                break
+            key = datetime.fromtimestamp(timestamp).strftime(period)
+            if key not in seen:
+                seen.add(key)
+                keep.add(name)
+    return [name for name, _ in ordered if name not in keep]
+
+
+def _local_hash(backup, open_file):
+    """本地备份的SHA-256，备份存储的清单中已有时直接使用"""
+    if backup.get('sha256'):
+        return backup['sha256']
+    file_hash = hashlib.sha256()
+    with open_file(backup['filename']) as path:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def sync_backups(client, backups, open_file, workers=3, retention=None):
+    """
+    把本地备份同步到WebDAV：只上传远程缺少或内容不同的备份，再按保留规则删除远程的旧备份；
+    按保留规则应删除的备份即使本地仍保留也不上传
+
+    远程文件与本地备份大小相同时，SYNC_INDEX 中记录了哈希的按哈希比较；
+    没有记录的（如早期直接上传的文件）修改时间不早于本地备份时间即视为相同，并补记哈希。
+
+    Args:
+        client: WebDAV客户端
+        backups: 本地备份信息列表（filename、size、time，以及可能有的 sha256）
+        open_file: 上下文管理器工厂，open_file(文件名) 得到本地文件路径
+        workers: 并发上传的文件数
+        retention: 远程保留规则 {'last', 'daily', 'weekly', 'monthly'}，为空时不删除远程文件
+
+    Returns:
+        dict: uploaded、skipped、failed、deleted 四项计数
+    """
+    success, remote_files = client.list_files()
+    if not success:
+        raise Exception(remote_files)
+    remote = {item['name']: item for item in remote_files}
+    index = client.read_index()
+    index_changed = False
+
+    # 保留规则按本地和远程的全部备份计算：本地仍保留、按规则远程应删除的备份不上传，
+    # 否则每次同步都会把它作为缺少的备份补传后再删除
+    expired = set()
+    if retention:
+        times = {name: backup_time(name, item['modified'] or 0)
+                 for name, item in remote.items() if name.endswith('.db3')}
+        times.update((backup['filename'], backup_time(backup['filename'], backup['time'])) for backup in backups)
+        expired = set(select_expired(list(times.items()), **retention))
+
+    pending = []
+    hashes = {}
+    for backup in backups:
+        name = backup['filename']
+        if name in expired:
+            continue
+        item = remote.get(name)
+        if item is None or item['size'] != backup['size']:
+            pending.append(name)
+            continue
+        hashes[name] = _local_hash(backup, open_file)
+        recorded = (index.get(name) or {}).get('sha256')
+        if recorded:
+            if recorded != hashes[name]:
+                pending.append(name)
+        elif item['modified'] is not None and item['modified'] >= backup['time']:
+            index[name] = {'size': backup['size'], 'sha256': hashes[name]}
+            index_changed = True
+        else:
+            pending.append(name)
+
+    summary = {'uploaded': 0, 'skipped': len(backups) - len(pending), 'failed': 0, 'deleted': 0}
+    by_name = {backup['filename']: backup for backup in backups}
+    for name, (uploaded, message) in upload_backups(client, pending, open_file, workers).items():
+        if uploaded:
+            summary['uploaded'] += 1
+            backup = by_name[name]
+            index[name] = {'size': backup['size'], 'sha256': hashes.get(name) or _local_hash(backup, open_file)}
+            index_changed = True
+            remote[name] = {'name': name, 'size': backup['size'], 'modified': time.time()}
+        else:
+            summary['failed'] += 1
+
+    for name in sorted(expired):
+        if name in remote:
+            deleted, message = client.delete_file(name)
+            if deleted:
+                summary['deleted'] += 1
+                index.pop(name, None)
+                index_changed = True
+            else:
+                current_app.logger.warning(f"删除远程旧备份失败 {name}: {message}")
+
+    if index_changed:
+        client.write_index(index)
+    return summary
@@ -0,0 +1,173 @@
+"""
+死链检测性能测试
+在本地启动模拟网站的HTTP服务（可设置响应延迟），对比原先的线程池分批检测
+（5个线程、每批20个、批间休息1秒、每次请求新建连接）与异步检测引擎的每秒检测链接数
+
+用法: python benchmarks/deadlink_benchmark.py [--links 2000] [--hosts 20] [--latency 0.05]
+"""
+
+import argparse
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import seed  # noqa: F401  将项目根目录加入 sys.path
+
+import requests
+from app.utils.deadlink import CHECK_HEADERS, check_links, is_valid_status
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    模拟各种网站的响应：
+        /ok       HEAD和GET都返回200
+        /nohead   HEAD返回405，GET返回200（需要回退到GET）
+        /missing  返回404
+        /moved    302跳转到 /ok
+    """
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    connections = Counter()
+
+    def setup(self):
+        super().setup()
+        StubHandler.connections['total'] += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=b'', location=None):
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(status)
+        if location:
+            self.send_header('Location', location)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _route(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/ok':
+            self._reply(200, b'<html>ok</html>' * 200)
+        elif path == '/nohead':
+            if self.command == 'HEAD':
+                self._reply(405)
+            else:
+                self._reply(200, b'<html>ok</html>' * 200)
+        elif path == '/moved':
+            self._reply(302, location='/ok')
+        else:
+            self._reply(404, b'not found')
+
+    do_HEAD = _route
+    do_GET = _route
+
+
+def start_stub_servers(count, latency):
+    """启动 count 个模拟服务，每个端口相当于一个独立的主机"""
+    StubHandler.latency = latency
+    servers = []
+    for _ in range(count):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def build_links(servers, count, rng):
+    paths = ['/ok'] * 7 + ['/nohead', '/missing', '/moved']
+    return [
+        (i, f'http://127.0.0.1:{rng.choice(servers).server_address[1]}{rng.choice(paths)}?id={i}')
+        for i in range(1, count + 1)
+    ]
+
+
+def legacy_check(website_id, url):
+    """原先的检测方式：每次请求新建连接，HEAD失败时再发GET"""
+    try:
+        try:
+            response = requests.head(url, timeout=15, headers=CHECK_HEADERS, allow_redirects=True)
+            status_code = response.status_code
+            if status_code >= 400:
+                raise requests.exceptions.RequestException()
+        except requests.exceptions.RequestException:
+            response = requests.get(url, timeout=15, headers=CHECK_HEADERS, allow_redirects=True, stream=True)
+            for chunk in response.iter_content(chunk_size=1024):
+                if chunk:
+                    break
+            status_code = response.status_code
+            response.close()
+        return website_id, is_valid_status(status_code)
+    except requests.exceptions.RequestException:
+        return website_id, False
+
+
+def run_legacy(links, batch_size=20, max_workers=5, pause=1.0):
+    results = {}
+    for i in range(0, len(links), batch_size):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(legacy_check, *link) for link in links[i:i + batch_size]]
+            for future in as_completed(futures):
+                website_id, is_valid = future.result()
+                results[website_id] = is_valid
+        time.sleep(pause)
+    return results
+
+
+def run_async(links, concurrency, per_host):
+    results = {}
+    check_links(links, on_result=lambda result: results.__setitem__(result[0], result[2]),
+                concurrency=concurrency, per_host=per_host)
+    return results
+
+
+def report(name, links, elapsed, results):
+    valid = sum(1 for is_valid in results.values() if is_valid)
+    print(f"  {name:<10} {len(results):>6} 个链接  有效 {valid:>6}  用时 {elapsed:7.2f}s  "
+          f"{len(results) / elapsed:8.1f} 个/秒  新建连接 {StubHandler.connections['total']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='死链检测性能测试')
+    parser.add_argument('--links', type=int, default=2000)
+    parser.add_argument('--hosts', type=int, default=20, help='模拟的主机数量')
+    parser.add_argument('--latency', type=float, default=0.05, help='模拟服务每次响应的延迟（秒）')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--per-host', type=int, default=4)
+    parser.add_argument('--legacy-links', type=int, default=200, help='原检测方式只测试这么多链接，0表示跳过')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    servers = start_stub_servers(args.hosts, args.latency)
+    links = build_links(servers, args.links, rng)
+    print(f"模拟主机 {args.hosts} 个, 响应延迟 {args.latency * 1000:.0f}ms")
+
+    if args.legacy_links:
+        legacy_links = links[:args.legacy_links]
+        StubHandler.connections.clear()
+        start = time.perf_counter()
+        legacy_results = run_legacy(legacy_links)
+        report('原方式', legacy_links, time.perf_counter() - start, legacy_results)
+
+    StubHandler.connections.clear()
+    start = time.perf_counter()
+    async_results = run_async(links, args.concurrency, args.per_host)
+    report('异步引擎', links, time.perf_counter() - start, async_results)
+
+    if args.legacy_links:
+        mismatched = [i for i, is_valid in legacy_results.items() if async_results.get(i) != is_valid]
+        print(f"  两种方式结果不一致的链接: {len(mismatched)} 个")
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
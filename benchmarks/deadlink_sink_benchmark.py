@@ -0,0 +1,88 @@
+"""
+死链检测结果写入性能测试
+不发送网络请求，直接用构造的检测结果对比逐条查询+提交与按批次写入的每秒写入条数
+
+用法: python benchmarks/deadlink_sink_benchmark.py [--links 20000] [--batch-sizes 50,200,1000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from seed import create_bench_app, seed_database
+
+from app import db
+from app.models import DeadlinkCheck, Website
+from app.utils.deadlink import save_check_results
+
+
+def build_results(link_count, rng):
+    results = []
+    for website_id in range(1, link_count + 1):
+        is_valid = rng.random() < 0.9
+        status_code = 200 if is_valid else rng.choice([404, 500, None])
+        error_type = None if is_valid else (f'http_{status_code}' if status_code else 'timeout')
+        results.append((website_id, f'https://example.com/{website_id}', is_valid, status_code,
+                        error_type, None if is_valid else '检测失败', rng.random()))
+    return results
+
+
+def save_one_by_one(check_id, results):
+    """原先的写入方式：每条结果查询一次链接并提交一次"""
+    for website_id, url, is_valid, status_code, error_type, error_message, response_time in results:
+        website = Website.query.get(website_id)
+        if website:
+            db.session.add(DeadlinkCheck(
+                check_id=check_id, website_id=website_id, url=url, is_valid=is_valid,
+                status_code=status_code, error_type=error_type, error_message=error_message,
+                response_time=response_time, checked_at=datetime.utcnow()
+            ))
+            website.last_check = datetime.utcnow()
+            website.is_valid = is_valid
+            db.session.commit()
+
+
+def save_in_batches(check_id, results, batch_size):
+    for i in range(0, len(results), batch_size):
+        save_check_results(check_id, results[i:i + batch_size])
+
+
+def run(name, link_count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<16} 用时 {elapsed:7.2f}s  {link_count / elapsed:9.0f} 条/秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='死链检测结果写入性能测试')
+    parser.add_argument('--links', type=int, default=20000)
+    parser.add_argument('--batch-sizes', default='50,200,1000')
+    parser.add_argument('--legacy-links', type=int, default=2000, help='逐条写入方式只测试这么多条，0表示跳过')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    results = build_results(args.links, rng)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = create_bench_app(os.path.join(tmp_dir, 'bench.db'))
+        seed_database(app, args.links)
+        print(f"链接数量: {args.links}")
+
+        with app.app_context():
+            if args.legacy_links:
+                legacy = results[:args.legacy_links]
+                run(f'逐条({len(legacy)})', len(legacy), lambda: save_one_by_one(str(uuid.uuid4()), legacy))
+                db.session.remove()
+
+            for batch_size in [int(s) for s in args.batch_sizes.split(',') if s]:
+                run(f'批量 {batch_size}/批', len(results),
+                    lambda: save_in_batches(str(uuid.uuid4()), results, batch_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+首页数据加载性能测试
+对比旧的逐分类查询与 load_homepage_data 的SQL次数和p95延迟
+
+用法: python benchmarks/homepage_benchmark.py [--links 50000] [--iterations 30]
+"""
+
+import argparse
+import os
+import tempfile
+
+from seed import create_bench_app, seed_database, QueryCounter, measure, report
+
+from flask_login import AnonymousUserMixin
+from app import db
+from app.models import Category, Website, User
+from app.utils.homepage import load_homepage_data
+
+
+def legacy_homepage_data(user):
+    """改造前 main.index 的加载逻辑，用作对照"""
+    categories = Category.query.order_by(Category.order.desc()).all()
+
+    featured_sites_query = Website.query.filter_by(is_featured=True)
+    if not user.is_authenticated:
+        featured_sites_query = featured_sites_query.filter_by(is_private=False)
+    elif not user.is_admin:
+        featured_sites_query = featured_sites_query.filter(
+            (Website.is_private == False) |
+            (Website.created_by_id == user.id) |
+            (Website.visible_to.contains(str(user.id)))
+        )
+    featured_sites = featured_sites_query.order_by(Website.views.desc()).limit(6).all()
+
+    for category in categories:
+        websites_query = Website.query.filter_by(category_id=category.id)
+        if not user.is_authenticated:
+            websites_query = websites_query.filter_by(is_private=False)
+        elif not user.is_admin:
+            websites_query = websites_query.filter(
+                (Website.is_private == False) |
+                (Website.created_by_id == user.id) |
+                (Website.visible_to.contains(str(user.id)))
+            )
+        category.total_count = websites_query.count()
+        category.website_list = websites_query.order_by(
+            Website.sort_order.desc(),
+            Website.created_at.asc(),
+            Website.views.desc()
+        ).limit(category.display_limit).all()
+
+        for child in category.children:
+            child_query = Website.query.filter_by(category_id=child.id)
+            if not user.is_authenticated:
+                child_query = child_query.filter_by(is_private=False)
+            elif not user.is_admin:
+                child_query = child_query.filter(
+                    (Website.is_private == False) |
+                    (Website.created_by_id == user.id) |
+                    (Website.visible_to.contains(str(user.id)))
+                )
+            child.total_count = child_query.count()
+    return categories, featured_sites
+
+
+def run_case(label, loader, user, iterations):
+    with QueryCounter(db.engine) as counter:
+        loader(user)
+        db.session.remove()
+    timings = measure(lambda: (loader(user), db.session.remove()), iterations)
+    report(label, timings, counter.count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='首页数据加载性能测试')
+    parser.add_argument('--links', type=int, default=50000)
+    parser.add_argument('--categories', type=int, default=80)
+    parser.add_argument('--iterations', type=int, default=30)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = create_bench_app(os.path.join(tmp_dir, 'bench.db'))
+        seed_database(app, args.links, args.categories)
+        print(f"数据量: {args.links} 个链接, {args.categories} 个分类")
+
+        with app.test_request_context():
+            anonymous = AnonymousUserMixin()
+            member = User(id=5, username='bench', is_admin=False)
+
+            # 校验两种实现的结果一致
+            legacy_categories, _ = legacy_homepage_data(anonymous)
+            expected = {c.id: (c.total_count, [w.id for w in c.website_list]) for c in legacy_categories}
+            db.session.remove()
+            categories, _ = load_homepage_data(anonymous)
+            actual = {c.id: (c.total_count, [w.id for w in c.website_list]) for c in categories}
+            db.session.remove()
+            print("结果一致" if expected == actual else "警告: 结果不一致")
+
+            for name, user in (('anonymous', anonymous), ('member', member)):
+                run_case(f'legacy/{name}', legacy_homepage_data, user, args.iterations)
+                run_case(f'single-pass/{name}', load_homepage_data, user, args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+批量抓取图标性能测试
+用本地模拟服务代替小小API和图标地址（可设置响应延迟），对比原先逐个抓取并在每个网站后
+休眠1秒的方式与并发限速抓取的每秒处理网站数
+
+用法: python benchmarks/icon_fetch_benchmark.py [--sites 400] [--latency 0.1] [--xxapi-rate 4]
+"""
+
+import argparse
+import random
+import time
+
+import requests
+
+from deadlink_benchmark import start_stub_servers
+from app.utils.icon_fetch import fetch_icons
+
+
+def make_get_icon(server, rng, success_ratio):
+    """模拟 get_website_icon：请求一次模拟服务，按比例返回图标地址或备用图标地址"""
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    outcomes = {}
+
+    def get_icon(url):
+        requests.get(f'{base}/ok', timeout=5)
+        outcome = outcomes.setdefault(url, rng.random())
+        if outcome < success_ratio:
+            return {'success': True, 'icon_url': f'{base}/ok?icon={url}'}
+        # 一半的备用图标可以访问
+        path = '/ok' if outcome < (1 + success_ratio) / 2 else '/missing'
+        return {'success': False, 'message': '无法获取图标', 'fallback_url': f'{base}{path}'}
+    return get_icon
+
+
+def run_legacy(links, get_icon, pause):
+    """原先的抓取方式：逐个抓取，备用图标用HEAD验证，每个网站后休眠"""
+    results = {}
+    for website_id, url in links:
+        result = get_icon(url)
+        icon = result.get('icon_url') if result['success'] else None
+        if icon is None and result.get('fallback_url'):
+            try:
+                if requests.head(result['fallback_url'], timeout=5).status_code < 400:
+                    icon = result['fallback_url']
+            except requests.RequestException:
+                pass
+        results[website_id] = icon
+        time.sleep(pause)
+    return results
+
+
+def run_concurrent(links, get_icon, workers, rates):
+    results = {}
+    fetch_icons(links, on_result=lambda result: results.__setitem__(*result),
+                workers=workers, rates=rates, get_icon=get_icon)
+    return results
+
+
+def report(name, elapsed, results):
+    found = sum(1 for icon in results.values() if icon)
+    print(f"  {name:<10} {len(results):>6} 个网站  找到图标 {found:>6}  用时 {elapsed:7.2f}s  "
+          f"{len(results) / elapsed:7.2f} 个/秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量抓取图标性能测试')
+    parser.add_argument('--sites', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.1, help='模拟服务每次响应的延迟（秒）')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--xxapi-rate', type=float, default=4, help='小小API每秒请求数上限，0表示不限速')
+    parser.add_argument('--legacy-sites', type=int, default=20, help='原抓取方式只测试这么多网站，0表示跳过')
+    parser.add_argument('--legacy-pause', type=float, default=1.0)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    servers = start_stub_servers(2, args.latency)
+    get_icon = make_get_icon(servers[0], rng, success_ratio=0.7)
+    # 网站地址指向另一个模拟服务，其 /favicon.ico 返回404
+    site_port = servers[1].server_address[1]
+    links = [(i, f'http://127.0.0.1:{site_port}/site{i}') for i in range(1, args.sites + 1)]
+    rates = {'xxapi': args.xxapi_rate, 'cccyun': args.xxapi_rate, 'direct': 0}
+    print(f"模拟响应延迟 {args.latency * 1000:.0f}ms, 小小API限速 {args.xxapi_rate or '不限'}/秒")
+
+    if args.legacy_sites:
+        legacy_links = links[:args.legacy_sites]
+        start = time.perf_counter()
+        legacy_results = run_legacy(legacy_links, get_icon, args.legacy_pause)
+        report('原方式', time.perf_counter() - start, legacy_results)
+
+    start = time.perf_counter()
+    results = run_concurrent(links, get_icon, args.workers, rates)
+    report('并发限速', time.perf_counter() - start, results)
+
+    if args.legacy_sites:
+        mismatched = [i for i, icon in legacy_results.items() if results.get(i) != icon]
+        print(f"  两种方式结果不一致的网站: {len(mismatched)} 个")
+
+    # 停止请求的响应时间：发出停止请求后多久返回
+    stop_at = time.perf_counter() + 1.0
+    partial = {}
+    fetch_icons(links, on_result=lambda result: partial.__setitem__(*result),
+                should_stop=lambda: time.perf_counter() >= stop_at,
+                workers=args.workers, rates=rates, get_icon=get_icon)
+    print(f"  运行1秒后请求停止，{time.perf_counter() - stop_at:.2f}s 后退出，已处理 {len(partial)} 个网站")
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+搜索性能测试
+对比 LIKE '%关键词%' 全表扫描与 FTS5 全文索引在不同数据量下的p50/p95延迟
+
+用法: python benchmarks/search_benchmark.py [--sizes 10000,100000,500000] [--iterations 20]
+"""
+
+import argparse
+import os
+import tempfile
+
+from seed import create_bench_app, seed_database, measure, report
+
+from flask_login import AnonymousUserMixin
+from app import db
+from app.utils.pinyin_index import sync_pinyin_index
+from app.utils.search import get_tokenizer, _like_search, search_websites
+
+# 覆盖常见输入：英文单词、中文词、URL片段、多关键词、无结果、拼音首字母、全拼及拼写错误
+KEYWORDS = ['cloud', '设计工具', 'example.com', 'docs 网站描述', 'nothing-here', 'dh', 'daohang', 'daohnag']
+
+
+def run_size(link_count, iterations, limit):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = create_bench_app(os.path.join(tmp_dir, 'bench.db'))
+        seed_database(app, link_count)
+
+        with app.test_request_context():
+            # 测试数据由原生SQL写入，需要补全拼音数据
+            sync_pinyin_index()
+            print(f"\n数据量: {link_count} 个链接, 分词器: {get_tokenizer() or '无(仅LIKE)'}")
+            anonymous = AnonymousUserMixin()
+            for keyword in KEYWORDS:
+                like_count = len(_like_search(keyword, anonymous))
+                fts_count = len(search_websites(keyword, anonymous))
+                db.session.remove()
+                print(f"  关键词 {keyword!r}: LIKE {like_count} 条, FTS5 {fts_count} 条")
+
+                report(f'like/{keyword}', measure(
+                    lambda: (_like_search(keyword, anonymous, limit=limit), db.session.remove()),
+                    iterations))
+                report(f'fts5/{keyword}', measure(
+                    lambda: (search_websites(keyword, anonymous, limit=limit), db.session.remove()),
+                    iterations))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='搜索性能测试')
+    parser.add_argument('--sizes', default='10000,100000,500000')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=50, help='每次搜索返回的最大条数')
+    args = parser.parse_args()
+
+    for size in [int(s) for s in args.sizes.split(',') if s]:
+        run_size(size, args.iterations, args.limit)
+
+
+if __name__ == '__main__':
+    main()
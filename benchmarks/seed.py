@@ -0,0 +1,129 @@
+"""
+性能测试公共工具
+创建指向临时SQLite数据库的应用实例，并快速灌入测试数据
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from sqlalchemy import event
+from config import Config
+from app import create_app, db
+
+WORDS = ['导航', '工具', '设计', '开发', '文档', '社区', '视频', '音乐', '新闻', '学习',
+         'search', 'cloud', 'code', 'docs', 'map', 'mail', 'shop', 'wiki', 'news', 'blog']
+
+
+def create_bench_app(db_path):
+    """创建使用指定数据库文件的应用实例"""
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + db_path
+        WTF_CSRF_ENABLED = False
+
+    return create_app(BenchConfig)
+
+
+def seed_database(app, link_count, category_count=80, child_ratio=0.25, private_ratio=0.1, seed=42):
+    """使用原生executemany批量写入分类和链接，返回分类ID列表"""
+    rng = random.Random(seed)
+    with app.app_context():
+        conn = db.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            now = datetime.utcnow()
+
+            top_count = max(1, int(category_count * (1 - child_ratio)))
+            categories = []
+            for i in range(1, category_count + 1):
+                parent_id = None if i <= top_count else rng.randint(1, top_count)
+                categories.append((i, f'分类{i}', '', 'folder', '#3498db', rng.randint(0, 100), 10, now, parent_id))
+            cursor.executemany(
+                'INSERT INTO category (id, name, description, icon, color, "order", display_limit, created_at, parent_id) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', categories)
+
+            rows = []
+            for i in range(1, link_count + 1):
+                words = rng.sample(WORDS, 3)
+                rows.append((
+                    ' '.join(words) + f' {i}',
+                    f'https://www.{words[0]}{i}.example.com/',
+                    f'{words[1]} {words[2]} 网站描述 {i}',
+                    '',
+                    rng.randint(0, 10000),
+                    rng.random() < 0.001,
+                    now - timedelta(minutes=i),
+                    rng.randint(0, 50),
+                    rng.randint(1, category_count),
+                    1,
+                    rng.random() < private_ratio,
+                    '',
+                    0,
+                    True
+                ))
+                if len(rows) >= 10000:
+                    _insert_websites(cursor, rows)
+                    rows = []
+            if rows:
+                _insert_websites(cursor, rows)
+            conn.commit()
+        finally:
+            conn.close()
+    return list(range(1, category_count + 1))
+
+
+def _insert_websites(cursor, rows):
+    cursor.executemany(
+        'INSERT INTO website (title, url, description, icon, views, is_featured, created_at, sort_order, '
+        'category_id, created_by_id, is_private, visible_to, views_today, is_valid) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+class QueryCounter:
+    """统计代码块内执行的SQL语句数量"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def measure(func, iterations):
+    """执行多次并返回耗时列表（毫秒）"""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(values, pct):
+    """计算百分位数"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def report(name, timings, queries=None):
+    """打印测试结果"""
+    line = f"{name:<28} p50={percentile(timings, 50):8.2f}ms  p95={percentile(timings, 95):8.2f}ms"
+    if queries is not None:
+        line += f"  queries={queries}"
+    print(line)
@@ -0,0 +1,75 @@
+"""
+输入提示性能测试
+模拟逐字输入，对比每次按键执行 /api/search 与 /api/suggest 的p50/p95延迟
+
+用法: python benchmarks/suggest_benchmark.py [--links 100000] [--iterations 20]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from seed import create_bench_app, seed_database, measure, report
+
+from flask_login import AnonymousUserMixin
+from app import db
+from app.models import User
+from app.utils.pinyin_index import sync_pinyin_index
+from app.utils.search import search_websites
+from app.utils.suggest import suggest_index
+
+# 每个词按输入过程拆成逐步变长的前缀
+WORDS = ['blog', 'search', 'daohang', 'dh', 'www.cloud', '导航']
+
+
+def keystrokes():
+    for word in WORDS:
+        for i in range(1, len(word) + 1):
+            yield word[:i]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='输入提示性能测试')
+    parser.add_argument('--links', type=int, default=100000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = create_bench_app(os.path.join(tmp_dir, 'bench.db'))
+        seed_database(app, args.links)
+        print(f"数据量: {args.links} 个链接")
+
+        with app.test_request_context():
+            sync_pinyin_index()
+            anonymous = AnonymousUserMixin()
+            member = User(id=5, username='bench', is_admin=False)
+
+            start = time.perf_counter()
+            suggest_index.suggest('a', anonymous)
+            print(f"索引构建耗时: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+            prefixes = list(keystrokes())
+            for name, user in (('anonymous', anonymous), ('member', member)):
+                per_key = []
+                for prefix in prefixes:
+                    per_key.extend(measure(lambda: suggest_index.suggest(prefix, user), args.iterations))
+                report(f'suggest/{name}/keystroke', per_key)
+
+            # 每个前缀第一次出现时的耗时（未命中短前缀缓存）
+            suggest_index.clear()
+            suggest_index.suggest('a', anonymous)
+            report('suggest/anonymous/first', [
+                measure(lambda: suggest_index.suggest(prefix, anonymous), 1)[0] for prefix in prefixes
+            ])
+
+            per_key = []
+            for prefix in prefixes:
+                per_key.extend(measure(
+                    lambda: (search_websites(prefix, anonymous), db.session.remove()), max(1, args.iterations // 10)
+                ))
+            report('search/anonymous/keystroke', per_key)
+
+
+if __name__ == '__main__':
+    main()
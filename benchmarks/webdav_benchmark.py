@@ -0,0 +1,383 @@
+"""
+WebDAV上传性能测试
+在本地启动模拟WebDAV服务（可设置每个连接的带宽、是否支持sabre/dav部分更新、每传输多少字节断开一次连接），
+对比原先逐个文件整体PUT（每个文件前MKCOL、没有重试）与分块续传、并发上传的用时、发送字节数和成功数，
+并校验上传结果与本地文件一致；最后模拟每晚同步：远程已有之前的备份时，对比全部重新上传与
+只上传新备份的流量，以及远程保留规则的效果
+
+用法: python benchmarks/webdav_benchmark.py [--files 6] [--size-mb 8] [--bandwidth-mb 4] [--drop-every-mb 20]
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+import seed  # noqa: F401  将项目根目录加入 sys.path
+
+import requests
+from flask import Flask
+from app.utils.webdav_backup import WebDAVBackup, sync_backups, upload_backups
+
+
+class DAVState:
+    """模拟服务的存储和统计，所有连接共享"""
+
+    def __init__(self, partial, bandwidth, drop_every):
+        self.partial = partial
+        self.bandwidth = bandwidth
+        self.drop_every = drop_every
+        self.files = {}
+        self.modified = {}
+        self.directories = {'/'}
+        self.requests = Counter()
+        self.received = 0
+        self.drops = 0
+        self._since_drop = 0
+        self.lock = threading.Lock()
+
+    def count(self, size):
+        """记录收到的字节数，返回是否应该在这里断开连接"""
+        with self.lock:
+            self.received += size
+            self._since_drop += size
+            if self.drop_every and self._since_drop >= self.drop_every:
+                self._since_drop = 0
+                self.drops += 1
+                return True
+        return False
+
+
+class StubDAVHandler(BaseHTTPRequestHandler):
+    """
+    模拟WebDAV服务：OPTIONS、MKCOL、GET、PUT、PATCH（X-Update-Range）、HEAD、MOVE、DELETE、PROPFIND
+    请求体按设置的带宽接收；连接被断开时丢弃这个请求已收到的数据
+    """
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _path(self, url=None):
+        return unquote(urlsplit(url or self.path).path).rstrip('/') or '/'
+
+    def _parent(self, path):
+        return path.rsplit('/', 1)[0] or '/'
+
+    def _reply(self, status, headers=None, body=b''):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _read_body(self):
+        """按带宽接收请求体，需要模拟断线时返回 None"""
+        length = int(self.headers.get('Content-Length') or 0)
+        chunks = []
+        while length > 0:
+            data = self.rfile.read(min(length, 64 * 1024))
+            if not data:
+                return None
+            length -= len(data)
+            chunks.append(data)
+            if self.state.bandwidth:
+                time.sleep(len(data) / self.state.bandwidth)
+            if self.state.count(len(data)):
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return None
+        return b''.join(chunks)
+
+    def _begin(self):
+        self.state.requests[self.command] += 1
+        return self._path()
+
+    def do_OPTIONS(self):
+        self._begin()
+        dav = '1, 2, sabredav-partialupdate' if self.state.partial else '1, 2'
+        self._reply(200, {'DAV': dav, 'Allow': 'OPTIONS, GET, HEAD, PUT, PATCH, MKCOL, MOVE, DELETE, PROPFIND'})
+
+    def do_PROPFIND(self):
+        path = self._begin()
+        self._read_body()
+        if path not in self.state.directories and path not in self.state.files:
+            return self._reply(404)
+        entries = [f'<d:response><d:href>{quote(path)}/</d:href><d:propstat><d:prop>'
+                   f'<d:resourcetype><d:collection/></d:resourcetype></d:prop>'
+                   f'<d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>']
+        if self.headers.get('Depth') == '1':
+            with self.state.lock:
+                children = [(name, len(content), self.state.modified.get(name, 0))
+                            for name, content in self.state.files.items() if self._parent(name) == path]
+            for name, size, modified in children:
+                entries.append(f'<d:response><d:href>{quote(name)}</d:href><d:propstat><d:prop>'
+                               f'<d:resourcetype/><d:getcontentlength>{size}</d:getcontentlength>'
+                               f'<d:getlastmodified>{formatdate(modified, usegmt=True)}</d:getlastmodified>'
+                               f'</d:prop><d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>')
+        body = ('<?xml version="1.0"?><d:multistatus xmlns:d="DAV:">' + ''.join(entries) + '</d:multistatus>')
+        self._reply(207, {'Content-Type': 'application/xml'}, body.encode('utf-8'))
+
+    def do_GET(self):
+        path = self._begin()
+        content = self.state.files.get(path)
+        if content is None:
+            return self._reply(404)
+        self._reply(200, {'Content-Type': 'application/octet-stream'}, bytes(content))
+
+    def do_MKCOL(self):
+        path = self._begin()
+        with self.state.lock:
+            if path in self.state.directories or path in self.state.files:
+                status = 405
+            elif self._parent(path) not in self.state.directories:
+                status = 409
+            else:
+                self.state.directories.add(path)
+                status = 201
+        self._reply(status)
+
+    def do_HEAD(self):
+        path = self._begin()
+        if path in self.state.files:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(self.state.files[path])))
+            self.end_headers()
+        elif path in self.state.directories:
+            self._reply(200)
+        else:
+            self._reply(404)
+
+    def do_PUT(self):
+        path = self._begin()
+        if self._parent(path) not in self.state.directories:
+            self._read_body()
+            return self._reply(409)
+        body = self._read_body()
+        if body is None:
+            return
+        with self.state.lock:
+            created = path not in self.state.files
+            self.state.files[path] = bytearray(body)
+            self.state.modified[path] = time.time()
+        self._reply(201 if created else 204)
+
+    def do_PATCH(self):
+        path = self._begin()
+        update_range = self.headers.get('X-Update-Range', '')
+        if not self.state.partial:
+            self._read_body()
+            return self._reply(405)
+        body = self._read_body()
+        if body is None:
+            return
+        with self.state.lock:
+            content = self.state.files.get(path)
+            if content is None:
+                return self._reply(404)
+            if update_range == 'append':
+                start = len(content)
+            else:
+                start = int(update_range.split('=', 1)[1].split('-', 1)[0])
+            if start > len(content):
+                return self._reply(416)
+            content[start:start + len(body)] = body
+        self._reply(204)
+
+    def do_MOVE(self):
+        path = self._begin()
+        target = self._path(self.headers.get('Destination'))
+        with self.state.lock:
+            if path not in self.state.files:
+                return self._reply(404)
+            existed = target in self.state.files
+            self.state.files[target] = self.state.files.pop(path)
+            self.state.modified[target] = time.time()
+        self._reply(204 if existed else 201)
+
+    def do_DELETE(self):
+        path = self._begin()
+        with self.state.lock:
+            found = self.state.files.pop(path, None) is not None
+        self._reply(204 if found else 404)
+
+
+def start_dav_server(partial, bandwidth, drop_every):
+    state = DAVState(partial, bandwidth, drop_every)
+    handler = type('Handler', (StubDAVHandler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def run_legacy(base_url, files):
+    """原先的上传方式：逐个文件MKCOL后整体PUT，超时300秒，失败不重试"""
+    session = requests.Session()
+    results = {}
+    for filename, path in files.items():
+        session.request('MKCOL', f'{base_url}/backups/', timeout=30)
+        try:
+            with open(path, 'rb') as f:
+                response = session.put(f'{base_url}/backups/{filename}', data=f, timeout=300)
+            results[filename] = response.status_code in (200, 201, 204)
+        except requests.RequestException:
+            results[filename] = False
+    return results
+
+
+def run_engine(base_url, files, workers, chunk_mb, max_rate):
+    client = WebDAVBackup(base_url, 'user', 'pass', '/backups/', chunk_size=int(chunk_mb * 1024 * 1024),
+                          retries=3, timeout=60, max_rate=max_rate, pool_size=workers)
+
+    @contextmanager
+    def open_file(filename):
+        yield files[filename]
+
+    results = upload_backups(client, list(files), open_file, workers=workers)
+    return {filename: success for filename, (success, _) in results.items()}
+
+
+def verify(state, files, results):
+    """上传成功的文件内容应与本地一致，且不应留下 .part 文件"""
+    mismatched = 0
+    for filename, success in results.items():
+        if not success:
+            continue
+        with open(files[filename], 'rb') as f:
+            expected = hashlib.sha256(f.read()).hexdigest()
+        remote = state.files.get(f'/backups/{filename}')
+        if remote is None or hashlib.sha256(remote).hexdigest() != expected:
+            mismatched += 1
+    leftovers = sum(1 for path in state.files if path.endswith('.part'))
+    return mismatched, leftovers
+
+
+def report(name, elapsed, state, files, results, total_bytes):
+    mismatched, leftovers = verify(state, files, results)
+    succeeded = sum(1 for success in results.values() if success)
+    requests_summary = ', '.join(f'{method} {count}' for method, count in sorted(state.requests.items()))
+    print(f"  {name:<14} 成功 {succeeded}/{len(files)}  用时 {elapsed:6.2f}s  "
+          f"发送 {state.received / 1024 / 1024:6.1f}MB（文件共 {total_bytes / 1024 / 1024:.1f}MB）  "
+          f"断线 {state.drops} 次  内容不一致 {mismatched}  残留 .part {leftovers}")
+    print(f"  {'':<14} 请求: {requests_summary}")
+
+
+def run_scenario(title, files, total_bytes, args, partial, drop_every, max_rate=0, legacy=True):
+    print(title)
+    if legacy:
+        server, state = start_dav_server(partial, args.bandwidth_mb * 1024 * 1024, drop_every)
+        base_url = f'http://127.0.0.1:{server.server_address[1]}'
+        start = time.perf_counter()
+        results = run_legacy(base_url, files)
+        report('原方式', time.perf_counter() - start, state, files, results, total_bytes)
+        server.shutdown()
+
+    server, state = start_dav_server(partial, args.bandwidth_mb * 1024 * 1024, drop_every)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    start = time.perf_counter()
+    results = run_engine(base_url, files, args.workers, args.chunk_mb, max_rate)
+    label = f'限速{max_rate / 1024 / 1024:.0f}MB/s' if max_rate else '分块并发'
+    report(label, time.perf_counter() - start, state, files, results, total_bytes)
+    server.shutdown()
+
+
+def run_nightly_sync(files, args):
+    """
+    每晚同步：远程已有前几天的备份（其中一部分是早期直接上传、没有哈希记录的），本地新增一个备份，
+    对比原先全部重新上传与同步只上传变化部分的流量；再按保留规则清理远程
+    """
+    print('每晚同步：远程已有之前的备份，本地新增一个备份')
+    names = sorted(files)
+    backups = []
+    for i, name in enumerate(names):
+        with open(files[name], 'rb') as f:
+            backups.append({'filename': name, 'size': os.path.getsize(files[name]),
+                            'time': time.time() - (len(names) - i) * 86400,
+                            'sha256': hashlib.sha256(f.read()).hexdigest()})
+
+    @contextmanager
+    def open_file(filename):
+        yield files[filename]
+
+    server, state = start_dav_server(True, args.bandwidth_mb * 1024 * 1024, 0)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    client = WebDAVBackup(base_url, 'user', 'pass', '/backups/', pool_size=args.workers)
+    # 前一半由原方式上传（远程没有哈希记录），其余由同步上传，最新的一个尚未上传
+    run_legacy(base_url, {name: files[name] for name in names[:len(names) // 2]})
+    sync_backups(client, backups[:-1], open_file, workers=args.workers)
+    uploaded_before = state.received
+
+    start = time.perf_counter()
+    summary = sync_backups(client, backups, open_file, workers=args.workers)
+    sync_bytes = state.received - uploaded_before
+    print(f"  同步           用时 {time.perf_counter() - start:6.2f}s  发送 {sync_bytes / 1024 / 1024:6.1f}MB  "
+          f"上传 {summary['uploaded']} 个  跳过 {summary['skipped']} 个")
+    legacy_bytes = sum(backup['size'] for backup in backups)
+    print(f"  原方式         全部重新上传需发送 {legacy_bytes / 1024 / 1024:6.1f}MB")
+
+    summary = sync_backups(client, backups, open_file, workers=args.workers, retention={'last': 2})
+    remaining = sorted(name.rsplit('/', 1)[-1] for name in state.files if name.endswith('.db3'))
+    print(f"  保留最新2个    删除远程 {summary['deleted']} 个，剩余 {remaining}")
+
+    # 本地仍保留全部备份：再次同步不应补传远程已按规则删除的备份
+    summary = sync_backups(client, backups, open_file, workers=args.workers, retention={'last': 2})
+    print(f"  再次同步       上传 {summary['uploaded']} 个  删除远程 {summary['deleted']} 个")
+    assert summary['uploaded'] == 0 and summary['deleted'] == 0, '保留规则删除的备份被重复上传'
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WebDAV上传性能测试')
+    parser.add_argument('--files', type=int, default=6)
+    parser.add_argument('--size-mb', type=float, default=8)
+    parser.add_argument('--bandwidth-mb', type=float, default=4, help='模拟服务每个连接的接收速度（MB/秒）')
+    parser.add_argument('--drop-every-mb', type=float, default=20, help='断线场景中每收到这么多数据断开一次连接（MB）')
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--chunk-mb', type=float, default=2)
+    parser.add_argument('--max-rate-mb', type=float, default=4, help='限速场景的总带宽上限（MB/秒）')
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp(prefix='webdav-bench-')
+    try:
+        files = {}
+        size = int(args.size_mb * 1024 * 1024)
+        for i in range(args.files):
+            filename = f'booknav_2026010100{i:04d}.db3'
+            files[filename] = os.path.join(temp_dir, filename)
+            with open(files[filename], 'wb') as f:
+                f.write(os.urandom(size))
+        total_bytes = size * args.files
+        drop_every = int(args.drop_every_mb * 1024 * 1024)
+        print(f"{args.files} 个文件，每个 {args.size_mb}MB，每个连接 {args.bandwidth_mb}MB/s，"
+              f"{args.workers} 个并发，每块 {args.chunk_mb}MB")
+
+        app = Flask(__name__)
+        with app.app_context():
+            run_scenario('服务器支持部分更新，连接稳定', files, total_bytes, args, partial=True, drop_every=0)
+            run_scenario(f'服务器支持部分更新，每 {args.drop_every_mb}MB 断线一次', files, total_bytes, args,
+                         partial=True, drop_every=drop_every)
+            run_scenario(f'服务器不支持部分更新，每 {args.drop_every_mb}MB 断线一次', files, total_bytes, args,
+                         partial=False, drop_every=drop_every)
+            if args.max_rate_mb:
+                run_scenario('总带宽限速', files, total_bytes, args, partial=True, drop_every=0,
+                             max_rate=int(args.max_rate_mb * 1024 * 1024), legacy=False)
+            run_nightly_sync(files, args)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -28,4 +28,65 @@ class Config:
     
     # CSRF令牌配置
     WTF_CSRF_TIME_LIMIT = 24 * 60 * 60  # CSRF令牌有效期24小时（秒）
-    WTF_CSRF_SSL_STRICT = False  # 不强制要求HTTPS 
\ No newline at end of file
+    WTF_CSRF_SSL_STRICT = False  # 不强制要求HTTPS
+    
+    # 缓存配置：版本号文件所在目录需要被所有gunicorn worker共享
+    CACHE_STATE_DIR = os.environ.get('CACHE_STATE_DIR') or os.path.join(basedir, 'cache')
+    HOMEPAGE_CACHE_TTL = int(os.environ.get('HOMEPAGE_CACHE_TTL') or 300)  # 首页缓存最长有效期（秒），用于刷新按访问量排序的数据
+    HOMEPAGE_CACHE_MAX_USERS = 256  # 最多缓存多少个登录用户的首页数据
+    SUGGEST_INDEX_TTL = int(os.environ.get('SUGGEST_INDEX_TTL') or 600)  # 输入提示索引最长有效期（秒），到期后按最新访问量重建
+    VISIT_FLUSH_INTERVAL = int(os.environ.get('VISIT_FLUSH_INTERVAL') or 5)  # 访问计数批量写入数据库的间隔（秒）
+    HTTP_ETAG_MAX_AGE = int(os.environ.get('HTTP_ETAG_MAX_AGE') or 300)  # 访问量等统计数据最多延迟多久反映到ETag中（秒）
+    HTTP_CACHE_SHARED_MAX_AGE = int(os.environ.get('HTTP_CACHE_SHARED_MAX_AGE') or 30)  # 匿名访问的页面允许Nginx共享缓存的时间（秒），0表示不共享
+    DEADLINK_CONCURRENCY = int(os.environ.get('DEADLINK_CONCURRENCY') or 50)  # 死链检测同时检测的链接数量
+    DEADLINK_PER_HOST = int(os.environ.get('DEADLINK_PER_HOST') or 4)  # 死链检测对同一主机的最大并发请求数
+    DEADLINK_TIMEOUT = int(os.environ.get('DEADLINK_TIMEOUT') or 15)  # 死链检测单个请求的超时时间（秒）
+    DEADLINK_RESULT_BATCH_SIZE = 200  # 死链检测结果每批最多写入的条数
+    DEADLINK_RESULT_BATCH_INTERVAL = 0.5  # 死链检测结果凑批的最长等待时间（秒）
+    DEADLINK_CHECK_TTL_DAYS = int(os.environ.get('DEADLINK_CHECK_TTL_DAYS') or 30)  # 有效链接多少天后重新检测（增量检测）
+    DEADLINK_RETRY_BASE_HOURS = int(os.environ.get('DEADLINK_RETRY_BASE_HOURS') or 1)  # 失败链接首次重试间隔（小时），之后按指数退避
+    DEADLINK_HISTORY_DAYS = int(os.environ.get('DEADLINK_HISTORY_DAYS') or 90)  # 死链检测记录保留天数
+    DEADLINK_SCHEDULE_HOURS = int(os.environ.get('DEADLINK_SCHEDULE_HOURS') or 24)  # 任务进程自动提交增量死链检测的间隔（小时），0表示不自动检测
+    ICON_FETCH_WORKERS = int(os.environ.get('ICON_FETCH_WORKERS') or 8)  # 批量抓取图标的并发线程数
+    ICON_FETCH_RATES = {  # 批量抓取图标时每个上游服务每秒最多请求次数，0表示不限速
+        'xxapi': float(os.environ.get('ICON_FETCH_XXAPI_RATE') or 4),  # 小小API
+        'cccyun': float(os.environ.get('ICON_FETCH_CCCYUN_RATE') or 4),  # cccyun备用图标服务
+        'direct': float(os.environ.get('ICON_FETCH_DIRECT_RATE') or 20)  # 网站自身的 /favicon.ico
+    }
+    ICON_FETCH_TIMEOUT = 5  # 验证图标地址是否可访问的超时时间（秒）
+    ICON_FETCH_BATCH_SIZE = 50  # 图标抓取结果每批最多写入的条数
+    ICON_FETCH_BATCH_INTERVAL = 2  # 图标抓取结果最长多久写入一次（秒）
+    ICON_LOCALIZE = (os.environ.get('ICON_LOCALIZE') or '1') != '0'  # 把图标下载到 static/uploads/icons/，由本站提供而不是让访客请求第三方地址
+    ICON_SIZE = 64  # 本地图标缩放到的最大边长（像素，需要安装Pillow）
+    ICON_MAX_BYTES = 512 * 1024  # 下载图标的最大字节数
+    ICON_LOCALIZE_QUEUE_SECONDS = 60  # 页面中请求到尚未本地化的图标时，每个进程提交图标本地化任务的最短间隔（秒）
+    ICON_BUNDLE_MAX_BYTES = 1024 * 1024  # 首页图标合并样式表的最大字节数，超出部分的图标单独加载
+    ICON_LOCALIZE_SCHEDULE_HOURS = int(os.environ.get('ICON_LOCALIZE_SCHEDULE_HOURS') or 24)  # 任务进程自动提交图标本地化任务的间隔（小时），0表示不自动执行
+    PAGE_META_MAX_BYTES = 512 * 1024  # 解析网站标题和描述时最多读取的网页字节数（通常读到 </head> 即停止）
+    PAGE_META_DEADLINE = 15  # 解析网站标题和描述时读取网页的总时长上限（秒）
+    METADATA_CACHE_TTL_HOURS = int(os.environ.get('METADATA_CACHE_TTL_HOURS') or 24)  # 添加链接时解析到的网站标题、描述的缓存有效期（小时），过期后带条件请求头重新验证
+    METADATA_ICON_TTL_HOURS = int(os.environ.get('METADATA_ICON_TTL_HOURS') or 168)  # 图标API结果按域名缓存的有效期（小时）
+    METADATA_CACHE_MAX_ENTRIES = 5000  # 网站信息缓存最多保存的记录数，超出时删除最久未使用的
+    
+    # 数据库备份配置
+    BACKUP_STEP_PAGES = 1024  # 数据库备份每步复制的页数（默认页大小下约4MB），每步之间释放读锁让写入继续
+    BACKUP_STEP_SLEEP = 0.01  # 数据库备份每步之间的间隔（秒）
+    BACKUP_CHUNK_SIZE = 64 * 1024  # 备份存储的块大小（字节，按数据库页大小对齐），块越小去重越细、文件越多
+    BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP') or 30)  # 定时清理时保留的备份数
+    WEBDAV_CHUNK_SIZE = 8 * 1024 * 1024  # WebDAV分块上传每块的字节数（服务器支持部分更新时），中断后从已上传的块继续
+    WEBDAV_UPLOAD_WORKERS = int(os.environ.get('WEBDAV_UPLOAD_WORKERS') or 3)  # 同时上传的备份文件数
+    WEBDAV_UPLOAD_RETRIES = 3  # WebDAV上传失败后的重试次数
+    WEBDAV_TIMEOUT = 60  # WebDAV请求单次读写的超时时间（秒）
+    WEBDAV_MAX_RATE = int(os.environ.get('WEBDAV_MAX_RATE') or 0)  # WebDAV上传的总带宽上限（字节/秒），0表示不限速
+    WEBDAV_SYNC_SCHEDULE_HOURS = int(os.environ.get('WEBDAV_SYNC_SCHEDULE_HOURS') or 24)  # 开启WebDAV自动备份时，任务进程自动同步备份的间隔（小时），0表示不自动同步
+    WEBDAV_KEEP_LAST = int(os.environ.get('WEBDAV_KEEP_LAST') or 0)  # WebDAV上保留最新的多少个备份
+    WEBDAV_KEEP_DAILY = int(os.environ.get('WEBDAV_KEEP_DAILY') or 0)  # WebDAV上另外保留最近多少天每天最新的一个备份
+    WEBDAV_KEEP_WEEKLY = int(os.environ.get('WEBDAV_KEEP_WEEKLY') or 0)  # WebDAV上另外保留最近多少周每周最新的一个备份
+    WEBDAV_KEEP_MONTHLY = int(os.environ.get('WEBDAV_KEEP_MONTHLY') or 0)  # WebDAV上另外保留最近多少个月每月最新的一个备份（四项都为0时不删除远程备份）
+    
+    # 后台任务配置
+    JOB_WORKER_EMBEDDED = (os.environ.get('JOB_WORKER_EMBEDDED') or '1') != '0'  # 没有独立任务进程时由web进程启动线程执行任务（Docker中由supervisord运行任务进程）
+    JOB_POLL_INTERVAL = 2  # 任务进程检查新任务的间隔（秒）
+    JOB_HEARTBEAT_INTERVAL = 10  # 运行中的任务更新心跳的间隔（秒）
+    JOB_HEARTBEAT_TIMEOUT = int(os.environ.get('JOB_HEARTBEAT_TIMEOUT') or 60)  # 心跳超过这么久未更新的任务视为任务进程已退出（秒）
+    JOB_WAIT_SECONDS = 10  # 提交导入、备份任务后页面最多等待任务完成的时间（秒）
@@ -11,7 +11,7 @@ echo "=== 容器启动 ==="
 # 检查数据库目录
 echo "创建必要目录..."
 mkdir -p /app/app/backups /app/app/static/uploads/avatars /app/app/static/uploads/logos \
-         /app/app/static/uploads/favicons /app/app/static/uploads/backgrounds \
+         /app/app/static/uploads/favicons /app/app/static/uploads/backgrounds /app/app/static/uploads/icons \
          /data/backups /data/uploads/avatars /data/uploads/logos \
          /data/uploads/favicons /data/uploads/backgrounds
 chmod -R 777 /app/app/backups /app/app/static/uploads /data
@@ -125,9 +125,9 @@ fi
 
 # 进行数据库备份（容器启动时）
 if [ -f /data/app.db ] && [ -s /data/app.db ]; then
-    BACKUP_FILE="/app/app/backups/startup_backup_$(date +%Y%m%d%H%M%S).db3"
-    echo "创建启动时数据库备份: $BACKUP_FILE"
-    cp /data/app.db "$BACKUP_FILE" || echo "备份失败，继续启动..."
+    echo "创建启动时数据库备份"
+    # 通过SQLite备份接口复制，包含上次退出时还留在 -wal 文件中的数据
+    (cd /app && flask backup-db --prefix startup_backup) || echo "备份失败，继续启动..."
 fi
 
 echo "=== 启动应用服务 ==="
@@ -0,0 +1,46 @@
+"""添加后台任务表
+
+Revision ID: jobs20261017
+Revises: checkstate20261017
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'jobs20261017'
+down_revision = 'checkstate20261017'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=32), nullable=False),
+        sa.Column('state', sa.String(length=16), nullable=False),
+        sa.Column('params', sa.Text(), nullable=True),
+        sa.Column('checkpoint', sa.Text(), nullable=True),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('processed', sa.Integer(), nullable=False),
+        sa.Column('success', sa.Integer(), nullable=False),
+        sa.Column('failed', sa.Integer(), nullable=False),
+        sa.Column('message', sa.Text(), nullable=True),
+        sa.Column('cancel_requested', sa.Boolean(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('worker', sa.String(length=64), nullable=True),
+        sa.Column('created_by_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by_id'], ['user.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_job_state'), 'job', ['state'], unique=False)
+    op.create_index('ix_job_kind_state', 'job', ['kind', 'state'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_job_kind_state', table_name='job')
+    op.drop_index(op.f('ix_job_state'), table_name='job')
+    op.drop_table('job')
@@ -0,0 +1,40 @@
+"""添加网站信息缓存表
+
+Revision ID: urlmeta20261017
+Revises: jobs20261017
+Create Date: 2026-10-17 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'urlmeta20261017'
+down_revision = 'jobs20261017'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('url_metadata',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=512), nullable=False),
+        sa.Column('kind', sa.String(length=8), nullable=False),
+        sa.Column('domain', sa.String(length=255), nullable=True),
+        sa.Column('title', sa.String(length=256), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('icon_url', sa.String(length=512), nullable=True),
+        sa.Column('charset', sa.String(length=32), nullable=True),
+        sa.Column('etag', sa.String(length=256), nullable=True),
+        sa.Column('last_modified', sa.String(length=64), nullable=True),
+        sa.Column('fetched_at', sa.DateTime(), nullable=False),
+        sa.Column('used_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('key')
+    )
+    op.create_index(op.f('ix_url_metadata_domain'), 'url_metadata', ['domain'], unique=False)
+    op.create_index(op.f('ix_url_metadata_used_at'), 'url_metadata', ['used_at'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_url_metadata_used_at'), table_name='url_metadata')
+    op.drop_index(op.f('ix_url_metadata_domain'), table_name='url_metadata')
+    op.drop_table('url_metadata')
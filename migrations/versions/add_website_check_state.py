@@ -0,0 +1,29 @@
+"""添加链接死链检测计划表
+
+Revision ID: checkstate20261017
+Revises: visitstats20261017
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'checkstate20261017'
+down_revision = 'visitstats20261017'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('website_check_state',
+        sa.Column('website_id', sa.Integer(), nullable=False),
+        sa.Column('failures', sa.Integer(), nullable=False),
+        sa.Column('next_check_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['website_id'], ['website.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('website_id')
+    )
+    op.create_index(op.f('ix_website_check_state_next_check_at'), 'website_check_state', ['next_check_at'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_website_check_state_next_check_at'), table_name='website_check_state')
+    op.drop_table('website_check_state')
@@ -0,0 +1,34 @@
+"""添加链接拼音检索表
+
+Revision ID: pinyin20261017
+Revises: visibility20261017
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'pinyin20261017'
+down_revision = 'visibility20261017'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 拼音数据和全文索引在应用启动时由 app.utils.search.ensure_search_index 补全
+    op.create_table('website_pinyin',
+        sa.Column('website_id', sa.Integer(), nullable=False),
+        sa.Column('title_pinyin', sa.String(length=512), nullable=True),
+        sa.Column('title_initials', sa.String(length=128), nullable=True),
+        sa.Column('description_pinyin', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['website_id'], ['website.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('website_id')
+    )
+    op.create_index(op.f('ix_website_pinyin_title_pinyin'), 'website_pinyin', ['title_pinyin'])
+    op.create_index(op.f('ix_website_pinyin_title_initials'), 'website_pinyin', ['title_initials'])
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS website_pinyin_fts')
+    op.drop_index(op.f('ix_website_pinyin_title_initials'), table_name='website_pinyin')
+    op.drop_index(op.f('ix_website_pinyin_title_pinyin'), table_name='website_pinyin')
+    op.drop_table('website_pinyin')
@@ -0,0 +1,45 @@
+"""添加私有链接可见用户关系表，并从visible_to字段回填数据
+
+Revision ID: visibility20261017
+Revises: webdav20250919
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'visibility20261017'
+down_revision = 'webdav20250919'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('website_visibility',
+        sa.Column('website_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['website_id'], ['website.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('website_id', 'user_id')
+    )
+    op.create_index('ix_website_visibility_user_website', 'website_visibility', ['user_id', 'website_id'])
+
+    # 从逗号分隔的visible_to字段回填授权记录
+    conn = op.get_bind()
+    user_ids = {row[0] for row in conn.execute(sa.text('SELECT id FROM user'))}
+    rows = conn.execute(sa.text("SELECT id, visible_to FROM website WHERE visible_to IS NOT NULL AND visible_to != ''"))
+    grants = []
+    for website_id, visible_to in rows:
+        for value in set(visible_to.split(',')):
+            value = value.strip()
+            if value.isdigit() and int(value) in user_ids:
+                grants.append({'website_id': website_id, 'user_id': int(value)})
+    if grants:
+        conn.execute(
+            sa.text('INSERT INTO website_visibility (website_id, user_id) VALUES (:website_id, :user_id)'),
+            grants
+        )
+
+def downgrade():
+    op.drop_index('ix_website_visibility_user_website', table_name='website_visibility')
+    op.drop_table('website_visibility')
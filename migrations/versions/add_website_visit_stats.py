@@ -0,0 +1,29 @@
+"""添加链接按天访问统计表
+
+Revision ID: visitstats20261017
+Revises: pinyin20261017
+Create Date: 2026-10-17 18:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'visitstats20261017'
+down_revision = 'pinyin20261017'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('website_visit_stats',
+        sa.Column('website_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['website_id'], ['website.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('website_id', 'day')
+    )
+    op.create_index('ix_website_visit_stats_day_website', 'website_visit_stats', ['day', 'website_id', 'count'])
+
+def downgrade():
+    op.drop_index('ix_website_visit_stats_day_website', table_name='website_visit_stats')
+    op.drop_table('website_visit_stats')